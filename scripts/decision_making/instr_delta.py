@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Delta protocol of the instruction buffer on /thesis/instruction_delta.
+Every node keeps its own InstructionStore and publishes only the changes (add, complete, cancel) with a sequence
+number per source. The receivers drop the duplicates and their own messages, and a node that missed some deltas of a
+source, e.g. a late joiner, waits for the next snapshot of the source to catch up.
+The deltas also carry the epoch of the source, i.e. the start time of its process, so a node restarted without its
+journal starts a new epoch with the sequence numbers from 1 instead of being dropped as duplicates.
+The completed ids are kept above a watermark only, since the ids are increasing and the old ones are not seen again.
+A cancelled instruction can be added again, e.g. when TaskAllocator moves it back to a robot, but a completed one not.
+The changes are made under InstructionSync.lock, since the callbacks and the timers of a node run in their own threads.
+"""
+
+import time
+from threading import RLock
+from collections import namedtuple
+
+# The fields of thesis.msg.Instruction used by the planners
+SimInstruction = namedtuple('SimInstruction', ['id', 'r', 'b', 'duration', 'destination', 'prev_id', 'function'])
+
+# The fields of thesis.msg.InstructionDelta
+SimInstructionDelta = namedtuple('SimInstructionDelta', ['source', 'epoch', 'seq', 'op', 'data', 'id'])
+
+ADD = 0
+COMPLETE = 1
+CANCEL = 2
+SNAPSHOT = 3
+
+
+class InstructionSync(object):
+    def __init__(self, instr_store, source, delta_class=SimInstructionDelta, max_done=10000):
+        """
+        :param instr_store: InstructionStore of the node
+        :param source: name of the node, e.g. rospy.get_name()
+        :param delta_class: thesis.msg.InstructionDelta, or SimInstructionDelta without ROS
+        :param max_done: number of the completed ids to keep above the watermark
+        """
+        self.instr_store = instr_store
+        self.source = source
+        self.delta_class = delta_class
+        self.max_done = max_done
+        self.epoch = time.time()  # start of the process, restored by InstructionJournal.recover
+        self.seq = 0  # sequence number of the last published delta
+        self.last_epoch = dict()  # {source: epoch of the last applied delta}
+        self.last_seq = dict()  # {source: sequence number of the last applied delta}
+        self.done_id = set()  # completed ids above done_floor, instruction ids are not reused
+        self.done_floor = -1  # the ids up to the watermark are regarded as completed
+        self.is_synced = dict()  # {source: False if some deltas of the source are missing}
+        self.recorder = None  # InstructionRecorder of the published and applied deltas, see instr_log
+        self.journal = None  # InstructionJournal for the crash recovery, see instr_journal
+        self.lock = RLock()  # for the changes of the store and the sequence numbers, and the journal writes
+
+    def _make_delta(self, op, data=(), id_list=()):
+        if op != SNAPSHOT:
+            self.seq += 1
+            if self.recorder is not None:
+                self.recorder.record(op, data, id_list)
+            if self.journal is not None:
+                self.journal.record(self.source, self.epoch, self.seq, op, data, id_list)
+        return self.delta_class(source=self.source, epoch=self.epoch, seq=self.seq, op=op, data=list(data),
+                                id=list(id_list))
+
+    def is_done(self, instr_id):
+        return instr_id <= self.done_floor or instr_id in self.done_id
+
+    def add_done(self, id_list):
+        """
+        :param id_list: ids of the completed instructions, the oldest ones go under the watermark beyond max_done,
+                        but not over the instructions still in the buffer
+        """
+        self.done_id.update(id_list)
+        if len(self.done_id) > self.max_done:
+            _done_id = sorted(self.done_id)
+            _floor = min([_done_id[len(_done_id) - self.max_done // 2 - 1]] +
+                         [instr_id - 1 for instr_id in self.instr_store.keys()])
+            self.done_floor = max(self.done_floor, _floor)
+            self.done_id = set(instr_id for instr_id in _done_id if instr_id > self.done_floor)
+        return
+
+    def _remove(self, id_list, is_done=True):
+        self.instr_store.remove_array([instr_id for instr_id in id_list if instr_id in self.instr_store])
+        if is_done:
+            self.add_done(id_list)
+        return
+
+    def add(self, instr_list):
+        """
+        :param instr_list: new instructions
+        :return: ADD delta to publish
+        """
+        with self.lock:
+            self.instr_store.add_array(instr_list)
+            return self._make_delta(ADD, data=instr_list)
+
+    def stage(self, instr_list):
+        """
+        Add the instructions to the buffer and the journal now, and publish them later with add_staged, e.g. by
+        CoalescingPublisher. The staged ones still in the buffer go out with the snapshots meanwhile.
+        :param instr_list: new instructions
+        """
+        with self.lock:
+            self.instr_store.add_array(instr_list)
+            if self.journal is not None:
+                self.journal.record(self.source, self.epoch, self.seq, ADD, instr_list)
+        return
+
+    def add_staged(self, id_list):
+        """
+        :param id_list: ids of the staged instructions, the ones not in the buffer anymore are skipped, e.g. expired
+        :return: ADD delta to publish, None if none of them is left
+        """
+        with self.lock:
+            instr_list = [self.instr_store[instr_id] for instr_id in id_list if instr_id in self.instr_store]
+            if len(instr_list) == 0:
+                return None
+            return self._make_delta(ADD, data=instr_list)
+
+    def complete(self, id_list):
+        """
+        :param id_list: ids of the done instructions
+        :return: COMPLETE delta to publish
+        """
+        with self.lock:
+            self._remove(id_list)
+            return self._make_delta(COMPLETE, id_list=id_list)
+
+    def cancel(self, id_list):
+        """
+        :param id_list: ids of the cancelled instructions
+        :return: CANCEL delta to publish
+        """
+        with self.lock:
+            self._remove(id_list, is_done=False)
+            return self._make_delta(CANCEL, id_list=id_list)
+
+    def snapshot(self):
+        """
+        :return: SNAPSHOT delta of the whole buffer to publish periodically
+        """
+        with self.lock:
+            return self._make_delta(SNAPSHOT, data=self.instr_store.values())
+
+    def apply(self, in_delta):
+        """
+        Apply a received delta to the instruction store.
+        :param in_delta: InstructionDelta
+        :return: whether the delta is applied
+        """
+        with self.lock:
+            if in_delta.source == self.source:
+                return False
+
+            _last_epoch = self.last_epoch.get(in_delta.source, in_delta.epoch)
+            if in_delta.epoch < _last_epoch:  # from the source before its restart
+                return False
+            if in_delta.epoch > _last_epoch:  # the source restarted, its sequence numbers start over
+                self.last_seq[in_delta.source] = 0
+            self.last_epoch[in_delta.source] = in_delta.epoch
+            _last_seq = self.last_seq.get(in_delta.source, 0)
+
+            if in_delta.op == SNAPSHOT:
+                if self.is_synced.get(in_delta.source, True) and in_delta.seq <= _last_seq:
+                    return False
+                self.instr_store.set_array([instr for instr in in_delta.data if not self.is_done(instr.id)])
+                self.last_seq[in_delta.source] = max(_last_seq, in_delta.seq)
+                self.is_synced[in_delta.source] = True
+                if self.recorder is not None:
+                    self.recorder.record_delta(in_delta)
+                if self.journal is not None:
+                    self.journal.record_delta(in_delta)
+                return True
+
+            if in_delta.seq <= _last_seq:  # duplicate
+                return False
+            if in_delta.seq > _last_seq + 1:  # missing deltas, catch up with the next snapshot
+                self.is_synced[in_delta.source] = False
+            self.last_seq[in_delta.source] = in_delta.seq
+
+            if in_delta.op == ADD:
+                self.instr_store.add_array([instr for instr in in_delta.data if not self.is_done(instr.id)])
+            elif in_delta.op in (COMPLETE, CANCEL):
+                self._remove(in_delta.id, is_done=in_delta.op == COMPLETE)
+            else:
+                raise ValueError('Invalid instruction delta: {0}'.format(in_delta.op))
+
+            if self.recorder is not None:
+                self.recorder.record_delta(in_delta)
+            if self.journal is not None:
+                self.journal.record_delta(in_delta)
+            return True
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Expiry of the stale instructions. The reward r * b ** t of an instruction done at step t only decays, so once it is
+below epsilon even if the robot did it right now, the instruction is evicted from the buffer instead of being scored
+on every tick. The expiry step of an instruction is pushed to a heap when it is inserted into the InstructionStore
+(InstructionStore.add_hook), so a tick only pops the expired instructions.
+The first stage of a two-stage instruction is kept as long as its second stage is alive.
+"""
+
+import heapq
+import numpy as np
+
+
+class InstructionExpiry(object):
+    def __init__(self, instr_store, epsilon=1e-3, sim_time_step=2.0, keep_list=False):
+        """
+        :param instr_store: InstructionStore to evict from, its add_hook is taken if epsilon > 0
+        :param epsilon: minimum reward worth doing, 0 to keep all the instructions
+        :param sim_time_step: seconds of a step
+        :param keep_list: keep every evicted instruction in expired_list, e.g. for DiscreteEventSim.save_expired
+        """
+        self.instr_store = instr_store
+        self.epsilon = epsilon
+        self.sim_time_step = sim_time_step
+        self._heap = list()  # (expiry step, id), removed lazily
+        self._step = dict()  # {id: expiry step of the latest push}
+        self.expired_num = 0
+        self.expired_list = list() if keep_list else None  # (step, id, r) of the evicted instructions
+
+        if self.epsilon > 0.0:
+            for instr in self.instr_store.itervalues():
+                self.push(instr)
+            self.instr_store.add_hook = self.push
+
+    def get_expiry_step(self, instr):
+        """
+        :return: the step after which r * b ** (step + duration) < epsilon, inf if it never decays
+        """
+        _duration = instr.duration / self.sim_time_step
+        if instr.r <= self.epsilon:
+            return -np.inf
+        if instr.b >= 1.0:
+            return np.inf
+        return np.log(self.epsilon / instr.r) / np.log(instr.b) - _duration
+
+    def push(self, instr):
+        """
+        Track a new or updated instruction of the buffer.
+        :param instr: Instruction
+        """
+        self._set_step(instr.id, self.get_expiry_step(instr))
+        return
+
+    def _set_step(self, instr_id, step):
+        if np.isinf(step) and step > 0:
+            self._step.pop(instr_id, None)  # never expires
+            return
+        self._step[instr_id] = step
+        heapq.heappush(self._heap, (step, instr_id))
+        return
+
+    def _get_alive_step(self, instr_id):
+        # the latest expiry step of the instructions waiting for this one
+        _step = -np.inf
+        for dep_id in self.instr_store.dependent_dict.get(instr_id, ()):
+            _step = max(_step, self.get_expiry_step(self.instr_store[dep_id]), self._get_alive_step(dep_id))
+        return _step
+
+    def expire(self, step):
+        """
+        Evict the instructions that expired by the step.
+        :param step: current step, i.e. the clock / sim_time_step
+        :return: ids of the evicted instructions
+        """
+        expired_id = list()
+        while len(self._heap) > 0 and self._heap[0][0] < step:
+            _step, instr_id = heapq.heappop(self._heap)
+            if self._step.get(instr_id) != _step:
+                continue  # updated, pushed again with another step
+            del self._step[instr_id]
+            if instr_id not in self.instr_store:
+                continue  # done or cancelled
+
+            _alive_step = self._get_alive_step(instr_id)
+            if _alive_step >= step:
+                # the second stage is still worth doing, keep the first one until then
+                self._set_step(instr_id, _alive_step)
+                continue
+
+            _r = self.instr_store.remove(instr_id).r
+            expired_id.append(instr_id)
+            self.expired_num += 1
+            if self.expired_list is not None:
+                self.expired_list.append((step, instr_id, _r))
+
+        return expired_id
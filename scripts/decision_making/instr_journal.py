@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Write-ahead journal of the instruction buffer, so a node restarted after a crash resumes with the instructions it had.
+Every delta published or applied by InstructionSync is appended to <name>.journal and synced to the disk (os.fsync)
+before the delta is published or the node goes on. The writes are made under InstructionSync.lock, since the deltas
+come from the callbacks and the timers in their own threads. Once compact_num deltas are journaled, the buffer is
+written to <name>.snapshot (replaced atomically by a rename) and the journal starts over, so a recovery loads one
+snapshot and replays a short tail.
+The journal and the snapshot carry a generation number, and a journal older than the snapshot, i.e. the node died
+between the rename and the truncation, is skipped.
+The deltas are pickled as they are, so the full Instruction messages come back, and the node resumes with its epoch,
+so the other nodes go on with its sequence numbers.
+"""
+
+import os
+import cPickle as pickle
+
+from decision_making.instr_delta import ADD, COMPLETE, CANCEL, SNAPSHOT
+
+JOURNAL_MAGIC = 'TINSTJN2'
+
+
+class InstructionJournal(object):
+    def __init__(self, journal_dir, instr_sync, compact_num=1000):
+        """
+        :param journal_dir: directory of the journal and the snapshot, created if missing
+        :param instr_sync: InstructionSync of the node, whose source names the files
+        :param compact_num: number of the journaled deltas between two snapshots
+        """
+        if not os.path.exists(journal_dir):
+            os.makedirs(journal_dir)
+        _name = instr_sync.source.strip('/').replace('/', '_')
+        self.journal_file = os.path.join(journal_dir, _name + '.journal')
+        self.snapshot_file = os.path.join(journal_dir, _name + '.snapshot')
+        self.instr_sync = instr_sync
+        self.compact_num = compact_num
+        self.generation = 0
+        self.event_num = 0  # deltas journaled since the last snapshot
+        self._journal = None
+
+    def _load(self, file_name):
+        # pickled objects of the file, until the end or a record cut off by the crash
+        obj_list = list()
+        if not os.path.exists(file_name):
+            return obj_list
+        with open(file_name, 'rb') as f:
+            while True:
+                try:
+                    obj_list.append(pickle.load(f))
+                except (EOFError, pickle.UnpicklingError, ValueError, AttributeError, IndexError):
+                    break
+        return obj_list
+
+    def _apply(self, op, data, id_list):
+        instr_store = self.instr_sync.instr_store
+        if op == ADD:
+            instr_store.add_array([instr for instr in data if not self.instr_sync.is_done(instr.id)])
+        elif op == SNAPSHOT:
+            instr_store.set_array([instr for instr in data if not self.instr_sync.is_done(instr.id)])
+        elif op in (COMPLETE, CANCEL):
+            instr_store.remove_array([instr_id for instr_id in id_list if instr_id in instr_store])
+            if op == COMPLETE:
+                self.instr_sync.add_done(id_list)
+        return
+
+    def recover(self):
+        """
+        Rebuild the buffer, the done ids and the sequence numbers of instr_sync from the snapshot and the journal, then
+        start a new generation and journal the deltas of instr_sync from now on.
+        :return: number of the replayed deltas of the journal
+        """
+        with self.instr_sync.lock:
+            replay_num = 0
+            snapshot = self._load(self.snapshot_file)
+            if len(snapshot) > 0:
+                snapshot = snapshot[0]
+                self.generation = snapshot['generation']
+                self.instr_sync.epoch = snapshot.get('epoch', self.instr_sync.epoch)
+                self.instr_sync.seq = snapshot['seq']
+                self.instr_sync.last_epoch.update(snapshot.get('last_epoch', {}))
+                self.instr_sync.last_seq.update(snapshot['last_seq'])
+                self.instr_sync.done_floor = snapshot.get('done_floor', -1)
+                self.instr_sync.done_id.update(snapshot['done_id'])
+                self.instr_sync.instr_store.set_array(snapshot['instr'])
+
+            journal = self._load(self.journal_file)
+            if len(journal) > 0 and journal[0] == (JOURNAL_MAGIC, self.generation):
+                for source, epoch, seq, op, data, id_list in journal[1:]:
+                    self._apply(op, data, id_list)
+                    if source == self.instr_sync.source:
+                        self.instr_sync.epoch = epoch
+                        self.instr_sync.seq = max(self.instr_sync.seq, seq)
+                    else:
+                        if epoch != self.instr_sync.last_epoch.get(source):
+                            self.instr_sync.last_epoch[source] = epoch
+                            self.instr_sync.last_seq[source] = 0
+                        self.instr_sync.last_seq[source] = max(self.instr_sync.last_seq[source], seq)
+                    replay_num += 1
+
+            self.compact()
+            self.instr_sync.journal = self
+        return replay_num
+
+    def record(self, source, epoch, seq, op, data=(), id_list=()):
+        """
+        Append a delta after it is applied to the buffer, with InstructionSync.lock held.
+        :param source: node of the delta
+        :param epoch: epoch of the source
+        :param seq: sequence number of the delta
+        :param op: ADD, COMPLETE, CANCEL or SNAPSHOT
+        :param data: instructions of ADD and SNAPSHOT
+        :param id_list: ids of COMPLETE and CANCEL
+        """
+        pickle.dump((source, epoch, seq, op, list(data), list(id_list)), self._journal, pickle.HIGHEST_PROTOCOL)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self.event_num += 1
+        if self.event_num >= self.compact_num:
+            self.compact()
+        return
+
+    def record_delta(self, delta):
+        """
+        :param delta: InstructionDelta or SimInstructionDelta
+        """
+        self.record(delta.source, delta.epoch, delta.seq, delta.op, delta.data, delta.id)
+        return
+
+    def compact(self):
+        """
+        Write the buffer to the snapshot and start an empty journal of the next generation, with InstructionSync.lock
+        held.
+        """
+        self.generation += 1
+        snapshot = {'generation': self.generation,
+                    'epoch': self.instr_sync.epoch,
+                    'seq': self.instr_sync.seq,
+                    'last_epoch': dict(self.instr_sync.last_epoch),
+                    'last_seq': dict(self.instr_sync.last_seq),
+                    'done_floor': self.instr_sync.done_floor,
+                    'done_id': sorted(self.instr_sync.done_id),
+                    'instr': self.instr_sync.instr_store.values()}
+
+        _tmp_file = self.snapshot_file + '.tmp'
+        with open(_tmp_file, 'wb') as f:
+            pickle.dump(snapshot, f, pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(_tmp_file, self.snapshot_file)
+
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(self.journal_file, 'wb')
+        pickle.dump((JOURNAL_MAGIC, self.generation), self._journal, pickle.HIGHEST_PROTOCOL)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self.event_num = 0
+        return
+
+    def close(self):
+        with self.instr_sync.lock:
+            self.instr_sync.journal = None
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+        return
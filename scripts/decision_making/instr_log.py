@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Binary log of the instruction stream, every add / complete / cancel / snapshot with its timestamp, so a recorded day
+can be replayed through another planner, in the headless simulation at full speed or on /thesis/instruction_delta
+with scaled time (instruction_replayer.py).
+Only the fields of SimInstruction are kept, i.e. the ones the planners use.
+
+Layout, little-endian:
+    header: 'TINSTLOG', version (uint8)
+    event:  time (float64, seconds after /instr_start_time), op (uint8, see instr_delta), count (uint32), then count records of
+            id (int32), r, b, duration (float64), destination, prev_id, function (int32) for ADD and SNAPSHOT, or
+            id (int32) for COMPLETE and CANCEL
+"""
+
+import time
+import struct
+
+from decision_making.instr_delta import ADD, COMPLETE, CANCEL, SNAPSHOT, SimInstruction
+
+LOG_MAGIC = 'TINSTLOG'
+LOG_VERSION = 1
+_header = struct.Struct('<8sB')
+_event = struct.Struct('<dBI')
+_instr = struct.Struct('<idddiii')
+_id = struct.Struct('<i')
+
+
+class InstructionRecorder(object):
+    def __init__(self, log_file, clock=time.time):
+        """
+        :param log_file: path of the log, overwritten if it exists
+        :param clock: function of the seconds after /instr_start_time, for the events without a stamp
+        """
+        self.clock = clock
+        self.log_file = open(log_file, 'wb')
+        self.log_file.write(_header.pack(LOG_MAGIC, LOG_VERSION))
+        self.event_num = 0
+
+    def record(self, op, data=(), id_list=(), stamp=None):
+        """
+        :param op: ADD, COMPLETE, CANCEL or SNAPSHOT
+        :param data: instructions of ADD and SNAPSHOT
+        :param id_list: ids of COMPLETE and CANCEL
+        :param stamp: seconds after /instr_start_time, e.g. the virtual clock of the simulation, self.clock() if None
+        """
+        if stamp is None:
+            stamp = self.clock()
+
+        if op in (ADD, SNAPSHOT):
+            _buf = [_instr.pack(int(instr.id), float(instr.r), float(instr.b), float(instr.duration),
+                                int(instr.destination), int(instr.prev_id), int(instr.function)) for instr in data]
+        else:
+            _buf = [_id.pack(int(instr_id)) for instr_id in id_list]
+
+        self.log_file.write(_event.pack(stamp, op, len(_buf)) + ''.join(_buf))
+        self.log_file.flush()  # keep the events before a crash
+        self.event_num += 1
+        return
+
+    def record_delta(self, delta, stamp=None):
+        """
+        :param delta: InstructionDelta or SimInstructionDelta
+        """
+        self.record(delta.op, delta.data, delta.id, stamp)
+        return
+
+    def close(self):
+        self.log_file.close()
+        return
+
+
+def load_instr_log(log_file):
+    """
+    :param log_file: path of the log of InstructionRecorder
+    :return: list of (time, op, list of SimInstruction for ADD and SNAPSHOT or list of ids for COMPLETE and CANCEL)
+    """
+    with open(log_file, 'rb') as f:
+        buf = f.read()
+
+    magic, version = _header.unpack_from(buf, 0)
+    if magic != LOG_MAGIC or version != LOG_VERSION:
+        raise ValueError('Invalid instruction log: {0}'.format(log_file))
+
+    event_list = list()
+    offset = _header.size
+    while offset + _event.size <= len(buf):
+        stamp, op, count = _event.unpack_from(buf, offset)
+        offset += _event.size
+
+        _size = _instr.size if op in (ADD, SNAPSHOT) else _id.size
+        if offset + count * _size > len(buf):
+            break  # the last event was cut off
+
+        if op in (ADD, SNAPSHOT):
+            data = [SimInstruction(*_instr.unpack_from(buf, offset + i * _size)) for i in xrange(count)]
+        else:
+            data = [_id.unpack_from(buf, offset + i * _size)[0] for i in xrange(count)]
+        offset += count * _size
+        event_list.append((stamp, op, data))
+
+    return event_list
+
+
+def get_arrival(event_list):
+    """
+    The first appearance of every instruction, by ADD or by a snapshot if the recorder missed the ADD.
+    :param event_list: events of load_instr_log
+    :return: list of (seconds after /instr_start_time, SimInstruction)
+    """
+    arrival_list = list()
+    _seen = set()
+    for stamp, op, data in event_list:
+        if op in (ADD, SNAPSHOT):
+            for instr in data:
+                if instr.id not in _seen:
+                    _seen.add(instr.id)
+                    arrival_list.append((max(stamp, 0.0), instr))
+    return arrival_list
+
+
+def get_done(event_list, sim_time_step=2.0):
+    """
+    Done sequence and accumulated reward of the recorded planner, the reward of an instruction is r * b ** step when
+    it is completed.
+    :return: list of done ids, accumulated reward
+    """
+    instr_dict = dict()
+    done_list = list()
+    accu_r = 0.0
+    for stamp, op, data in event_list:
+        if op in (ADD, SNAPSHOT):
+            instr_dict.update((instr.id, instr) for instr in data)
+        elif op == COMPLETE:
+            for instr_id in data:
+                if instr_id in instr_dict and instr_id not in done_list:
+                    instr = instr_dict[instr_id]
+                    accu_r += instr.r * instr.b ** (stamp / sim_time_step)
+                    done_list.append(instr_id)
+    return done_list, accu_r
+
+
+def diff_done(done_a, done_b):
+    """
+    :return: index of the first difference of the done sequences, None if they are the same
+    """
+    for idx, (id_a, id_b) in enumerate(zip(done_a, done_b)):
+        if id_a != id_b:
+            return idx
+    return None if len(done_a) == len(done_b) else min(len(done_a), len(done_b))
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Publisher of the instruction deltas which coalesces the instructions created within a short window into one ADD
+delta. The new instructions go to the buffer and the journal of InstructionSync at once (InstructionSync.stage), only
+their ADD delta waits. The pending ones are published when the window has passed or max_size of them are waiting, and
+they are held until min_peers subscribers other than the node itself are connected, which is told by the connection
+callback of the publisher instead of a fixed sleep. The held instructions are retried every retry_period with a
+warning, and go out with the snapshots meanwhile.
+The other deltas flush the pending instructions first, so the receivers get the deltas in sequence.
+"""
+
+from threading import Lock
+import rospy
+
+
+class CoalescingPublisher(rospy.SubscribeListener):
+    def __init__(self, topic, instr_sync, window=0.05, max_size=20, min_peers=1, retry_period=1.0, queue_size=10):
+        """
+        :param topic: e.g. '/thesis/instruction_delta'
+        :param instr_sync: InstructionSync of the node
+        :param window: seconds to wait for more instructions after the first pending one
+        :param max_size: number of the pending instructions to flush at once
+        :param min_peers: number of the subscribers to wait for, not counting the node itself
+        :param retry_period: seconds between the flushes of the instructions held for the subscribers
+        """
+        super(CoalescingPublisher, self).__init__()
+        self.instr_sync = instr_sync
+        self.window = window
+        self.max_size = max_size
+        self.min_peers = min_peers
+        self.retry_period = retry_period
+        self._lock = Lock()
+        self._pending = list()  # ids of the staged instructions waiting to be published
+        self._timer = None
+        self.pub = rospy.Publisher(topic, instr_sync.delta_class, subscriber_listener=self, queue_size=queue_size)
+
+    def get_peer_num(self):
+        # the subscription of the node itself, e.g. to apply the deltas of the others, is not a peer
+        _caller_id = rospy.get_caller_id()
+        return len([conn for conn in self.pub.impl.connections if conn.endpoint_id != _caller_id])
+
+    def is_ready(self):
+        return self.get_peer_num() >= self.min_peers
+
+    def peer_subscribe(self, topic_name, topic_publish, peer_publish):
+        # the instructions held for the subscribers
+        self.flush()
+        return
+
+    def _timer_cb(self, event):
+        with self._lock:
+            self._flush()
+            if len(self._pending) > 0:  # held for the subscribers
+                self._timer = rospy.Timer(rospy.Duration(self.retry_period), self._timer_cb, oneshot=True)
+        return
+
+    def _flush(self):
+        # with self._lock
+        if len(self._pending) == 0:
+            return
+        if self.is_ready():
+            _delta = self.instr_sync.add_staged(self._pending)
+            if _delta is not None:
+                self.pub.publish(_delta)
+            self._pending = list()
+        else:
+            rospy.logwarn_throttle(10.0, 'Holding {0} instructions until {1} subscribers of {2} connect'.format(
+                len(self._pending), self.min_peers, self.pub.resolved_name))
+        return
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+        return
+
+    def add(self, instr_list):
+        """
+        :param instr_list: new instructions, added to the buffer of instr_sync right away
+        """
+        with self._lock:
+            self.instr_sync.stage(instr_list)
+            _pending_id = set(self._pending)
+            self._pending.extend(instr.id for instr in instr_list if instr.id not in _pending_id)
+            if len(self._pending) >= self.max_size:
+                self._flush()
+            if len(self._pending) > 0 and (self._timer is None or not self._timer.is_alive()):
+                self._timer = rospy.Timer(rospy.Duration(self.window), self._timer_cb, oneshot=True)
+        return
+
+    def complete(self, id_list):
+        with self._lock:
+            self._flush()
+            self.pub.publish(self.instr_sync.complete(id_list))
+        return
+
+    def cancel(self, id_list):
+        with self._lock:
+            self._flush()
+            self.pub.publish(self.instr_sync.cancel(id_list))
+        return
+
+    def snapshot(self):
+        with self._lock:
+            self._flush()
+            self.pub.publish(self.instr_sync.snapshot())
+        return
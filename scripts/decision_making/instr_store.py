@@ -0,0 +1,367 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Instruction buffer of the planners and InstructionConstructor.
+The numeric fields are stored in arrays (struct of arrays) for the batched reward evaluation, and the buffer keeps
+the destination index, the prev_id dependency index and the ready set up to date on every insert and delete.
+The heaps of the FCFS, PF and SF queries drop the deleted instructions lazily, and are rebuilt once the stale entries
+outnumber the live ones, since most of the planners never query them.
+It also behaves as the former {id: Instruction} dictionary, so the messages can be published as they are.
+"""
+
+import heapq
+import numpy as np
+
+
+class InstructionStore(object):
+    def __init__(self, nodes=(), capacity=16):
+        """
+        :param nodes: nodes of the map graph, the keys of dest_dict
+        :param capacity: initial length of the arrays, doubled when it is full
+        """
+        self.id = np.zeros(capacity, dtype=int)
+        self.r = np.zeros(capacity, dtype=float)
+        self.b = np.zeros(capacity, dtype=float)
+        self.duration = np.zeros(capacity, dtype=float)
+        self.destination = np.zeros(capacity, dtype=int)
+        self.prev_id = np.zeros(capacity, dtype=int)
+        self.is_valid = np.zeros(capacity, dtype=bool)
+        self.is_ready = np.zeros(capacity, dtype=bool)
+
+        self.instr_dict = dict()  # {id: Instruction}
+        self.slot_dict = dict()  # {id: index in the arrays}
+        self.free_slot = range(capacity - 1, -1, -1)
+
+        self.dest_dict = {n: set() for n in nodes}  # {destination: set(id)}
+        self.ready_dest_dict = {n: set() for n in nodes}  # {destination: set(id) whose prev_id is done}
+        self.dependent_dict = dict()  # {prev_id: set(id)}
+        self._id_heap = list()  # for the first come instruction, removed lazily, see _compact
+        self._reward_heap = list()  # (-r, id) for the priority first instruction, removed lazily
+        self._dest_heap = dict()  # {destination: heap of (duration, id)} for the shortest first one, removed lazily
+        self._dest_heap_len = 0  # number of the entries in _dest_heap
+
+        # sum of r of the ready instructions per (destination, b) for the DP planners, a column for each distinct b
+        self.b_values = list()
+        self._b_col = dict()  # {b: column}
+        _node_num = max(nodes) + 1 if len(nodes) > 0 else 0
+        self.ready_sum_r = np.zeros((_node_num, 0), dtype=float)
+        self._ready_count = np.zeros((_node_num, 0), dtype=int)  # the sum is reset to 0.0 when the bucket is empty
+
+        self.add_hook = None  # called with every inserted or updated Instruction, e.g. by InstructionExpiry
+
+    # ----- {id: Instruction} interface -----
+    def __len__(self):
+        return len(self.instr_dict)
+
+    def __contains__(self, instr_id):
+        return instr_id in self.instr_dict
+
+    def __iter__(self):
+        return iter(self.instr_dict)
+
+    def __getitem__(self, instr_id):
+        return self.instr_dict[instr_id]
+
+    def __setitem__(self, instr_id, instr):
+        if instr_id != instr.id:
+            raise ValueError('Instruction id mismatch: {0}, {1}'.format(instr_id, instr.id))
+        self.add(instr)
+
+    def __delitem__(self, instr_id):
+        self.remove(instr_id)
+
+    def __repr__(self):
+        return 'InstructionStore({0})'.format(sorted(self.instr_dict.keys()))
+
+    def get(self, instr_id, default=None):
+        return self.instr_dict.get(instr_id, default)
+
+    def keys(self):
+        return self.instr_dict.keys()
+
+    def values(self):
+        return self.instr_dict.values()
+
+    def items(self):
+        return self.instr_dict.items()
+
+    def iterkeys(self):
+        return self.instr_dict.iterkeys()
+
+    def itervalues(self):
+        return self.instr_dict.itervalues()
+
+    def iteritems(self):
+        return self.instr_dict.iteritems()
+
+    # ----- insert and delete -----
+    def _grow(self):
+        capacity = len(self.id)
+        for key in ['id', 'r', 'b', 'duration', 'destination', 'prev_id', 'is_valid', 'is_ready']:
+            arr = getattr(self, key)
+            setattr(self, key, np.concatenate([arr, np.zeros(capacity, dtype=arr.dtype)]))
+        self.free_slot = range(2 * capacity - 1, capacity - 1, -1) + self.free_slot
+        return
+
+    def _update_bucket(self, slot, sign):
+        _b = self.b[slot]
+        if _b not in self._b_col:
+            self._b_col[_b] = len(self.b_values)
+            self.b_values.append(_b)
+            self.ready_sum_r = np.hstack([self.ready_sum_r, np.zeros((self.ready_sum_r.shape[0], 1))])
+            self._ready_count = np.hstack([self._ready_count, np.zeros((self._ready_count.shape[0], 1), dtype=int)])
+
+        _dest = self.destination[slot]
+        if _dest >= self.ready_sum_r.shape[0]:
+            _pad = _dest + 1 - self.ready_sum_r.shape[0]
+            self.ready_sum_r = np.vstack([self.ready_sum_r, np.zeros((_pad, len(self.b_values)))])
+            self._ready_count = np.vstack([self._ready_count, np.zeros((_pad, len(self.b_values)), dtype=int)])
+
+        _col = self._b_col[_b]
+        self._ready_count[_dest, _col] += sign
+        if self._ready_count[_dest, _col] == 0:
+            self.ready_sum_r[_dest, _col] = 0.0  # no rounding error left in the empty buckets
+        else:
+            self.ready_sum_r[_dest, _col] += sign * self.r[slot]
+        return
+
+    def _set_ready(self, instr_id, is_ready):
+        slot = self.slot_dict[instr_id]
+        if self.is_ready[slot] != is_ready:
+            self._update_bucket(slot, 1 if is_ready else -1)
+        self.is_ready[slot] = is_ready
+        _ready_dest = self.ready_dest_dict.setdefault(self.destination[slot], set())
+        if is_ready:
+            _ready_dest.add(instr_id)
+        else:
+            _ready_dest.discard(instr_id)
+        return
+
+    def add(self, instr):
+        """
+        Insert an instruction, or update it if the id already exists.
+        :param instr: Instruction
+        """
+        _old = self.instr_dict.get(instr.id)
+        if _old is not None:
+            self._unindex(instr.id)  # keep the key in instr_dict for the same iteration order
+        else:
+            heapq.heappush(self._id_heap, instr.id)
+
+        if len(self.free_slot) == 0:
+            self._grow()
+        slot = self.free_slot.pop()
+
+        self.instr_dict[instr.id] = instr
+        self.slot_dict[instr.id] = slot
+        self.id[slot] = instr.id
+        self.r[slot] = instr.r
+        self.b[slot] = instr.b
+        self.duration[slot] = instr.duration
+        self.destination[slot] = instr.destination
+        self.prev_id[slot] = instr.prev_id
+        self.is_valid[slot] = True
+
+        self.dest_dict.setdefault(instr.destination, set()).add(instr.id)
+        # the entries of an unchanged instruction are still valid, e.g. the updates of a snapshot
+        if _old is None or _old.r != instr.r:
+            heapq.heappush(self._reward_heap, (-instr.r, instr.id))
+        if _old is None or _old.destination != instr.destination or _old.duration != instr.duration:
+            heapq.heappush(self._dest_heap.setdefault(instr.destination, list()), (instr.duration, instr.id))
+            self._dest_heap_len += 1
+        if instr.prev_id >= 0:
+            self.dependent_dict.setdefault(instr.prev_id, set()).add(instr.id)
+        self._set_ready(instr.id, instr.prev_id not in self.instr_dict)
+
+        # the instructions waiting for this one are not ready anymore
+        for dep_id in self.dependent_dict.get(instr.id, ()):
+            self._set_ready(dep_id, False)
+
+        self._compact()
+        if self.add_hook is not None:
+            self.add_hook(instr)
+        return
+
+    def add_array(self, in_instructions):
+        """
+        Bulk insert.
+        :param in_instructions: InstructionArray or list of Instruction
+        """
+        for instr in getattr(in_instructions, 'data', in_instructions):
+            self.add(instr)
+        return
+
+    def set_array(self, in_instructions):
+        """
+        Replace the buffer with the instructions, e.g. a snapshot on /thesis/instruction_delta.
+        Only the instructions that are not in in_instructions are deleted, the others are updated.
+        :param in_instructions: InstructionArray or list of Instruction
+        """
+        in_instructions = getattr(in_instructions, 'data', in_instructions)
+        _in_id = set(instr.id for instr in in_instructions)
+        self.remove_array([instr_id for instr_id in self.instr_dict.keys() if instr_id not in _in_id])
+        self.add_array(in_instructions)
+        return
+
+    def remove(self, instr_id):
+        """
+        Delete an instruction, e.g. when it is done, and release the instructions waiting for it.
+        :param instr_id: id of the instruction
+        :return: the deleted Instruction
+        """
+        instr = self._unindex(instr_id)
+        del self.instr_dict[instr_id]
+
+        for dep_id in self.dependent_dict.get(instr_id, ()):
+            self._set_ready(dep_id, True)
+        self._compact()
+        return instr
+
+    def _compact(self):
+        # rebuild the heaps whose stale entries outnumber the live ones, amortized O(1) per insert and delete
+        _max_len = 2 * len(self.instr_dict) + 16
+        if len(self._id_heap) > _max_len:
+            self._id_heap = self.instr_dict.keys()
+            heapq.heapify(self._id_heap)
+        if len(self._reward_heap) > _max_len:
+            self._reward_heap = [(-instr.r, instr.id) for instr in self.instr_dict.itervalues()]
+            heapq.heapify(self._reward_heap)
+        if self._dest_heap_len > _max_len:
+            self._dest_heap = dict()
+            for instr in self.instr_dict.itervalues():
+                self._dest_heap.setdefault(instr.destination, list()).append((instr.duration, instr.id))
+            for _heap in self._dest_heap.itervalues():
+                heapq.heapify(_heap)
+            self._dest_heap_len = len(self.instr_dict)
+        return
+
+    def _unindex(self, instr_id):
+        instr = self.instr_dict[instr_id]
+        slot = self.slot_dict.pop(instr_id)
+        if self.is_ready[slot]:
+            self._update_bucket(slot, -1)
+        self.is_valid[slot] = False
+        self.is_ready[slot] = False
+        self.free_slot.append(slot)
+
+        self.dest_dict[instr.destination].discard(instr_id)
+        self.ready_dest_dict[instr.destination].discard(instr_id)
+        if instr.prev_id >= 0:
+            _dependent = self.dependent_dict[instr.prev_id]
+            _dependent.discard(instr_id)
+            if len(_dependent) == 0:
+                del self.dependent_dict[instr.prev_id]
+        return instr
+
+    def remove_array(self, id_list):
+        """
+        Bulk delete.
+        :param id_list: ids of the instructions
+        :return: list of the deleted Instruction
+        """
+        return [self.remove(instr_id) for instr_id in id_list]
+
+    def clear(self):
+        self.remove_array(self.instr_dict.keys())
+        self._id_heap = list()
+        self._reward_heap = list()
+        self._dest_heap = dict()
+        self._dest_heap_len = 0
+        return
+
+    # ----- queries -----
+    def ready(self, instr_id):
+        """
+        :return: whether the previous instruction of a two-stage instruction is done
+        """
+        return self.is_ready[self.slot_dict[instr_id]]
+
+    def _peek(self, heap, live_id, ready_only):
+        """
+        Drop the stale entries on the top of a heap, and find the smallest live one.
+        The live entries of the instructions not ready are skipped and pushed back if ready_only.
+        :param heap: one of the query heaps
+        :param live_id: function of an entry, the instruction id if the entry is up to date, otherwise None
+        :param ready_only: skip the instructions whose prev_id is not done
+        :return: the entry, None if there is none; number of the dropped entries
+        """
+        entry = None
+        drop_num = 0
+        _skipped = list()
+        while len(heap) > 0:
+            instr_id = live_id(heap[0])
+            if instr_id is None:
+                heapq.heappop(heap)  # done, or updated
+                drop_num += 1
+            elif ready_only and not self.is_ready[self.slot_dict[instr_id]]:
+                _skipped.append(heapq.heappop(heap))
+            else:
+                entry = heap[0]
+                break
+
+        for _entry in _skipped:
+            heapq.heappush(heap, _entry)
+        return entry, drop_num
+
+    def first_id(self, ready_only=False):
+        """
+        :param ready_only: only the instructions whose prev_id is done
+        :return: the smallest id in the buffer, same as min(instr_dict.keys()), None if empty
+        """
+        instr_id, _ = self._peek(self._id_heap, lambda e: e if e in self.instr_dict else None, ready_only)
+        return instr_id
+
+    def max_reward_id(self, ready_only=False):
+        """
+        :param ready_only: only the instructions whose prev_id is done
+        :return: the id with the maximum reward, the smallest id among the ties, None if empty
+        """
+        def live_id(entry):
+            instr = self.instr_dict.get(entry[1])
+            return entry[1] if instr is not None and instr.r == -entry[0] else None
+
+        entry, _ = self._peek(self._reward_heap, live_id, ready_only)
+        return None if entry is None else entry[1]
+
+    def min_time_id(self, shortest_path, cur_node, time_step=1.0, ready_only=False):
+        """
+        The distance term only depends on the destination, so only the shortest instruction of every destination is
+        compared.
+        :param shortest_path: shortest path matrix among nodes, or SparseRouteTable
+        :param cur_node: current node of the robot
+        :param time_step: /thesis/time_step
+        :param ready_only: only the instructions whose prev_id is done
+        :return: the id with the minimum duration + shortest_path[destination, cur_node] * time_step, the smallest id
+                 among the ties, None if empty
+        """
+        min_key = None
+        for dest, _heap in self._dest_heap.iteritems():
+            def live_id(entry):
+                instr = self.instr_dict.get(entry[1])
+                if instr is not None and instr.destination == dest and instr.duration == entry[0]:
+                    return entry[1]
+                return None
+
+            entry, drop_num = self._peek(_heap, live_id, ready_only)
+            self._dest_heap_len -= drop_num
+            if entry is not None:
+                _key = (entry[0] + shortest_path[dest, cur_node] * time_step, entry[1])
+                if min_key is None or _key < min_key:
+                    min_key = _key
+
+        return None if min_key is None else min_key[1]
+
+    def get_ready_buckets(self):
+        """
+        :return: distinct decay factors as np.array, sum of r of the ready instructions per (destination, b),
+                 shape=(nodes, len(b_values))
+        """
+        return np.array(self.b_values, dtype=float), self.ready_sum_r
+
+    def get_arrays(self, id_list):
+        """
+        :param id_list: ids of the instructions
+        :return: destination, reward, decay factor and duration of the instructions in the order of id_list
+        """
+        slot = np.array([self.slot_dict[instr_id] for instr_id in id_list], dtype=int)
+        return self.destination[slot], self.r[slot], self.b[slot], self.duration[slot]
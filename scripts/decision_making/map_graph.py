@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Map graph of the house and the discrete motion model of the robot on it.
+This module does not depend on ROS, so it can be shared by the planners and the headless simulator.
+"""
+
+import os
+import collections
+import networkx as nx
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+config_dir = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'config')) + '/'
+
+
+def create_map_graph(save_npy=False):
+    map_graph = nx.Graph()
+    map_graph.add_node(0, pos=(0, 10))
+    map_graph.add_node(1, pos=(12, 10))
+    map_graph.add_node(2, pos=(12, 8))
+    map_graph.add_node(3, pos=(8, 8))
+    map_graph.add_node(4, pos=(8, 2))
+    map_graph.add_node(5, pos=(0, 2))
+    map_graph.add_node(6, pos=(12, 2))
+    map_graph.add_node(7, pos=(0, 0))
+    map_graph.add_node(8, pos=(8, 0))
+
+    map_graph.add_edge(0, 1, weight=12)
+    map_graph.add_edge(0, 3, weight=9)
+    map_graph.add_edge(1, 2, weight=2)
+    map_graph.add_edge(1, 3, weight=5)
+    map_graph.add_edge(2, 3, weight=4)
+    map_graph.add_edge(3, 4, weight=6)
+    map_graph.add_edge(4, 5, weight=8)
+    map_graph.add_edge(4, 6, weight=4)
+    # map_graph.add_edge(4, 7, weight=8)
+    map_graph.add_edge(4, 8, weight=2)
+    map_graph.add_edge(5, 7, weight=2)
+    # map_graph.add_edge(5, 8, weight=8)
+    map_graph.add_edge(6, 8, weight=4)
+    map_graph.add_edge(7, 8, weight=8)
+
+    if save_npy:
+        # Run Floyd Warshall algorithm for shortest path.
+        short_path = nx.floyd_warshall_numpy(map_graph)
+        np.save(file=config_dir + 'shortest_path.npy', arr=short_path, allow_pickle=True)
+        print '=== shortest path matrix ===\n', short_path
+        adjacency_matrix = nx.convert_matrix.to_numpy_array(map_graph)
+        print '=== adjacency matrix ===\n', adjacency_matrix
+        np.save(file=config_dir + 'adjacency_matrix.npy', arr=adjacency_matrix, allow_pickle=True)
+        next_hop = create_next_hop(map_graph)
+        print '=== next hop matrix ===\n', next_hop
+        np.save(file=config_dir + 'next_hop.npy', arr=next_hop, allow_pickle=True)
+
+        # Draw weighted graph map_graph
+        # pos = nx.get_node_attributes(map_graph, 'pos')
+        # weight_label = nx.get_edge_attributes(map_graph, 'weight')
+        # nx.draw(map_graph, pos, with_labels=True, node_size=300, node_color='orange')
+        # nx.draw_networkx_edge_labels(map_graph, pos, edge_labels=weight_label)
+        # plt.savefig(config_dir + 'weighted_graph.png')
+        # plt.clf()
+
+    return map_graph
+
+
+def create_next_hop(map_graph):
+    """
+    All-pairs next hop table, next_hop[src, dest] is the neighbor of src on the shortest path to dest.
+    The paths are the ones of nx.shortest_path(map_graph, src, dest, weight='weight'), so the ties are broken the
+    same way as the planners did.
+    :param map_graph: map graph, the nodes are 0 ~ n-1
+    :return: next_hop, type=np.array(int), next_hop[n, n] = n
+    """
+    node_num = map_graph.number_of_nodes()
+    next_hop = np.zeros((node_num, node_num), dtype=int)
+    for src in range(node_num):
+        for dest in range(node_num):
+            temp_path = nx.shortest_path(map_graph, src, dest, weight='weight')
+            next_hop[src, dest] = temp_path[1] if len(temp_path) > 1 else src
+    return next_hop
+
+
+class RouteTable(object):
+    """
+    Shortest distance and next hop among the nodes, computed once instead of nx.shortest_path on every planning.
+    """
+
+    def __init__(self, map_graph, shortest_path=None, next_hop=None):
+        """
+        :param map_graph: map graph
+        :param shortest_path: shortest path matrix among nodes, computed if None
+        :param next_hop: next hop table from create_next_hop, computed if None
+        """
+        if shortest_path is None:
+            shortest_path = nx.floyd_warshall_numpy(map_graph)
+        if next_hop is None:
+            next_hop = create_next_hop(map_graph)
+        self.shortest_path = np.asarray(shortest_path)
+        self.next_hop = np.asarray(next_hop, dtype=int)
+
+    @classmethod
+    def load(cls, map_graph):
+        """
+        Load the tables saved by create_map_graph(save_npy=True), or compute them if the saved adjacency matrix is
+        missing or differs from map_graph.
+        :param map_graph: map graph
+        :return: RouteTable
+        """
+        try:
+            adjacency_matrix = np.load(config_dir + 'adjacency_matrix.npy', allow_pickle=True)
+            if np.array_equal(adjacency_matrix, nx.convert_matrix.to_numpy_array(map_graph)):
+                return cls(map_graph, np.load(config_dir + 'shortest_path.npy', allow_pickle=True),
+                           np.load(config_dir + 'next_hop.npy', allow_pickle=True))
+        except IOError:
+            pass
+        return cls(map_graph)
+
+    def next_node(self, src, dest):
+        """
+        :return: the neighbor of src toward dest, src if src == dest, type=int
+        """
+        return int(self.next_hop[src, dest])
+
+    def route(self, src, dest):
+        """
+        :return: nodes on the shortest path from src to dest, same as nx.shortest_path
+        """
+        temp_path = [src]
+        while temp_path[-1] != dest:
+            temp_path.append(self.next_node(temp_path[-1], dest))
+        return temp_path
+
+
+def move_neighbor(adjacency_matrix, in_node, in_neighbor, dest_neighbor_node):
+    """
+    Get the neighbor array after moving one step from in_node toward dest_neighbor_node.
+    in_neighbor[n] > 0 is the number of steps from the robot to the node n.
+    :param adjacency_matrix: weighted adjacency matrix of the map graph
+    :param in_node: the node where the robot starts to move, type=int
+    :param in_neighbor: neighbor array of the robot, type=list
+    :param dest_neighbor_node: int of neighbor node
+    :return: next_neighbor, type=list()
+    """
+    _temp_neighbor = list(in_neighbor)  # copy the list, not changing in_neighbor
+
+    if dest_neighbor_node == in_node:
+        return _temp_neighbor
+
+    _neighbor_nodes = [n for n, step in enumerate(_temp_neighbor) if step > 0]
+    if dest_neighbor_node not in _neighbor_nodes:
+        raise ValueError('Invalid destination for planning: {0}'.format(dest_neighbor_node))
+
+    # update neighbor after moving
+    for n in _neighbor_nodes:
+        if n == dest_neighbor_node:  # moving toward desire neighbor node
+            _temp_neighbor[n] -= 1
+
+            if _temp_neighbor[n] == 0:  # robot reaches the desire neighbor node
+                _temp_neighbor = np.copy(adjacency_matrix[n]).astype(int).tolist()
+                break
+
+            _temp_neighbor[in_node] += 1
+
+        elif n == in_node:  # robot is currently on the edge.
+            continue
+
+        else:
+            _temp_neighbor[n] = 0
+
+    return _temp_neighbor
+
+
+class MotionTable(object):
+    """
+    Precomputed transitions of move_neighbor on the map graph.
+    A state is the robot on a node or k steps along an edge, same as the nodes of create_node_graph, and is
+    identified by (in_node, neighbor array), where in_node is the node the robot starts to move from.
+    The transitions are kept per neighbor slot of the states, i.e. the neighbors of a node or the two ends of an edge,
+    so the table grows with the edges instead of states * nodes, and the distances only for the task nodes.
+    """
+
+    def __init__(self, adjacency, shortest_path):
+        """
+        :param adjacency: weighted adjacency matrix of the map graph, scipy.sparse matrix (get_csr_adjacency) or
+                          np.array, the weights are integer steps
+        :param shortest_path: shortest path matrix among nodes, or SparseRouteTable
+        """
+        self.csr_adjacency = csr_matrix(adjacency, dtype=float)
+        self.csr_adjacency.eliminate_zeros()
+        self.csr_adjacency.sort_indices()
+        self.node_num = self.csr_adjacency.shape[0]
+        _indptr, _indices = self.csr_adjacency.indptr, self.csr_adjacency.indices
+        _weight = np.rint(self.csr_adjacency.data).astype(int)
+        if np.any(_weight != self.csr_adjacency.data) or np.any(_weight < 1):
+            raise ValueError('Invalid map graph: edge weights must be positive integer steps')
+
+        # the node states are 0 ~ n-1, the edge states are (in_node, node ahead, steps from in_node)
+        self.state_dict = dict()  # {(in_node, node ahead, steps from in_node): state} of the edge states
+        self.state_node = range(self.node_num)  # in_node of each state
+        self.is_node = [True] * self.node_num  # whether the robot is on a node
+        self.neighbor_nodes = [_indices[_indptr[n]:_indptr[n + 1]].tolist() for n in range(self.node_num)]
+        _step_list = [_weight[_indptr[n]:_indptr[n + 1]].tolist() for n in range(self.node_num)]
+        _edge_list = [None] * self.node_num  # (in_node, node ahead, steps from in_node, weight) of each state
+
+        # the robot starts on one of the nodes, then explores all the states reachable by moving, in the same order
+        # as a breadth first search on the neighbor arrays
+        _queue = collections.deque(range(self.node_num))
+        while len(_queue) > 0:
+            state = _queue.popleft()
+            if self.is_node[state]:
+                _next_edges = [(state, n, 1, w) for n, w in zip(self.neighbor_nodes[state], _step_list[state])]
+            else:
+                in_node, ahead, k, w = _edge_list[state]
+                _next_edges = [(in_node, ahead, k + 1, w)]
+            for in_node, ahead, k, w in _next_edges:
+                if k < w and (in_node, ahead, k) not in self.state_dict:
+                    _queue.append(self._add_state(in_node, ahead, k))
+                    _edge_list.append((in_node, ahead, k, w))
+                    _step_list.append([k, w - k] if in_node < ahead else [w - k, k])
+        self.state_num = len(self.state_node)
+
+        # next_slot[state, i] is the state after moving one step toward neighbor_nodes[state][i], -1 for no slot.
+        # Moving toward in_node is staying, since the robot cannot turn around on an edge.
+        self.slot_num = max([len(_nodes) for _nodes in self.neighbor_nodes] + [1])
+        self.slot_step = np.zeros((self.state_num, self.slot_num), dtype=int)  # steps to the neighbor of the slot
+        self.next_slot = np.full((self.state_num, self.slot_num), -1, dtype=int)
+        for state in range(self.state_num):
+            _nodes = self.neighbor_nodes[state]
+            self.slot_step[state, :len(_nodes)] = _step_list[state]
+            for i, n in enumerate(_nodes):
+                if n == self.state_node[state]:
+                    self.next_slot[state, i] = state
+                elif _step_list[state][i] == 1:
+                    self.next_slot[state, i] = n  # reaching the node
+                else:
+                    in_node, _, k, _ = _edge_list[state] if not self.is_node[state] else (state, n, 0, 0)
+                    self.next_slot[state, i] = self.state_dict[(in_node, n, k + 1)]
+
+        # dis[state, task_idx[node]] is the shortest distance to the task node through the neighbors of the state, so
+        # shortest_path is accessed as shortest_path[task nodes, node].
+        self.task_nodes = np.array(getattr(shortest_path, 'task_nodes', range(self.node_num)), dtype=int)
+        self.task_idx = np.full(self.node_num, -1, dtype=int)  # column of each task node, -1 for the other nodes
+        self.task_idx[self.task_nodes] = np.arange(len(self.task_nodes))
+        _task_dis = np.asarray(shortest_path[self.task_nodes, :])
+        self.dis = np.full((self.state_num, len(self.task_nodes)), np.inf)
+        for i in range(self.slot_num):
+            _state = np.array([state for state in range(self.state_num) if len(self.neighbor_nodes[state]) > i],
+                              dtype=int)
+            if len(_state) > 0:
+                _nodes = [self.neighbor_nodes[state][i] for state in _state]
+                self.dis[_state] = np.minimum(self.dis[_state],
+                                              _task_dis[:, _nodes].T + self.slot_step[_state, i][:, np.newaxis])
+
+    def _add_state(self, in_node, ahead, k):
+        state = len(self.state_node)
+        self.state_dict[(in_node, ahead, k)] = state
+        self.state_node.append(in_node)
+        self.neighbor_nodes.append(sorted([in_node, ahead]))
+        self.is_node.append(False)
+        return state
+
+    def get_state(self, in_node, neighbor=None):
+        """
+        :param in_node: the node where the robot starts to move
+        :param neighbor: neighbor array of the robot, None if the robot is on in_node
+        :return: state, type=int
+        """
+        if neighbor is None:
+            return in_node  # the node states are added first
+        _nodes = np.flatnonzero(neighbor).tolist()
+        if in_node in _nodes and len(_nodes) == 2:
+            _key = (in_node, _nodes[1] if _nodes[0] == in_node else _nodes[0], int(neighbor[in_node]))
+            if _key in self.state_dict:
+                return self.state_dict[_key]
+        elif _nodes == self.neighbor_nodes[in_node] and \
+                np.array_equal(np.asarray(neighbor)[_nodes], self.slot_step[in_node, :len(_nodes)]):
+            return in_node
+        raise ValueError('Invalid robot state: {0}, {1}'.format(in_node, _nodes))
+
+    def get_neighbor(self, state):
+        """
+        :return: neighbor array of the state, the number of steps to each node, type=list
+        """
+        _neighbor = [0] * self.node_num
+        for n, step in zip(self.neighbor_nodes[state], self.slot_step[state]):
+            _neighbor[n] = int(step)
+        return _neighbor
+
+    def get_next_state(self, state, dest_neighbor_node):
+        """
+        :param state: current state
+        :param dest_neighbor_node: int of neighbor node, or list of them
+        :return: the state after moving one step toward dest_neighbor_node, -1 if invalid
+        """
+        if np.ndim(dest_neighbor_node) > 0:
+            return np.array([self.get_next_state(state, n) for n in dest_neighbor_node], dtype=int)
+        if dest_neighbor_node == self.state_node[state]:
+            return state  # staying
+        try:
+            return int(self.next_slot[state, self.neighbor_nodes[state].index(dest_neighbor_node)])
+        except ValueError:
+            return -1
+
+    def get_dis(self, state, nodes=None):
+        """
+        :param state: state, or array of states
+        :param nodes: task nodes, None for all the nodes, where the others than the task nodes are inf
+        :return: shortest distance from the state to the nodes
+        """
+        if nodes is None:
+            _dis = np.full(np.shape(state) + (self.node_num,), np.inf)
+            _dis[..., self.task_nodes] = self.dis[state]
+            return _dis
+        return self.dis[state, self.task_idx[nodes]]
+
+    def move(self, state, dest_neighbor_node):
+        """
+        Move one step toward dest_neighbor_node.
+        :param state: current state
+        :param dest_neighbor_node: int of neighbor node
+        :return: next state, distance from the next state to all nodes
+        """
+        next_state = self.get_next_state(state, dest_neighbor_node)
+        if next_state < 0:
+            raise ValueError('Invalid destination for planning: {0}'.format(dest_neighbor_node))
+        return next_state, self.get_dis(next_state)
+
+    def next_hop(self, state, dest_node, route_table):
+        """
+        :param state: current state
+        :param dest_node: destination node
+        :param route_table: RouteTable or SparseRouteTable
+        :return: the neighbor node to move toward, the node ahead on an edge since the robot cannot turn around
+        """
+        if not self.is_node[state]:
+            # replanning on an edge, e.g. new instructions arrive, see move_neighbor
+            _in_node = self.state_node[state]
+            return [n for n in self.neighbor_nodes[state] if n != _in_node][0]
+        return route_table.next_node(self.state_node[state], dest_node)
+
+    def get_label(self, state):
+        """
+        :return: name of the state in create_node_graph, e.g. '3' or '23_1'
+        """
+        if self.is_node[state]:
+            return str(self.state_node[state])
+        _nodes_on_edge = self.neighbor_nodes[state]
+        return str(_nodes_on_edge[0]) + str(_nodes_on_edge[1]) + '_' + str(self.slot_step[state, 0])
+
+
+if __name__ == '__main__':
+    # Save shortest_path.npy, adjacency_matrix.npy and next_hop.npy for RouteTable.load
+    create_map_graph(save_npy=True)
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Monte Carlo tree search over the motion states of MotionTable, i.e. the robot on a node or k steps along an edge.
+An action is moving one step toward a neighbor node, or doing a ready instruction on the current node. The leaves are
+evaluated with greedy or random rollouts of the remaining instructions, and the tree is kept between the decisions
+as long as no new instruction arrives.
+"""
+
+import time
+import random
+import numpy as np
+
+from decision_making.task_sequence import get_seq_arrays
+
+# Actions, (MOVE, neighbor node) or (DO, instruction id)
+MOVE = 0
+DO = 1
+
+
+class MCTSNode(object):
+    __slots__ = ['state', 'done', 't', 'reward', 'children', 'untried', 'visit', 'value']
+
+    def __init__(self, state, done, t, reward=0.0):
+        """
+        :param state: motion state, see MotionTable
+        :param done: indices of the instructions done from the root, type=frozenset
+        :param t: step of the node
+        :param reward: reward obtained by the action from the parent
+        """
+        self.state = state
+        self.done = done
+        self.t = t
+        self.reward = reward
+        self.children = dict()  # {action: MCTSNode}
+        self.untried = None  # actions not expanded yet, None before the first visit
+        self.visit = 0
+        self.value = 0.0  # sum of the returns from the parent, including self.reward
+
+
+class MCTSSearch(object):
+    def __init__(self, motion_table, shortest_path, sim_time_step=2.0, time_budget=0.5, rollout='greedy',
+                 exploration=1.0, max_iter=None, seed=None):
+        """
+        :param motion_table: MotionTable of the map graph
+        :param shortest_path: shortest path matrix among nodes, or SparseRouteTable
+        :param sim_time_step: seconds of a step
+        :param time_budget: hard limit of seconds for every decision
+        :param rollout: 'greedy' or 'random'
+        :param exploration: exploration weight of UCT, on the reward normalized by its upper bound
+        :param max_iter: maximum number of iterations for every decision, only the time budget if None
+        :param seed: random seed
+        """
+        if rollout not in ('greedy', 'random'):
+            raise ValueError('Invalid rollout: {0}'.format(rollout))
+
+        self.motion_table = motion_table
+        self.shortest_path = shortest_path
+        self.sim_time_step = sim_time_step
+        self.time_budget = time_budget
+        self.rollout = rollout
+        self.exploration = exploration
+        self.max_iter = max_iter
+        self.random = random.Random(seed)
+
+        self.root = None
+        self.iter_num = 0  # iterations of the last decision
+        self.is_reused = False  # whether the last decision started from the previous tree
+
+        # arrays of the instructions in the tree, indexed as the done sets of MCTSNode
+        self.id_list = list()
+        self.id_idx = dict()  # {id: index}
+        self.dest = self.r = self.b = self.duration = None
+        self.prev_idx = None  # index of the previous instruction, the last index (never remains) if there is none
+        self.dest_dis = None  # dest_dis[node] is the distance from the node to the destinations
+        self.scale = 1.0
+
+    def _set_instr(self, instr_dict):
+        self.id_list, self.dest, self.r, self.b, self.duration = get_seq_arrays(instr_dict, self.sim_time_step)
+        self.id_idx = {instr_id: idx for idx, instr_id in enumerate(self.id_list)}
+        _num = len(self.id_list)
+        self.prev_idx = np.array([self.id_idx.get(instr_dict[instr_id].prev_id, _num) for instr_id in self.id_list],
+                                 dtype=int)
+        self.dest_dis = np.asarray(self.shortest_path[:, self.dest])
+        return
+
+    def _get_remain(self, done):
+        """
+        :return: whether each instruction remains, with an extra False for prev_idx of the ones without prev_id
+        """
+        remain = np.ones(len(self.id_list) + 1, dtype=bool)
+        remain[-1] = False
+        remain[list(done)] = False
+        return remain
+
+    def _get_dis(self, state):
+        """
+        :return: distance from the motion state to the destinations
+        """
+        if self.motion_table.is_node[state]:
+            return self.dest_dis[self.motion_table.state_node[state]]
+        return self.motion_table.get_dis(state, self.dest)
+
+    def _find_root(self, state, done, max_depth=4):
+        """
+        :return: the node of the previous tree at the motion state with the same done set, None if not found
+        """
+        _queue = [(self.root, 0)]
+        while len(_queue) > 0:
+            node, depth = _queue.pop(0)
+            if node.state == state and node.done == done:
+                return node
+            if depth < max_depth:
+                _queue.extend((child, depth + 1) for child in node.children.itervalues())
+        return None
+
+    def _shift_t(self, node, dt):
+        _stack = [node]
+        while len(_stack) > 0:
+            _node = _stack.pop()
+            _node.t += dt
+            _stack.extend(_node.children.itervalues())
+        return
+
+    def _get_move_nodes(self, state):
+        """
+        :return: the neighbor nodes to move toward, without in_node on an edge since the robot cannot turn around and
+                 moving toward in_node is staying, see MotionTable
+        """
+        if self.motion_table.is_node[state]:
+            return self.motion_table.neighbor_nodes[state]
+        _in_node = self.motion_table.state_node[state]
+        return [n for n in self.motion_table.neighbor_nodes[state] if n != _in_node]
+
+    def _get_actions(self, node):
+        """
+        :return: moves toward the neighbor nodes, then the ready instructions on the current node to be popped first
+        """
+        actions = [(MOVE, n) for n in self._get_move_nodes(node.state)]
+        self.random.shuffle(actions)
+
+        if self.motion_table.is_node[node.state]:
+            remain = self._get_remain(node.done)
+            _cur_node = self.motion_table.state_node[node.state]
+            _do_idx = np.flatnonzero(remain[:-1] & ~remain[self.prev_idx] & (self.dest == _cur_node))
+            # the instruction with the maximum reward is expanded first
+            _do_idx = sorted(_do_idx, key=lambda i: self.r[i] * self.b[i] ** (node.t + self.duration[i]))
+            actions.extend((DO, int(i)) for i in _do_idx)
+        return actions
+
+    def _get_child(self, node, action):
+        if action[0] == MOVE:
+            return MCTSNode(self.motion_table.get_next_state(node.state, action[1]), node.done, node.t + 1)
+
+        idx = action[1]
+        _t = node.t + self.duration[idx]
+        return MCTSNode(node.state, node.done | frozenset([idx]), _t, self.r[idx] * self.b[idx] ** _t)
+
+    def _select(self, node):
+        _log_visit = np.log(node.visit)
+        best_child, best_uct = None, -np.inf
+        for child in node.children.itervalues():
+            uct = child.value / child.visit / self.scale + self.exploration * np.sqrt(_log_visit / child.visit)
+            if uct > best_uct:
+                best_child, best_uct = child, uct
+        return best_child
+
+    def _rollout(self, node):
+        """
+        Do the remaining instructions one by one with the rollout policy.
+        :return: accumulated reward of the remaining instructions
+        """
+        remain = self._get_remain(node.done)
+        dis = self._get_dis(node.state)
+        path_len = node.t
+        value = 0.0
+
+        for _ in xrange(len(self.id_list) - len(node.done)):
+            ready = remain[:-1] & ~remain[self.prev_idx]
+            temp_t = path_len + dis + self.duration
+            if self.rollout == 'greedy':
+                idx = int(np.argmax(np.where(ready, self.r * self.b ** temp_t, -1.0)))
+            else:
+                idx = self.random.choice(np.flatnonzero(ready))
+            value += self.r[idx] * self.b[idx] ** temp_t[idx]
+            path_len = temp_t[idx]
+            dis = self.dest_dis[self.dest[idx]]
+            remain[idx] = False
+
+        return value
+
+    def _iterate(self):
+        # selection, the root is always expanded
+        path = [self.root]
+        node = self.root
+        while node.untried is not None and len(node.untried) == 0 and len(node.children) > 0:
+            node = self._select(node)
+            path.append(node)
+
+        # expansion
+        if node.untried is None:
+            node.untried = self._get_actions(node) if len(node.done) < len(self.id_list) else list()
+        if len(node.untried) > 0:
+            action = node.untried.pop()
+            child = self._get_child(node, action)
+            node.children[action] = child
+            path.append(child)
+            node = child
+
+        # simulation and backpropagation
+        _return = self._rollout(node)
+        for node in reversed(path):
+            _return += node.reward
+            node.visit += 1
+            node.value += _return
+        return
+
+    def search(self, instr_dict, state, t):
+        """
+        :param instr_dict: InstructionStore or {id: Instruction}
+        :param state: current motion state
+        :param t: current step, i.e. the clock / sim_time_step
+        :return: action with the most visits, (MOVE, next node) or (DO, instruction id), None if no instructions
+        """
+        s_time = time.time()
+        if len(instr_dict) == 0:
+            self.root = None
+            return None
+
+        # keep the tree if the instructions are the remaining ones of the tree
+        self.is_reused = False
+        if self.root is not None and all(instr_id in self.id_idx for instr_id in instr_dict.iterkeys()):
+            _done = frozenset(idx for instr_id, idx in self.id_idx.iteritems() if instr_id not in instr_dict)
+            _root = self._find_root(state, _done)
+            if _root is not None:
+                self._shift_t(_root, t - _root.t)
+                _root.reward = 0.0
+                self.root = _root
+                self.is_reused = True
+
+        if not self.is_reused:
+            self._set_instr(instr_dict)
+            self.root = MCTSNode(state, frozenset(), t)
+
+        # upper bound of the accumulated reward, all the remaining instructions done right now
+        remain = self._get_remain(self.root.done)[:-1]
+        self.scale = max(float(np.sum(self.r[remain] * self.b[remain] ** t)), 1e-12)
+
+        self.iter_num = 0
+        while time.time() - s_time < self.time_budget:
+            if self.max_iter is not None and self.iter_num >= self.max_iter:
+                break
+            self._iterate()
+            self.iter_num += 1
+
+        if len(self.root.children) == 0:
+            # no time to expand, toward the first instruction of the greedy rollout
+            return self._get_greedy_action()
+
+        action = max(self.root.children.iteritems(), key=lambda item: item[1].visit)[0]
+        if action[0] == DO:
+            return DO, self.id_list[action[1]]
+        return action
+
+    def _get_greedy_action(self):
+        remain = self._get_remain(self.root.done)
+        ready = remain[:-1] & ~remain[self.prev_idx]
+        temp_t = self.root.t + self._get_dis(self.root.state) + self.duration
+        idx = int(np.argmax(np.where(ready, self.r * self.b ** temp_t, -1.0)))
+
+        _dest = self.dest[idx]
+        if self.motion_table.is_node[self.root.state] and self.motion_table.state_node[self.root.state] == _dest:
+            return DO, self.id_list[idx]
+
+        _neighbor = dict(zip(self.motion_table.neighbor_nodes[self.root.state],
+                             self.motion_table.slot_step[self.root.state]))  # {neighbor node: steps}
+        return MOVE, min(self._get_move_nodes(self.root.state),
+                         key=lambda n: _neighbor[n] + self.shortest_path[_dest, n])
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Task allocation of the instruction buffer across several robots on the same map graph.
+The instructions are auctioned one by one: every robot bids the reward r * b ** t the instruction would get at the end
+of its current sequence, per step the robot spends on it (moving and doing), and the highest bid wins, i.e. a
+sequential single-item auction on the decaying reward.
+The allocation is done again when new instructions arrive or a robot finishes one, and the instruction each robot is
+working on stays with it, so the robots do not chase the same tasks.
+A prev_id chain, e.g. a two-stage instruction, goes to one robot, since the InstructionStore of another robot would not
+have the previous instruction and would treat the next one as ready.
+"""
+
+import os
+import heapq
+import itertools
+import numpy as np
+import pandas as pd
+
+from decision_making.map_graph import create_map_graph, MotionTable
+from decision_making.sparse_graph import get_csr_adjacency, load_route_table
+from decision_making.task_sequence import get_seq_arrays
+from decision_making.instr_store import InstructionStore
+
+
+class FleetAllocator(object):
+    def __init__(self, motion_table, shortest_path, sim_time_step=2.0):
+        """
+        :param motion_table: MotionTable of the map graph
+        :param shortest_path: shortest path matrix among nodes, or SparseRouteTable
+        :param sim_time_step: seconds of a step
+        """
+        self.motion_table = motion_table
+        self.shortest_path = shortest_path
+        self.sim_time_step = sim_time_step
+
+    def get_state_dis(self, state, dest):
+        """
+        :return: distance from the motion state to the destinations
+        """
+        if self.motion_table.is_node[state]:
+            return np.asarray(self.shortest_path[dest, self.motion_table.state_node[state]], dtype=float)
+        return self.motion_table.get_dis(state, dest)
+
+    def allocate(self, instr_dict, robot_dict, commit_dict=None, hold_dict=None):
+        """
+        :param instr_dict: InstructionStore or {id: Instruction}, the instructions to allocate
+        :param robot_dict: {robot name: (motion state, step when the robot is free)}
+        :param commit_dict: {robot name: id of the instruction the robot is heading to}, kept with the robot
+        :param hold_dict: {id: robot name} of the instructions out of instr_dict held by a robot, e.g. being done, whose
+                          next instructions stay with the robot
+        :return: {robot name: sequence of instruction ids}
+        """
+        robot_names = sorted(robot_dict.keys())
+        seq_dict = {name: list() for name in robot_names}
+        if len(instr_dict) == 0 or len(robot_names) == 0:
+            return seq_dict
+
+        id_list, dest, r, b, duration = get_seq_arrays(instr_dict, self.sim_time_step)
+        _id_idx = {instr_id: idx for idx, instr_id in enumerate(id_list)}
+        _num = len(id_list)
+        # index of the previous instruction, the last index (done at -inf) if it is not in the buffer
+        prev_idx = np.array([_id_idx.get(instr_dict[instr_id].prev_id, _num) for instr_id in id_list], dtype=int)
+        done_t = np.full(_num + 1, np.inf)  # step when each instruction is done, inf if not allocated yet
+        done_t[-1] = -np.inf
+        dest_dis = np.asarray(self.shortest_path[:, dest])  # dest_dis[node] is the distance to the destinations
+
+        # the robot of the previous instruction of each instruction, -1 for any robot
+        _robot_idx = {name: robot_idx for robot_idx, name in enumerate(robot_names)}
+        owner = np.full(_num, -1, dtype=int)
+        if hold_dict is not None:
+            for idx, instr_id in enumerate(id_list):
+                owner[idx] = _robot_idx.get(hold_dict.get(instr_dict[instr_id].prev_id), -1)
+
+        # the end of the sequence of every robot
+        end_t = np.array([robot_dict[name][1] for name in robot_names], dtype=float)
+        end_dis = np.array([self.get_state_dis(robot_dict[name][0], dest) for name in robot_names])
+
+        def _assign(robot_idx, idx, temp_t):
+            seq_dict[robot_names[robot_idx]].append(id_list[idx])
+            done_t[idx] = temp_t
+            end_t[robot_idx] = temp_t
+            end_dis[robot_idx] = dest_dis[dest[idx]]
+            owner[prev_idx == idx] = robot_idx  # the next instructions of the chain
+            return
+
+        if commit_dict is not None:
+            for robot_idx, name in enumerate(robot_names):
+                idx = _id_idx.get(commit_dict.get(name))
+                if idx is not None and np.isinf(done_t[idx]) and done_t[prev_idx[idx]] < np.inf and \
+                        owner[idx] in (-1, robot_idx):
+                    _assign(robot_idx, idx, max(end_t[robot_idx] + end_dis[robot_idx, idx],
+                                                done_t[prev_idx[idx]]) + duration[idx])
+
+        for _ in xrange(int(np.sum(np.isinf(done_t[:-1])))):
+            # the instructions whose previous instruction is allocated
+            is_open = np.isinf(done_t[:-1]) & (done_t[prev_idx] < np.inf)
+            # done step of every instruction at the end of every robot, shape=(robots, instructions)
+            temp_t = np.maximum(end_t[:, np.newaxis] + end_dis, done_t[prev_idx][np.newaxis, :]) + duration
+            # reward per step of the robot, the far instructions with slightly higher rewards are left to the others
+            bid = r * b ** temp_t / np.maximum(temp_t - end_t[:, np.newaxis], 1.0)
+            bid = np.where(is_open[np.newaxis, :], bid, -1.0)
+            _bound = np.flatnonzero(owner >= 0)  # only the robot of the chain bids
+            _bound_bid = bid[owner[_bound], _bound]
+            bid[:, _bound] = -1.0
+            bid[owner[_bound], _bound] = _bound_bid
+            robot_idx, idx = np.unravel_index(int(np.argmax(bid)), bid.shape)
+            _assign(robot_idx, idx, temp_t[robot_idx, idx])
+
+        return seq_dict
+
+
+class MultiRobotSim(object):
+    def __init__(self, robot_num=2, map_graph=None, start_nodes=None, sim_time_step=2.0):
+        """
+        Headless simulation of the fleet, every robot moves with the same motion model as move_adjacency_node.
+        :param robot_num: number of robots, named robot_1 ~ robot_<robot_num> as their namespaces
+        :param map_graph: map graph, create_map_graph() if None
+        :param start_nodes: initial node of each robot, all at charge (2) if None
+        :param sim_time_step: seconds of a motion step
+        """
+        self.map_graph = create_map_graph() if map_graph is None else map_graph
+        self.csr_adjacency = get_csr_adjacency(self.map_graph)
+        self.route_table = load_route_table(self.map_graph)
+        self.shortest_path = self.route_table.shortest_path
+        self.motion_table = MotionTable(self.csr_adjacency, self.shortest_path)
+        self.sim_time_step = sim_time_step
+        self.allocator = FleetAllocator(self.motion_table, self.shortest_path, sim_time_step)
+
+        if start_nodes is None:
+            start_nodes = [2] * robot_num
+        self.robot_names = ['robot_' + str(i + 1) for i in range(robot_num)]
+        self.robot_state = {name: self.motion_table.get_state(n) for name, n in zip(self.robot_names, start_nodes)}
+        self.robot_seq = {name: list() for name in self.robot_names}
+        self.robot_doing = dict()  # {robot name: (instruction id, done time in seconds)}
+
+        self.instr_dict = InstructionStore(self.map_graph.nodes)
+        self.arrival_queue = list()  # heap of (time, counter, instr)
+        self._arrival_counter = itertools.count()
+        self.clock = 0.0
+
+        # for experiment evaluations
+        self.accu_r = 0.0
+        self.done_list = list()  # (done step, instruction id, robot name, reward)
+        self.alloc_num = 0
+
+    def add_instr(self, instr, arrival_time=1.0):
+        heapq.heappush(self.arrival_queue, (arrival_time, next(self._arrival_counter), instr))
+        return
+
+    def allocate(self):
+        _doing_id = set(instr_id for instr_id, _ in self.robot_doing.itervalues())
+        _instr_dict = {k: v for k, v in self.instr_dict.iteritems() if k not in _doing_id}
+
+        robot_dict = dict()
+        for name in self.robot_names:
+            _free_time = self.robot_doing[name][1] if name in self.robot_doing else self.clock
+            robot_dict[name] = (self.robot_state[name], max(_free_time, self.clock) / self.sim_time_step)
+        commit_dict = {name: seq[0] for name, seq in self.robot_seq.iteritems() if len(seq) > 0}
+
+        hold_dict = {instr_id: name for name, (instr_id, _) in self.robot_doing.iteritems()}
+
+        self.robot_seq = self.allocator.allocate(_instr_dict, robot_dict, commit_dict, hold_dict)
+        self.alloc_num += 1
+        return
+
+    def next_hop(self, state, dest_node):
+        return self.motion_table.next_hop(state, dest_node, self.route_table)
+
+    def step(self):
+        """
+        One tick of all the robots.
+        :return: whether the allocation has to be updated
+        """
+        is_changed = False
+
+        # the instructions done in this tick
+        for name, (instr_id, done_time) in self.robot_doing.items():
+            if done_time <= self.clock:
+                instr = self.instr_dict[instr_id]
+                _temp_step = done_time / self.sim_time_step
+                _reward = instr.r * (instr.b ** _temp_step)
+                self.accu_r += _reward
+                self.done_list.append((_temp_step, instr_id, name, _reward))
+                del self.instr_dict[instr_id]
+                del self.robot_doing[name]
+                is_changed = True
+
+        for name in self.robot_names:
+            if name in self.robot_doing or len(self.robot_seq[name]) == 0:
+                continue
+
+            instr_id = self.robot_seq[name][0]
+            _state = self.robot_state[name]
+            _dest = self.instr_dict[instr_id].destination
+            if self.motion_table.is_node[_state] and self.motion_table.state_node[_state] == _dest:
+                # wait on the node if the previous instruction is not done yet
+                if self.instr_dict.ready(instr_id):
+                    self.robot_seq[name].pop(0)
+                    _done_time = self.clock + self.instr_dict[instr_id].duration
+                    self.robot_doing[name] = (instr_id, max(_done_time, self.clock + self.sim_time_step))
+            else:
+                self.robot_state[name] = self.motion_table.move(_state, self.next_hop(_state, _dest))[0]
+
+        self.clock += self.sim_time_step
+        return is_changed
+
+    def run(self, max_step=1000000):
+        """
+        Run until all the instructions are done.
+        :return: accumulated reward of the fleet
+        """
+        if len(self.arrival_queue) > 0:
+            self.clock = max(self.clock, self.arrival_queue[0][0])
+
+        for _ in xrange(max_step):
+            is_changed = False
+            while len(self.arrival_queue) > 0 and self.arrival_queue[0][0] <= self.clock:
+                self.instr_dict.add(heapq.heappop(self.arrival_queue)[2])
+                is_changed = True
+            if is_changed:
+                self.allocate()
+
+            if len(self.instr_dict) == 0 and len(self.arrival_queue) == 0:
+                break
+
+            if self.step():
+                self.allocate()
+
+        return self.accu_r
+
+    def save_result(self, out_dir, base_name=None):
+        """
+        Save the accumulated reward and the done instructions with the robot that did each of them.
+        """
+        if base_name is None:
+            base_name = 'task_allocator_' + str(len(self.robot_names))
+        if not os.path.exists(out_dir):
+            os.makedirs(out_dir)
+
+        _done_list = sorted(self.done_list)
+        output_df = pd.DataFrame({'time': [0.0] + [d[0] for d in _done_list],
+                                  'reward': np.cumsum([0.0] + [d[3] for d in _done_list])})
+        output_df.to_csv(os.path.join(out_dir, base_name + '_reward.csv'), index=False, columns=['time', 'reward'])
+
+        output_df = pd.DataFrame({'done': [d[1] for d in _done_list], 'robot': [d[2] for d in _done_list]})
+        output_df.to_csv(os.path.join(out_dir, base_name + '_done.csv'), index=False, columns=['done', 'robot'])
+        return
+
+
+def run_fleet_scenario(instr_list, robot_num=2, out_dir=None, start_nodes=None):
+    """
+    Simulate a static instruction list with a fleet.
+    :param instr_list: list of instructions, all of them arrive at the beginning
+    :param robot_num: number of robots
+    :param out_dir: save the results if given
+    :param start_nodes: initial node of each robot
+    :return: MultiRobotSim after running
+    """
+    sim = MultiRobotSim(robot_num, start_nodes=start_nodes)
+    for instr in instr_list:
+        sim.add_instr(instr)
+    sim.run()
+
+    if out_dir is not None:
+        sim.save_result(out_dir)
+    return sim
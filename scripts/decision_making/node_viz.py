@@ -11,7 +11,10 @@ import rospkg
 import rospy
 
 from std_msgs.msg import String
-from thesis.msg import InstructionArray
+from thesis.msg import InstructionDelta
+from decision_making.map_graph import create_map_graph
+from decision_making.instr_store import InstructionStore
+from decision_making.instr_delta import InstructionSync
 
 from cv_bridge import CvBridge
 from sensor_msgs.msg import Image
@@ -55,6 +58,14 @@ def get_graph_config(in_node_graph):
     return c_map, size_list, pos_node_graph, node_label
 
 
+def instr_cb(in_delta, in_instr_sync):
+    """
+    Keep the instruction buffer up to date with /thesis/instruction_delta.
+    """
+    in_instr_sync.apply(in_delta)
+    return
+
+
 def robot_node_cb(data, args):
     global robot_pre_node
 
@@ -63,17 +74,12 @@ def robot_node_cb(data, args):
         exit(1)
 
     (in_node_graph, gtype, save, in_mem_instr) = args
-    try:
-        instr_list = rospy.wait_for_message('/thesis/instruction_buffer', InstructionArray, timeout=1)
-        in_mem_instr = instr_list
 
-    except rospy.ROSException:
-        instr_list = in_mem_instr
-
-    if len(instr_list.data) > 0:
+    if len(in_mem_instr) > 0:
         instr_node_set = set()
-        for instr in instr_list.data:
-            instr_node_set.add(str(instr.destination))
+        for dest, id_set in in_mem_instr.dest_dict.iteritems():
+            if len(id_set) > 0:
+                instr_node_set.add(str(dest))
 
     else:
         instr_node_set = None
@@ -160,53 +166,6 @@ def render_node(r_node, i_node_set, in_node_graph, gtype='node', save=False):
     return
 
 
-def create_map_graph(save_npy=False):
-    map_graph = nx.Graph()
-    map_graph.add_node(0, pos=(0, 10))
-    map_graph.add_node(1, pos=(12, 10))
-    map_graph.add_node(2, pos=(12, 8))
-    map_graph.add_node(3, pos=(8, 8))
-    map_graph.add_node(4, pos=(8, 2))
-    map_graph.add_node(5, pos=(0, 2))
-    map_graph.add_node(6, pos=(12, 2))
-    map_graph.add_node(7, pos=(0, 0))
-    map_graph.add_node(8, pos=(8, 0))
-
-    map_graph.add_edge(0, 1, weight=12)
-    map_graph.add_edge(0, 3, weight=9)
-    map_graph.add_edge(1, 2, weight=2)
-    map_graph.add_edge(1, 3, weight=5)
-    map_graph.add_edge(2, 3, weight=4)
-    map_graph.add_edge(3, 4, weight=6)
-    map_graph.add_edge(4, 5, weight=8)
-    map_graph.add_edge(4, 6, weight=4)
-    # map_graph.add_edge(4, 7, weight=8)
-    map_graph.add_edge(4, 8, weight=2)
-    map_graph.add_edge(5, 7, weight=2)
-    # map_graph.add_edge(5, 8, weight=8)
-    map_graph.add_edge(6, 8, weight=4)
-    map_graph.add_edge(7, 8, weight=8)
-
-    if save_npy:
-        # Run Floyd Warshall algorithm for shortest path.
-        short_path = nx.floyd_warshall_numpy(map_graph)
-        np.save(file=config_dir + 'shortest_path.npy', arr=short_path, allow_pickle=True)
-        print '=== shortest path matrix ===\n', short_path
-        adjacency_matrix = nx.convert_matrix.to_numpy_array(map_graph)
-        print '=== adjacency matrix ===\n', adjacency_matrix
-        np.save(file=config_dir + 'adjacency_matrix.npy', arr=adjacency_matrix, allow_pickle=True)
-
-        # Draw weighted graph map_graph
-        # pos = nx.get_node_attributes(map_graph, 'pos')
-        # weight_label = nx.get_edge_attributes(map_graph, 'weight')
-        # nx.draw(map_graph, pos, with_labels=True, node_size=300, node_color='orange')
-        # nx.draw_networkx_edge_labels(map_graph, pos, edge_labels=weight_label)
-        # plt.savefig(config_dir + 'weighted_graph.png')
-        # plt.clf()
-
-    return map_graph
-
-
 def create_node_graph():
 
     map_graph = create_map_graph()
@@ -254,9 +213,16 @@ if __name__ == '__main__':
     # plt.get_current_fig_manager().window.wm_geometry("+600+400")
 
     cur_node_graph = create_node_graph()
-    mem_instr = InstructionArray()
+    mem_instr = InstructionStore(create_map_graph().nodes)
     rospy.init_node('node_viz', anonymous=True, log_level=rospy.INFO)
 
+    instr_sync = InstructionSync(mem_instr, rospy.get_name(), InstructionDelta)
+    rospy.Subscriber(name='/thesis/instruction_delta',
+                     data_class=InstructionDelta,
+                     callback=instr_cb,
+                     callback_args=instr_sync,
+                     queue_size=10)
+
     rospy.Subscriber(name='/thesis/robot_node',
                      data_class=String,
                      callback=robot_node_cb,
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Per-decision timing of plan_task: the wall time, the number of instructions considered and the number of candidate
+evaluations, e.g. candidate steps of the value iteration or nodes of the branch and bound.
+The wall times go into a histogram with log-spaced bins, so p50/p95/p99 are available at any time in O(bins).
+Only the latest decisions are kept for save_csv, the histogram and the sums cover all of them.
+"""
+
+from collections import deque
+import numpy as np
+import pandas as pd
+
+
+class DecisionStats(object):
+    def __init__(self, min_time=1e-6, max_time=100.0, bins_per_decade=20, max_record=100000):
+        """
+        :param min_time: upper edge of the first bin in seconds, the faster decisions are counted in it
+        :param max_time: lower edge of the last bin in seconds, the slower decisions are counted in it
+        :param bins_per_decade: resolution of the histogram, the relative error of the percentiles is
+                                10 ** (1 / bins_per_decade) - 1, i.e. 12% for 20 bins
+        :param max_record: number of the latest decisions kept for save_csv, all of them if None
+        """
+        _decade = np.log10(max_time) - np.log10(min_time)
+        self.edges = np.logspace(np.log10(min_time), np.log10(max_time), int(round(_decade * bins_per_decade)) + 1)
+        self.hist = np.zeros(len(self.edges) + 1, dtype=int)  # hist[i] counts edges[i - 1] <= time < edges[i]
+
+        self.count = 0
+        self.sum_time = 0.0
+        self.max_time = 0.0
+        self.sum_instr = 0
+        self.sum_eval = 0
+        self.record_list = deque(maxlen=max_record)  # (step, seconds, instructions, evaluations) of each decision
+
+    def record(self, plan_time, instr_num=0, eval_num=0, step=None):
+        """
+        :param plan_time: wall time of the decision in seconds
+        :param instr_num: number of the instructions considered
+        :param eval_num: number of the candidate evaluations
+        :param step: step of the decision, e.g. the clock / sim_time_step
+        """
+        self.hist[np.searchsorted(self.edges, plan_time, side='right')] += 1
+        self.count += 1
+        self.sum_time += plan_time
+        self.max_time = max(self.max_time, plan_time)
+        self.sum_instr += instr_num
+        self.sum_eval += eval_num
+        self.record_list.append((step, plan_time, instr_num, eval_num))
+        return
+
+    def percentile(self, q):
+        """
+        :param q: percentile in [0, 100]
+        :return: upper edge of the bin of the percentile in seconds, not more than the maximum, 0.0 if empty
+        """
+        if self.count == 0:
+            return 0.0
+        idx = int(np.searchsorted(np.cumsum(self.hist), q / 100.0 * self.count, side='left'))
+        if idx >= len(self.edges):
+            return self.max_time
+        return min(self.edges[idx], self.max_time)
+
+    def summary(self):
+        """
+        :return: {'count', 'mean', 'p50', 'p95', 'p99', 'max' (seconds), 'instr_mean', 'eval_mean'}
+        """
+        _count = max(self.count, 1)
+        return {'count': self.count,
+                'mean': self.sum_time / _count,
+                'p50': self.percentile(50),
+                'p95': self.percentile(95),
+                'p99': self.percentile(99),
+                'max': self.max_time,
+                'instr_mean': float(self.sum_instr) / _count,
+                'eval_mean': float(self.sum_eval) / _count}
+
+    def save_csv(self, csv_file, hist_file=None):
+        """
+        :param csv_file: the kept decisions, columns time, plan_time, instr_num, eval_num
+        :param hist_file: the histogram, columns lower, upper, count, only the non-empty bins
+        """
+        output_df = pd.DataFrame(list(self.record_list), columns=['time', 'plan_time', 'instr_num', 'eval_num'])
+        output_df.to_csv(csv_file, index=False)
+
+        if hist_file is not None:
+            _lower = np.concatenate([[0.0], self.edges])
+            _upper = np.concatenate([self.edges, [np.inf]])
+            _mask = self.hist > 0
+            output_df = pd.DataFrame({'lower': _lower[_mask], 'upper': _upper[_mask], 'count': self.hist[_mask]})
+            output_df.to_csv(hist_file, index=False, columns=['lower', 'upper', 'count'])
+        return
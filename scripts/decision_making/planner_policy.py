@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Decisions of the planners without ROS, shared by the task_motion_planner_*_sim nodes and the SimPlanner of
+sim_engine, so the simulator runs the same policies as the robot.
+The rule-based ones only choose among the ready instructions, i.e. the second stage of a two-stage instruction waits
+for its first stage.
+"""
+
+import operator
+import numpy as np
+from decision_making.value_iter import get_bucket_reward
+from decision_making.task_sequence import get_rule_seq
+
+
+def select_fcfs(instr_dict):
+    """
+    :param instr_dict: InstructionStore
+    :return: id of the first come instruction, None if empty
+    """
+    return instr_dict.first_id(ready_only=True)
+
+
+def select_pf(instr_dict):
+    """
+    :param instr_dict: InstructionStore
+    :return: id of the instruction with the maximum reward, None if empty
+    """
+    return instr_dict.max_reward_id(ready_only=True)
+
+
+def select_sf(instr_dict, shortest_path, cur_node, time_step=1.0):
+    """
+    :param instr_dict: InstructionStore
+    :param shortest_path: shortest path matrix among nodes, or SparseRouteTable
+    :param cur_node: current node of the robot
+    :param time_step: /thesis/time_step
+    :return: id of the instruction with the shortest time to do (move + duration), None if empty
+    """
+    return instr_dict.min_time_id(shortest_path, cur_node, time_step, ready_only=True)
+
+
+def select_rand(instr_dict, rng, last_id=-1):
+    """
+    Keep the instruction chosen last time until it is done, otherwise pick another one at random.
+    :param instr_dict: InstructionStore
+    :param rng: random or random.Random
+    :param last_id: id chosen last time, -1 for none
+    :return: id of the instruction
+    """
+    if last_id in instr_dict and instr_dict.ready(last_id):
+        return last_id
+    return rng.choice([k for k in instr_dict.keys() if instr_dict.ready(k)])
+
+
+def select_pick(target_id, instr_dest_dict, cur_node):
+    """
+    Pick of the rule-based planners: only the chosen instruction, if the robot is on its destination.
+    :param target_id: id of the chosen instruction
+    :param instr_dest_dict: {destination: set(id)}
+    :param cur_node: current node of the robot
+    :return: list of the ids to do
+    """
+    if target_id in instr_dest_dict[cur_node]:
+        return [target_id]
+    return []
+
+
+def value_iter_step(instr_dict, motion_table, cur_state, power_table):
+    """
+    Value iteration of the DP planners. Stay if any ready instruction is on the current node, otherwise move toward the
+    neighbor whose step has the maximum accumulated reward of the ready instructions.
+    :param instr_dict: InstructionStore
+    :param motion_table: MotionTable
+    :param cur_state: current state of the robot
+    :param power_table: PowerTable
+    :return: next node, number of the candidate evaluations
+    """
+    cur_node = motion_table.state_node[cur_state]
+    if len(instr_dict.ready_dest_dict[cur_node]) > 0:
+        return cur_node, 1
+
+    neighbor_node = motion_table.neighbor_nodes[cur_state]
+    if not motion_table.is_node[cur_state]:
+        # replanning on an edge, the robot cannot turn around, see move_neighbor
+        neighbor_node = [n for n in neighbor_node if n != cur_node]
+    # assuming moving toward each neighbor, distance from the candidate steps to all nodes.
+    cand_dis = motion_table.get_dis(motion_table.get_next_state(cur_state, neighbor_node))
+
+    b_values, sum_r = instr_dict.get_ready_buckets()
+    cand_reward = get_bucket_reward(cand_dis, b_values, sum_r, power_table)
+
+    # Pick the node with maximum accumulated reward
+    return neighbor_node[int(np.argmax(cand_reward))], len(neighbor_node) * len(b_values)
+
+
+def value_iter_pick(instr_dict, cur_node):
+    """
+    Pick of the DP planners: all the ready instructions on the current node, the maximum reward first.
+    :param instr_dict: InstructionStore
+    :param cur_node: current node of the robot
+    :return: list of the ids to do
+    """
+    # Create reward_dict = {'id (int)': 'reward (float)'}
+    reward_dict = dict()
+    for idx in instr_dict.ready_dest_dict[cur_node]:  # two-stage instructions are excluded
+        reward_dict[idx] = instr_dict[idx].r
+
+    return [r[0] for r in sorted(reward_dict.items(), key=operator.itemgetter(1), reverse=True)]
+
+
+def get_ls_start_seq(last_seq, instr_dict, shortest_path, cur_node, rule='sf', time_step=1.0):
+    """
+    Starting order of the local search: the last sequence, then the new instructions in the order of the rule.
+    :param last_seq: sequence of the last decision
+    :param instr_dict: InstructionStore or {id: Instruction}
+    :param shortest_path: shortest path matrix among nodes, or SparseRouteTable
+    :param cur_node: current node of the robot
+    :param rule: 'fcfs', 'pf' or 'sf', see get_rule_seq
+    :param time_step: /thesis/time_step
+    :return: list of ids
+    """
+    _seq = [instr_id for instr_id in last_seq if instr_id in instr_dict]
+    _in_seq = set(_seq)
+    _new_dict = {k: v for k, v in instr_dict.iteritems() if k not in _in_seq}
+    _last_node = instr_dict[_seq[-1]].destination if len(_seq) > 0 else cur_node
+    return _seq + get_rule_seq(_new_dict, shortest_path, _last_node, rule, time_step)
@@ -0,0 +1,599 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Headless discrete-event simulation for the task_motion_planner_*_sim planners.
+The robot moves with the same motion model as move_adjacency_node, but the world is advanced on a virtual clock
+instead of rospy.Rate and rospy.sleep, so a scenario finishes in milliseconds.
+"""
+
+import os
+import time
+import heapq
+import random
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from decision_making.map_graph import create_map_graph, MotionTable
+from decision_making.sparse_graph import get_csr_adjacency, load_route_table
+from decision_making.task_sequence import get_subset_dp_seq, get_bnb_seq, IncrementalSeq, local_search_seq
+from decision_making.value_iter import PowerTable
+from decision_making.planner_policy import select_fcfs, select_pf, select_sf, select_rand, select_pick, \
+    value_iter_step, value_iter_pick, get_ls_start_seq
+from decision_making.instr_store import InstructionStore
+from decision_making.mcts import MCTSSearch, DO
+from decision_making.plan_stats import DecisionStats
+from decision_making.instr_delta import ADD, COMPLETE, SimInstruction
+from decision_making.instr_expiry import InstructionExpiry
+
+
+# Scenario modeling, same as InstructionConstructor
+task_loc = [0, 1, 2, 5, 6, 7]
+task_duration = range(1, 10)  # 1~9
+gamma_dict = {1: 1, 2: 2, 3: 3, 4: 5, 5: 8}  # {task_priority: gamma}
+b_dict = {1: 0.9, 2: 0.92, 3: 0.94, 4: 0.96, 5: 0.98}  # {task_priority: beta}
+test_instr = [(2, 3, 2), (2, 5, 15), (0, 1, 1), (1, 1, 3), (0, 2, 10),
+              (6, 3, 3), (5, 1, 10), (6, 4, 6), (7, 2, 2), (6, 5, 15)]  # (dest, priority, duration)
+
+
+def create_instr(instr_id, r, b, duration, destination, prev_id=-1, function=0):
+    return SimInstruction(id=instr_id, r=r, b=b, duration=duration, destination=destination,
+                          prev_id=prev_id, function=function)
+
+
+def generate_scenario(max_num=10, seed=1111, is_random=True):
+    """
+    Generate the instructions of InstructionConstructor.test_scenario.
+    :param max_num: number of instructions
+    :param seed: random seed
+    :param is_random: False for the fixed test instructions
+    :return: list of SimInstruction
+    """
+    if is_random:
+        random.seed(int(seed))
+        des_ls = [random.choice(task_loc) for _ in range(max_num)]  # destination
+        priority_list = [random.choice(sorted(gamma_dict.keys())) for _ in range(max_num)]  # reward list
+        d_list = [random.choice(task_duration) for _ in range(max_num)]  # duration list
+
+    else:
+        des_ls = [instr[0] for instr in test_instr]
+        priority_list = [instr[1] for instr in test_instr]
+        d_list = [instr[2] for instr in test_instr]
+        max_num = len(des_ls)
+
+    return [create_instr(i, gamma_dict[priority_list[i]], b_dict[priority_list[i]], d_list[i], des_ls[i])
+            for i in range(max_num)]
+
+
+def load_scenario(csv_file):
+    """
+    Load the instructions saved by InstructionConstructor.save_instr.
+    :param csv_file: path to instr.csv
+    :return: list of SimInstruction
+    """
+    in_df = pd.read_csv(csv_file)
+    return [create_instr(int(row['id']), float(row['gamma']), float(row['beta']), int(row['duration']),
+                         int(row['destination'])) for _, row in in_df.iterrows()]
+
+
+def save_instr(instr_list, csv_file):
+    output_df = pd.DataFrame({'id': [instr.id for instr in instr_list],
+                              'destination': [instr.destination for instr in instr_list],
+                              'gamma': [instr.r for instr in instr_list],
+                              'beta': [instr.b for instr in instr_list],
+                              'duration': [instr.duration for instr in instr_list]})
+    output_df.to_csv(csv_file, index=False, columns=['id', 'destination', 'gamma', 'beta', 'duration'])
+    return
+
+
+class SimPlanner(object):
+    """
+    Task planning of a *_sim planner without ROS.
+    plan_task updates sim.next_node, pick_instr returns the instruction ids to do at sim.cur_node.
+    eval_num is the number of the candidate evaluations of the last plan_task, one selection for the rule-based ones.
+    """
+    base_name = None
+
+    def __init__(self):
+        self.sim = None
+        self.eval_num = 1
+
+    def bind(self, sim):
+        self.sim = sim
+        return
+
+    def next_hop(self, dest_node):
+        # next neighbor node for motion planner
+        return self.sim.motion_table.next_hop(self.sim.cur_state, dest_node, self.sim.route_table)
+
+    def plan_task(self):
+        raise NotImplementedError
+
+    def pick_instr(self):
+        raise NotImplementedError
+
+    def done_instr(self, instr):
+        return
+
+
+class SimFCFS(SimPlanner):
+    base_name = 'task_motion_planner_fcfs_sim'
+
+    def plan_task(self):
+        if len(self.sim.instr_dict) > 0:
+            dest_node = self.sim.instr_dict[select_fcfs(self.sim.instr_dict)].destination
+            self.sim.next_node = self.next_hop(dest_node)
+        return
+
+    def pick_instr(self):
+        return select_pick(select_fcfs(self.sim.instr_dict), self.sim.instr_dest_dict, self.sim.cur_node)
+
+
+class SimPF(SimPlanner):
+    base_name = 'task_motion_planner_pf_sim'
+
+    def __init__(self):
+        SimPlanner.__init__(self)
+        self.property_key = -1
+
+    def select_instr(self):
+        return select_pf(self.sim.instr_dict)
+
+    def plan_task(self):
+        if len(self.sim.instr_dict) > 0:
+            self.property_key = self.select_instr()
+            self.sim.next_node = self.next_hop(self.sim.instr_dict[self.property_key].destination)
+        return
+
+    def pick_instr(self):
+        return select_pick(self.property_key, self.sim.instr_dest_dict, self.sim.cur_node)
+
+    def done_instr(self, instr):
+        self.property_key = -1
+        return
+
+
+class SimSF(SimPF):
+    base_name = 'task_motion_planner_sf_sim'
+
+    def select_instr(self):
+        return select_sf(self.sim.instr_dict, self.sim.shortest_path, self.sim.cur_node, self.sim.time_step)
+
+
+class SimRand(SimPF):
+    base_name = 'task_motion_planner_rand_sim'
+
+    def __init__(self, seed=None):
+        SimPF.__init__(self)
+        self.rng = random.Random(seed)
+
+    def select_instr(self):
+        return select_rand(self.sim.instr_dict, self.rng, self.property_key)
+
+
+class SimDP(SimPlanner):
+    base_name = 'task_motion_planner_dp_sim'
+
+    def __init__(self):
+        SimPlanner.__init__(self)
+        self.power_table = PowerTable()  # b ** d of the candidate steps
+
+    def plan_task(self):
+        if len(self.sim.instr_dict) > 0:
+            self.sim.next_node, self.eval_num = value_iter_step(self.sim.instr_dict, self.sim.motion_table,
+                                                                self.sim.cur_state, self.power_table)
+        return
+
+    def pick_instr(self):
+        return value_iter_pick(self.sim.instr_dict, self.sim.cur_node)
+
+
+class SimOpt(SimPlanner):
+    base_name = 'task_motion_planner_opt_sim'
+
+    def __init__(self):
+        SimPlanner.__init__(self)
+        self.opt_seq = list()
+        self.opt_time_list = [0.0]
+        self.opt_reward_list = [0.0]
+
+    def get_opt_seq(self):
+        _stats = dict()
+        opt_seq = get_subset_dp_seq(self.sim.instr_dict, self.sim.shortest_path, self.sim.cur_node,
+                                    self.sim.sim_time_step, _stats)[0]
+        self.eval_num = _stats.get('eval_num', 0)
+        return opt_seq
+
+    def plan_task(self):
+        self.eval_num = 1
+        self.opt_seq = [instr_id for instr_id in self.opt_seq if instr_id in self.sim.instr_dict]  # expired
+        if len(self.opt_seq) > 0:
+            self.sim.next_node = self.next_hop(self.sim.instr_dict[self.opt_seq[0]].destination)
+
+        elif len(self.sim.instr_dict) > 0:
+            self.opt_seq = self.get_opt_seq()
+
+            # store theoretical optimal rewards
+            _temp_len = 0.0
+            _temp_reward = 0.0
+            _temp_node = self.sim.cur_node
+            for instr_id in self.opt_seq:
+                instr = self.sim.instr_dict[instr_id]
+                _temp_len += self.sim.shortest_path[instr.destination, _temp_node] + \
+                    (instr.duration / self.sim.sim_time_step)
+                _temp_reward += instr.r * (instr.b ** _temp_len)
+                _temp_node = instr.destination
+                self.opt_time_list.append(_temp_len)
+                self.opt_reward_list.append(_temp_reward)
+        return
+
+    def pick_instr(self):
+        if len(self.opt_seq) > 0 and self.opt_seq[0] in self.sim.instr_dest_dict[self.sim.cur_node]:
+            return [self.opt_seq[0]]
+        return []
+
+    def done_instr(self, instr):
+        self.opt_seq.pop(0)
+        return
+
+
+class SimBnB(SimPlanner):
+    base_name = 'task_motion_planner_bnb_sim'
+
+    def __init__(self, time_budget=0.5):
+        SimPlanner.__init__(self)
+        self.time_budget = time_budget
+        self.seq = list()
+        self.gap = 0.0
+
+    def plan_task(self):
+        if len(self.sim.instr_dict) > 0:
+            _stats = dict()
+            self.seq, _, self.gap = get_bnb_seq(self.sim.instr_dict, self.sim.shortest_path, self.sim.cur_node,
+                                                self.sim.sim_time_step, time_budget=self.time_budget, stats=_stats)
+            self.eval_num = _stats['eval_num']
+            self.sim.next_node = self.next_hop(self.sim.instr_dict[self.seq[0]].destination)
+        return
+
+    def pick_instr(self):
+        # the leading instructions of the sequence on the current node
+        _cur_dest = self.sim.instr_dest_dict[self.sim.cur_node]
+        for idx, instr_id in enumerate(self.seq):
+            if instr_id not in _cur_dest:
+                return self.seq[:idx]
+        return list(self.seq)
+
+
+class SimIncr(SimBnB):
+    base_name = 'task_motion_planner_incr_sim'
+
+    def __init__(self, gap_threshold=0.1, time_budget=0.5):
+        SimBnB.__init__(self, time_budget)
+        self.gap_threshold = gap_threshold
+        self.incr_seq = None
+
+    def bind(self, sim):
+        SimBnB.bind(self, sim)
+        self.incr_seq = IncrementalSeq(sim.shortest_path, sim.sim_time_step, self.gap_threshold, self.time_budget)
+        return
+
+    def plan_task(self):
+        if len(self.sim.instr_dict) > 0:
+            self.seq = self.incr_seq.update(self.sim.instr_dict, self.sim.cur_node)
+            self.gap = self.incr_seq.gap
+            self.eval_num = self.incr_seq.eval_num
+            self.sim.next_node = self.next_hop(self.sim.instr_dict[self.seq[0]].destination)
+        return
+
+
+class SimLS(SimBnB):
+    base_name = 'task_motion_planner_ls_sim'
+
+    def __init__(self, rule='sf', time_budget=0.5):
+        SimBnB.__init__(self, time_budget)
+        self.rule = rule
+
+    def plan_task(self):
+        if len(self.sim.instr_dict) > 0:
+            # start from the last sequence, the new instructions are appended in the order of the rule
+            _seq = get_ls_start_seq(self.seq, self.sim.instr_dict, self.sim.shortest_path, self.sim.cur_node,
+                                    self.rule, self.sim.time_step)
+
+            _stats = dict()
+            self.seq = local_search_seq(_seq, self.sim.instr_dict, self.sim.shortest_path, self.sim.cur_node,
+                                        self.sim.sim_time_step, self.time_budget, stats=_stats)[0]
+            self.eval_num = _stats['eval_num']
+            self.sim.next_node = self.next_hop(self.sim.instr_dict[self.seq[0]].destination)
+        return
+
+
+class SimMCTS(SimPlanner):
+    base_name = 'task_motion_planner_mcts_sim'
+
+    def __init__(self, time_budget=0.5, rollout='greedy', seed=None):
+        SimPlanner.__init__(self)
+        self.time_budget = time_budget
+        self.rollout = rollout
+        self.seed = seed
+        self.search = None
+        self.action = None
+        self.plan_key = None  # (state, clock, instructions) of the last decision
+
+    def bind(self, sim):
+        SimPlanner.bind(self, sim)
+        self.search = MCTSSearch(sim.motion_table, sim.shortest_path, sim.sim_time_step, self.time_budget,
+                                 self.rollout, seed=self.seed)
+        return
+
+    def plan_task(self):
+        if len(self.sim.instr_dict) > 0:
+            _plan_key = (self.sim.cur_state, self.sim.clock, frozenset(self.sim.instr_dict.iterkeys()))
+            self.eval_num = 0
+            if _plan_key != self.plan_key:
+                self.action = self.search.search(self.sim.instr_dict, self.sim.cur_state,
+                                                 self.sim.clock / self.sim.sim_time_step)
+                self.plan_key = _plan_key
+                self.eval_num = self.search.iter_num
+            self.sim.next_node = self.sim.cur_node if self.action[0] == DO else self.action[1]
+        return
+
+    def pick_instr(self):
+        # the robot just reaches the node, decide whether to do an instruction here
+        self.sim.plan_task()
+        if self.action[0] == DO:
+            return [self.action[1]]
+        return list()
+
+
+sim_planners = {'fcfs': SimFCFS, 'pf': SimPF, 'sf': SimSF, 'rand': SimRand, 'dp': SimDP, 'opt': SimOpt,
+                'bnb': SimBnB, 'incr': SimIncr, 'ls': SimLS, 'mcts': SimMCTS}
+
+
+class DiscreteEventSim(object):
+    def __init__(self, planner, map_graph=None, start_node=2, sim_time_step=2.0, time_step=1.0):
+        """
+        :param planner: SimPlanner
+        :param map_graph: map graph, create_map_graph() if None, or load_map_graph for a large map
+        :param start_node: initial node of the robot, default at charge (2)
+        :param sim_time_step: seconds of a motion step, same as the *_sim planners
+        :param time_step: /thesis/time_step
+        """
+        self.map_graph = create_map_graph() if map_graph is None else map_graph
+        self.csr_adjacency = get_csr_adjacency(self.map_graph)
+        self.route_table = load_route_table(self.map_graph)
+        self.shortest_path = self.route_table.shortest_path
+        self.cur_node = start_node
+        self.next_node = start_node
+        self.motion_table = MotionTable(self.csr_adjacency, self.shortest_path)
+        self.cur_state = self.motion_table.get_state(self.cur_node)
+        self.sim_time_step = sim_time_step
+        self.time_step = time_step
+
+        self.instr_dict = InstructionStore(self.map_graph.nodes)
+        self.instr_dest_dict = self.instr_dict.dest_dict
+        self.arrival_queue = list()  # heap of (time, counter, instr)
+        self._arrival_counter = itertools.count()
+
+        # virtual clock in seconds, 0.0 is /instr_start_time
+        self.clock = 0.0
+
+        # for experiment evaluations
+        self.plan_time = 0.0
+        self.plan_stats = DecisionStats()  # (step, seconds, instructions, evaluations) of each decision
+        self.recorder = None  # InstructionRecorder of the arrivals and the done instructions on the virtual clock
+        self.expiry = None  # InstructionExpiry of the buffer, the stale instructions are kept if None
+        self.accu_r = 0.0  # accumulate reward
+        self.accu_r_list = [0.0]
+        self.time_r_list = [0.0]
+        self.done_instr = list()
+        self.arrival_dict = dict()  # {id: arrival time in seconds}
+        self.latency_list = list()  # seconds from the arrival to the done time of each instruction
+
+        self.planner = planner
+        self.planner.bind(self)
+
+    def add_instr(self, instr, arrival_time=1.0):
+        """
+        Schedule an instruction to arrive at the instruction buffer.
+        :param instr: Instruction or SimInstruction
+        :param arrival_time: seconds after /instr_start_time, 1 sec as the recorded experiments.
+        """
+        heapq.heappush(self.arrival_queue, (arrival_time, next(self._arrival_counter), instr))
+        return
+
+    def plan_task(self):
+        s_time = time.time()
+        self.planner.plan_task()
+        _plan_time = time.time() - s_time
+        self.plan_time += _plan_time
+        self.plan_stats.record(_plan_time, len(self.instr_dict), self.planner.eval_num,
+                               self.clock / self.sim_time_step)
+        return
+
+    def receive_instr(self):
+        """
+        Deliver the arrived instructions, same as the /thesis/instruction_delta callback.
+        :return: whether there are new instructions
+        """
+        is_new = False
+        while len(self.arrival_queue) > 0 and self.arrival_queue[0][0] <= self.clock:
+            _arrival_time, _, instr = heapq.heappop(self.arrival_queue)
+            self.instr_dict.add(instr)
+            self.arrival_dict[instr.id] = _arrival_time
+            is_new = True
+            if self.recorder is not None:
+                self.recorder.record(ADD, [instr], stamp=self.clock)
+
+        if is_new:
+            self.plan_task()
+        return is_new
+
+    def do_instr(self, instr_id):
+        if not self.instr_dict.ready(instr_id):
+            raise ValueError('instruction {0} is picked before its previous instruction {1} is done'.format(
+                instr_id, self.instr_dict[instr_id].prev_id))
+        do_instr = self.instr_dict[instr_id]
+        self.clock += do_instr.duration
+
+        # calculate obtained reward
+        _temp_step = self.clock / self.sim_time_step
+        self.accu_r += do_instr.r * (do_instr.b ** _temp_step)
+        self.accu_r_list.append(self.accu_r)
+        self.time_r_list.append(_temp_step)
+        self.done_instr.append(do_instr.id)
+        self.latency_list.append(self.clock - self.arrival_dict.get(do_instr.id, 0.0))
+        if self.recorder is not None:
+            self.recorder.record(COMPLETE, id_list=[do_instr.id], stamp=self.clock)
+
+        del self.instr_dict[do_instr.id]
+        self.planner.done_instr(do_instr)
+        return
+
+    def step(self):
+        """
+        One tick of run_plan_viz, same as plan_motion_viz of the *_sim planners.
+        """
+        s_clock = self.clock
+
+        if self.cur_node == self.next_node:
+            if len(self.instr_dest_dict[self.cur_node]) > 0:
+                for instr_id in self.planner.pick_instr():
+                    self.do_instr(instr_id)
+
+                # the done instructions are published to /thesis/instruction_delta, then the undo ones are planned again
+                self.plan_task()
+
+            elif len(self.instr_dict) > 0:
+                self.plan_task()
+
+        else:
+            self.cur_state = self.motion_table.move(self.cur_state, self.next_node)[0]
+            self.cur_node = self.motion_table.state_node[self.cur_state]
+
+        # rospy.Rate does not sleep if the tick overran
+        self.clock = max(self.clock, s_clock + self.sim_time_step)
+        return
+
+    def run(self, max_step=1000000):
+        """
+        Run until all the instructions are done.
+        :param max_step: maximum number of ticks
+        :return: accumulated reward
+        """
+        if len(self.arrival_queue) > 0:
+            self.clock = max(self.clock, self.arrival_queue[0][0])
+
+        for _ in xrange(max_step):
+            self.receive_instr()
+
+            if self.expiry is not None and len(self.expiry.expire(self.clock / self.sim_time_step)) > 0:
+                if len(self.instr_dict) > 0:
+                    self.plan_task()
+
+            if len(self.instr_dict) == 0:
+                if len(self.arrival_queue) == 0:
+                    break
+
+                # idle, jump to the tick of the next arrival
+                _idle_step = np.ceil((self.arrival_queue[0][0] - self.clock) / self.sim_time_step)
+                self.clock += max(_idle_step, 0.0) * self.sim_time_step
+                continue
+
+            self.step()
+
+        return self.accu_r
+
+    def save_accu_reward(self, out_dir, csv_name=None):
+        if csv_name is None:
+            csv_name = self.planner.base_name + '_reward.csv'
+        output_df = pd.DataFrame({'time': self.time_r_list, 'reward': self.accu_r_list})
+        output_df.to_csv(os.path.join(out_dir, csv_name), index=False, columns=['time', 'reward'])
+        return
+
+    def save_done_instr_id(self, out_dir, csv_name=None):
+        if csv_name is None:
+            csv_name = self.planner.base_name + '_done.csv'
+        output_df = pd.DataFrame({'done': self.done_instr})
+        output_df.to_csv(os.path.join(out_dir, csv_name), index=False)
+        return
+
+    def save_plan_stats(self, out_dir):
+        """
+        Save every decision with its instructions and evaluations, and the histogram of the plan time.
+        """
+        self.plan_stats.save_csv(os.path.join(out_dir, self.planner.base_name + '_plan_stats.csv'),
+                                 os.path.join(out_dir, self.planner.base_name + '_plan_hist.csv'))
+        return
+
+    def save_expired(self, out_dir, csv_name=None):
+        if csv_name is None:
+            csv_name = self.planner.base_name + '_expired.csv'
+        output_df = pd.DataFrame(self.expiry.expired_list, columns=['time', 'expired', 'gamma'])
+        output_df.to_csv(os.path.join(out_dir, csv_name), index=False)
+        return
+
+    def save_result(self, out_dir):
+        """
+        Save the results with the same layout as exp2/instr_<max_num>_<seed>.
+        :param out_dir: output directory
+        """
+        if not os.path.exists(out_dir):
+            os.makedirs(out_dir)
+
+        self.save_done_instr_id(out_dir)
+        self.save_accu_reward(out_dir)
+        self.save_plan_stats(out_dir)
+        if self.expiry is not None:
+            self.save_expired(out_dir)
+
+        if isinstance(self.planner, SimOpt):
+            output_df = pd.DataFrame({'time': self.planner.opt_time_list, 'reward': self.planner.opt_reward_list})
+            output_df.to_csv(os.path.join(out_dir, 'opt_reward.csv'), index=False, columns=['time', 'reward'])
+        return
+
+
+def create_planner(planner_name, seed=None):
+    """
+    :param planner_name: key of sim_planners
+    :param seed: random seed for the rand and mcts planners
+    :return: SimPlanner
+    """
+    if planner_name in ('rand', 'mcts'):
+        return sim_planners[planner_name](seed=seed)
+    return sim_planners[planner_name]()
+
+
+def run_scenario(planner_name, instr_list, out_dir=None, seed=None, start_node=2, recorder=None, epsilon=None):
+    """
+    Simulate a static instruction list with a planner.
+    :param planner_name: key of sim_planners
+    :param instr_list: list of instructions, all of them arrive at the beginning
+    :param out_dir: save the results if given
+    :param seed: random seed for the rand planner
+    :param start_node: initial node of the robot
+    :param recorder: InstructionRecorder of the run, see instr_log
+    :param epsilon: evict the instructions whose reward drops below epsilon, see instr_expiry, never if None
+    :return: DiscreteEventSim after running
+    """
+    return run_stream(planner_name, [(1.0, instr) for instr in instr_list], out_dir, seed, start_node, recorder,
+                      epsilon)
+
+
+def run_stream(planner_name, arrival_list, out_dir=None, seed=None, start_node=2, recorder=None, epsilon=None):
+    """
+    Simulate an instruction stream with a planner.
+    :param arrival_list: list of (arrival time in seconds, instruction)
+    :return: DiscreteEventSim after running, see run_scenario for the others
+    """
+    sim = DiscreteEventSim(create_planner(planner_name, seed), start_node=start_node)
+    sim.recorder = recorder
+    if epsilon is not None:
+        sim.expiry = InstructionExpiry(sim.instr_dict, epsilon, sim.sim_time_step, keep_list=True)
+    for arrival_time, instr in arrival_list:
+        sim.add_instr(instr, arrival_time)
+    sim.run()
+
+    if out_dir is not None:
+        sim.save_result(out_dir)
+    return sim
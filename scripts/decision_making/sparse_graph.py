@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Sparse backend of the map graph for large maps, e.g. multi-floor facilities with thousands of waypoints.
+The waypoint graph is loaded from csv files and kept as a CSR adjacency matrix. The shortest paths are computed with
+Dijkstra from the task nodes only, i.e. the nodes where instructions can be done, and cached on disk by graph hash.
+"""
+
+import os
+import hashlib
+import networkx as nx
+import numpy as np
+import pandas as pd
+from scipy.sparse.csgraph import dijkstra
+
+from decision_making.map_graph import config_dir, RouteTable
+
+
+def load_map_graph(edge_file, node_file=None):
+    """
+    Load the waypoint graph.
+    :param edge_file: csv file with columns node1, node2, weight (positive integer steps)
+    :param node_file: csv file with columns node, x, y, task (0 or 1), all nodes are task nodes if None
+    :return: map graph, same as create_map_graph, and the task nodes in map_graph.graph['task_nodes']
+    """
+    edge_df = pd.read_csv(edge_file)
+    map_graph = nx.Graph()
+
+    if node_file is not None:
+        node_df = pd.read_csv(node_file)
+        for _, row in node_df.iterrows():
+            map_graph.add_node(int(row['node']), pos=(row['x'], row['y']))
+        task_nodes = sorted(int(n) for n in node_df['node'][node_df['task'] > 0])
+    else:
+        task_nodes = None
+
+    for _, row in edge_df.iterrows():
+        # the weights are the motion steps of the edges, see MotionTable
+        if row['weight'] != int(row['weight']) or row['weight'] < 1:
+            raise ValueError('Invalid map graph: weight of edge ({0}, {1}) must be a positive integer, not {2}'.format(
+                int(row['node1']), int(row['node2']), row['weight']))
+        map_graph.add_edge(int(row['node1']), int(row['node2']), weight=int(row['weight']))
+
+    # the planners index the arrays by node
+    if sorted(map_graph.nodes) != range(map_graph.number_of_nodes()):
+        raise ValueError('Invalid map graph: nodes must be 0 ~ {0}'.format(map_graph.number_of_nodes() - 1))
+
+    map_graph.graph['task_nodes'] = range(map_graph.number_of_nodes()) if task_nodes is None else task_nodes
+    return map_graph
+
+
+def get_csr_adjacency(map_graph):
+    """
+    :return: weighted adjacency matrix of the map graph, type=scipy.sparse.csr_matrix
+    """
+    return nx.to_scipy_sparse_matrix(map_graph, nodelist=range(map_graph.number_of_nodes()), weight='weight',
+                                     format='csr')
+
+
+def get_graph_hash(csr_adjacency, task_nodes):
+    """
+    :return: sha1 of the adjacency matrix and the task nodes, the key of the cache on disk
+    """
+    _hash = hashlib.sha1()
+    _hash.update(str(csr_adjacency.shape))
+    for arr in [csr_adjacency.indptr, csr_adjacency.indices, csr_adjacency.data, task_nodes]:
+        _hash.update(np.ascontiguousarray(arr, dtype=float).tostring())
+    return _hash.hexdigest()
+
+
+class SparseRouteTable(object):
+    """
+    Same interface as RouteTable, but the distances are only kept from the task nodes, so the memory is
+    O(task nodes * nodes) instead of O(nodes ** 2).
+    shortest_path[dest, node] works as the dense matrix as long as dest, or node, are task nodes.
+    """
+
+    def __init__(self, map_graph, task_nodes=None, cache_dir=config_dir):
+        """
+        :param map_graph: map graph
+        :param task_nodes: nodes where instructions can be done, map_graph.graph['task_nodes'] or all nodes if None
+        :param cache_dir: directory of the cached shortest paths, None for no cache
+        """
+        if task_nodes is None:
+            task_nodes = map_graph.graph.get('task_nodes', range(map_graph.number_of_nodes()))
+
+        self.csr_adjacency = get_csr_adjacency(map_graph)
+        self.node_num = self.csr_adjacency.shape[0]
+        self.task_nodes = np.array(sorted(task_nodes), dtype=int)
+        self.task_idx = np.full(self.node_num, -1, dtype=int)  # row of each task node, -1 for the other nodes
+        self.task_idx[self.task_nodes] = np.arange(len(self.task_nodes))
+        self.graph_hash = get_graph_hash(self.csr_adjacency, self.task_nodes)
+
+        cache_file = None if cache_dir is None else os.path.join(cache_dir, 'route_' + self.graph_hash + '.npz')
+        if cache_file is not None and os.path.isfile(cache_file):
+            _cache = np.load(cache_file)
+            self.dis, self.pred = _cache['dis'], _cache['pred']
+        else:
+            # dis[i, n] is the distance between task_nodes[i] and n, pred[i, n] is the node before n on the path
+            self.dis, self.pred = dijkstra(self.csr_adjacency, directed=False, indices=self.task_nodes,
+                                           return_predecessors=True)
+            if cache_file is not None:
+                np.savez(cache_file, dis=self.dis, pred=self.pred)
+
+    @property
+    def shortest_path(self):
+        return self
+
+    @property
+    def shape(self):
+        return self.node_num, self.node_num
+
+    def _get_task_idx(self, nodes):
+        if isinstance(nodes, slice):
+            nodes = np.arange(self.node_num)[nodes]
+        _idx = self.task_idx[nodes]
+        if np.any(_idx < 0):
+            return None
+        return _idx
+
+    def __getitem__(self, key):
+        """
+        :param key: (dest, node), indices or slices as np.array
+        :return: the distance between dest and node
+        """
+        dest, node = key
+        _idx = self._get_task_idx(dest)
+        if _idx is not None:
+            if np.ndim(_idx) > 0 and np.ndim(node) > 0:
+                return self.dis[_idx][:, node]
+            return self.dis[_idx, node]
+
+        # the graph is undirected
+        _idx = self._get_task_idx(node)
+        if _idx is None:
+            raise ValueError('Neither {0} nor {1} are task nodes'.format(dest, node))
+        if np.ndim(_idx) > 0 and np.ndim(dest) > 0:
+            return self.dis[_idx][:, dest].T
+        return self.dis[_idx, dest].T
+
+    def __array__(self, dtype=None):
+        if len(self.task_nodes) != self.node_num:
+            raise ValueError('The dense shortest path matrix needs all the nodes to be task nodes')
+        return np.asarray(self.dis, dtype=dtype)
+
+    def next_node(self, src, dest):
+        """
+        :return: the neighbor of src toward dest, src if src == dest, type=int
+        """
+        if src == dest:
+            return src
+        if self.task_idx[dest] >= 0:
+            _next = int(self.pred[self.task_idx[dest], src])
+            if _next < 0:
+                raise ValueError('No path from {0} to {1}'.format(src, dest))
+            return _next
+        return self.route(src, dest)[1]
+
+    def route(self, src, dest):
+        """
+        :return: nodes on the shortest path from src to dest
+        """
+        if self.task_idx[dest] >= 0:
+            _pred, temp_path = self.pred[self.task_idx[dest]], [src]
+            while temp_path[-1] != dest:
+                _next = int(_pred[temp_path[-1]])
+                if _next < 0:  # scipy marks the unreachable nodes with -9999
+                    raise ValueError('No path from {0} to {1}'.format(src, dest))
+                temp_path.append(_next)
+            return temp_path
+
+        if self.task_idx[src] < 0:
+            raise ValueError('Neither {0} nor {1} are task nodes'.format(src, dest))
+        return self.route(dest, src)[::-1]
+
+
+def load_route_table(map_graph):
+    """
+    :param map_graph: map graph from create_map_graph or load_map_graph
+    :return: SparseRouteTable for the graphs loaded from files, RouteTable otherwise
+    """
+    if 'task_nodes' in map_graph.graph:
+        return SparseRouteTable(map_graph)
+    return RouteTable.load(map_graph)
@@ -0,0 +1,671 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Sequence the instructions to maximize the accumulated reward sum(r * b ** t),
+where t is the step when the instruction is done, same as TaskMotionPlannerOptSim.plan_task.
+"""
+
+import time
+import numpy as np
+from decision_making.instr_store import InstructionStore
+
+
+def get_seq_arrays(instr_dict, sim_time_step=2.0):
+    """
+    Convert the instructions into arrays.
+    :param instr_dict: InstructionStore or {id: Instruction}
+    :param sim_time_step: seconds of a step
+    :return: id_list, dest, r, b, duration (in steps) as np.array
+    """
+    id_list = sorted(instr_dict.keys())
+    if isinstance(instr_dict, InstructionStore):
+        dest, r, b, duration = instr_dict.get_arrays(id_list)
+        return id_list, dest, r, b, np.around(duration / sim_time_step)
+
+    dest = np.array([instr_dict[i].destination for i in id_list], dtype=int)
+    r = np.array([instr_dict[i].r for i in id_list], dtype=float)
+    b = np.array([instr_dict[i].b for i in id_list], dtype=float)
+    duration = np.around(np.array([instr_dict[i].duration for i in id_list], dtype=float) / sim_time_step)
+    return id_list, dest, r, b, duration
+
+
+def get_seq_reward(seq, instr_dict, shortest_path, start_node, sim_time_step=2.0):
+    """
+    Accumulated reward of a sequence of instruction ids.
+    :return: accumulated reward, done steps of the instructions
+    """
+    path_len = 0.0
+    seq_reward = 0.0
+    temp_node = start_node
+    t_list = list()
+    for instr_id in seq:
+        instr = instr_dict[instr_id]
+        path_len += shortest_path[instr.destination, temp_node] + np.around(instr.duration / sim_time_step)
+        seq_reward += instr.r * (instr.b ** path_len)
+        temp_node = instr.destination
+        t_list.append(path_len)
+    return seq_reward, t_list
+
+
+def get_greedy_seq(instr_dict, shortest_path, start_node, sim_time_step=2.0):
+    """
+    Pick the instruction with the maximum reward at the moment it is done, one by one.
+    :return: sequence of instruction ids, accumulated reward
+    """
+    id_list, dest, r, b, duration = get_seq_arrays(instr_dict, sim_time_step)
+    dest_dis = np.asarray(shortest_path[:, dest])  # only the columns of the destinations
+    remain = np.ones(len(id_list), dtype=bool)
+    temp_node = start_node
+    path_len = 0.0
+    seq_reward = 0.0
+    seq = list()
+
+    for _ in range(len(id_list)):
+        temp_t = path_len + dest_dis[temp_node] + duration
+        temp_r = np.where(remain, r * b ** temp_t, -1.0)
+        idx = int(np.argmax(temp_r))
+        seq.append(id_list[idx])
+        seq_reward += temp_r[idx]
+        path_len = temp_t[idx]
+        temp_node = dest[idx]
+        remain[idx] = False
+
+    return seq, seq_reward
+
+
+def improve_seq(seq, instr_dict, shortest_path, start_node, sim_time_step=2.0):
+    """
+    Hill climbing by moving one instruction to another position until no move improves the reward.
+    :return: sequence of instruction ids, accumulated reward
+    """
+    seq = list(seq)
+    best_reward = get_seq_reward(seq, instr_dict, shortest_path, start_node, sim_time_step)[0]
+    is_improved = True
+
+    while is_improved:
+        is_improved = False
+        for i in range(len(seq)):
+            for j in range(len(seq)):
+                if i == j:
+                    continue
+                temp_seq = list(seq)
+                temp_seq.insert(j, temp_seq.pop(i))
+                temp_reward = get_seq_reward(temp_seq, instr_dict, shortest_path, start_node, sim_time_step)[0]
+                if temp_reward > best_reward:
+                    seq, best_reward = temp_seq, temp_reward
+                    is_improved = True
+
+    return seq, best_reward
+
+
+def get_subset_dp_seq(instr_dict, shortest_path, start_node, sim_time_step=2.0, stats=None):
+    """
+    Exact optimal sequence with dynamic programming over (subset of done instructions, last visited destination).
+    Since the rewards decay with r * b ** t, each state keeps the Pareto front of (elapsed steps, accumulated
+    reward): a label is dominated if another one is not later and has no less reward. Labels that cannot beat the
+    incumbent sequence even with an optimistic bound are pruned as well.
+    :param instr_dict: {id: Instruction}
+    :param shortest_path: shortest path matrix among nodes, or SparseRouteTable
+    :param start_node: the node where the robot starts
+    :param sim_time_step: seconds of a step
+    :param stats: dict, the number of the labels is written to stats['eval_num'] if given
+    :return: optimal sequence of instruction ids, accumulated reward
+    """
+    if len(instr_dict) == 0:
+        return list(), 0.0
+
+    id_list, dest, r, b, duration = get_seq_arrays(instr_dict, sim_time_step)
+    instr_num = len(id_list)
+    full_mask = (1 << instr_num) - 1
+
+    # steps from a node to finish each instruction, and the reward if it is done first from the node
+    dis = np.asarray(shortest_path[:, dest]) + duration[np.newaxis, :]
+    first_reward = r[np.newaxis, :] * b[np.newaxis, :] ** dis
+
+    # group the optimistic bound by distinct decay factors: sum_k (sum_{b_i = b_k} first_reward_i) * b_k ** t
+    b_val = np.unique(b)
+    b_group = [np.searchsorted(b_val, b_i) for b_i in b]
+    b_val = b_val.tolist()
+
+    dis, first_reward = dis.tolist(), first_reward.tolist()
+    dest, r, b = dest.tolist(), r.tolist(), b.tolist()
+
+    best_seq, best_reward = get_greedy_seq(instr_dict, shortest_path, start_node, sim_time_step)
+    best_seq, best_reward = improve_seq(best_seq, instr_dict, shortest_path, start_node, sim_time_step)
+    bound_cache = dict()
+
+    def upper_bound(mask, node, t):
+        key = (mask, node)
+        group_reward = bound_cache.get(key)
+        if group_reward is None:
+            group_reward = [0.0] * len(b_val)
+            for i in range(instr_num):
+                if not mask & (1 << i):
+                    group_reward[b_group[i]] += first_reward[node][i]
+            bound_cache[key] = group_reward
+        return sum(g_r * b_k ** t for g_r, b_k in zip(group_reward, b_val) if g_r > 0.0)
+
+    def trace_seq(in_label):
+        temp_seq = list()
+        while in_label[3] is not None:
+            temp_seq.append(in_label[2])
+            in_label = in_label[3]
+        temp_seq.reverse()
+        return temp_seq
+
+    # Same as itertools.permutations, the first sequence in lexicographic order wins the tie.
+    best_idx_seq = [id_list.index(instr_id) for instr_id in best_seq]
+
+    # label: (elapsed steps, accumulated reward, index of the last instruction, parent label)
+    layer = {(0, start_node): [(0.0, 0.0, -1, None)]}
+    label_num = 0
+
+    for _ in range(instr_num):
+        next_layer = dict()
+
+        for (mask, node), labels in layer.iteritems():
+            node_dis = dis[node]
+            for label in labels:
+                t, acc_r = label[0], label[1]
+
+                for i in range(instr_num):
+                    if mask & (1 << i):
+                        continue
+
+                    new_mask = mask | (1 << i)
+                    new_t = t + node_dis[i]
+                    new_r = acc_r + r[i] * b[i] ** new_t
+                    new_label = (new_t, new_r, i, label)
+                    label_num += 1
+
+                    if new_mask == full_mask:
+                        if new_r > best_reward or (new_r == best_reward and trace_seq(new_label) < best_idx_seq):
+                            best_reward, best_idx_seq = new_r, trace_seq(new_label)
+                        continue
+
+                    if new_r + upper_bound(new_mask, dest[i], new_t) < best_reward:
+                        continue
+
+                    key = (new_mask, dest[i])
+                    front = next_layer.get(key)
+                    if front is None:
+                        next_layer[key] = [new_label]
+                        continue
+
+                    # Pareto dominance on (elapsed steps, accumulated reward)
+                    is_dominated = False
+                    for f_idx, f in enumerate(front):
+                        if f[0] <= new_t and f[1] >= new_r:
+                            if f[0] == new_t and f[1] == new_r and trace_seq(new_label) < trace_seq(f):
+                                front[f_idx] = new_label
+                            is_dominated = True
+                            break
+
+                    if not is_dominated:
+                        front[:] = [f for f in front if not (new_t <= f[0] and new_r >= f[1])]
+                        front.append(new_label)
+
+        layer = next_layer
+
+    if stats is not None:
+        stats['eval_num'] = label_num
+    best_seq = [id_list[i] for i in best_idx_seq]
+    return best_seq, best_reward
+
+
+def get_bnb_seq(instr_dict, shortest_path, start_node, sim_time_step=2.0, time_budget=1.0, stats=None):
+    """
+    Anytime branch and bound on the instruction sequence, two-stage instructions are done after their prev_id.
+    A remaining instruction i is bounded by r * b ** (t + shortest_path[node, dest] + duration), as if it were done
+    right after the current node. The search returns the best sequence found when the time budget runs out.
+    :param instr_dict: {id: Instruction}
+    :param shortest_path: shortest path matrix among nodes, or SparseRouteTable
+    :param start_node: the node where the robot starts
+    :param sim_time_step: seconds of a step
+    :param time_budget: seconds for searching, None for no limit
+    :param stats: dict, the number of the expanded nodes is written to stats['eval_num'] if given
+    :return: sequence of instruction ids, accumulated reward, optimality gap (1 - reward / upper bound)
+    """
+    if stats is not None:
+        stats['eval_num'] = 0
+    if len(instr_dict) == 0:
+        return list(), 0.0, 0.0
+
+    s_time = time.time()
+    id_list, dest, r, b, duration = get_seq_arrays(instr_dict, sim_time_step)
+    instr_num = len(id_list)
+    full_mask = (1 << instr_num) - 1
+    dis = np.asarray(shortest_path[:, dest]) + duration[np.newaxis, :]
+
+    # bit of the previous instruction that has to be done first
+    id_idx = {instr_id: i for i, instr_id in enumerate(id_list)}
+    prev_bit = [1 << id_idx[instr_dict[instr_id].prev_id] if instr_dict[instr_id].prev_id in id_idx else 0
+                for instr_id in id_list]
+
+    def upper_bound(mask, node, t):
+        remain = np.array([not mask & (1 << i) for i in range(instr_num)])
+        return np.sum(r[remain] * b[remain] ** (t + dis[node, remain]))
+
+    best_seq, best_reward = list(), -1.0
+    front_dict = dict()  # {(mask, node): [(elapsed steps, accumulated reward)]}
+
+    # entry: (bound, elapsed steps, accumulated reward, node, mask, sequence of indices)
+    stack = [(upper_bound(0, start_node, 0.0), 0.0, 0.0, start_node, 0, tuple())]
+    is_timeout = False
+    expand_num = 0
+
+    while len(stack) > 0:
+        if time_budget is not None and time.time() - s_time > time_budget:
+            is_timeout = True
+            break
+
+        bound, t, acc_r, node, mask, seq = stack.pop()
+        if bound <= best_reward:
+            continue
+        expand_num += 1
+
+        if mask == full_mask:
+            best_seq, best_reward = list(seq), acc_r
+            continue
+
+        children = list()
+        for i in range(instr_num):
+            if mask & (1 << i) or (prev_bit[i] and not mask & prev_bit[i]):
+                continue
+
+            new_mask = mask | (1 << i)
+            new_t = t + dis[node, i]
+            new_r = acc_r + r[i] * b[i] ** new_t
+            new_bound = new_r + upper_bound(new_mask, dest[i], new_t)
+            if new_bound <= best_reward:
+                continue
+
+            # dominated by a label with the same done instructions and position
+            front = front_dict.setdefault((new_mask, dest[i]), list())
+            if any(f[0] <= new_t and f[1] >= new_r for f in front):
+                continue
+            front[:] = [f for f in front if not (new_t <= f[0] and new_r >= f[1])]
+            front.append((new_t, new_r))
+
+            children.append((new_bound, new_t, new_r, dest[i], new_mask, seq + (i,)))
+
+        # explore the child with the largest bound first
+        children.sort(key=lambda x: x[0])
+        stack.extend(children)
+
+    if is_timeout:
+        opt_bound = max([best_reward] + [entry[0] for entry in stack])
+
+        # no complete sequence within the time budget, finish the sequence greedily
+        if len(best_seq) == 0:
+            mask, node, t, best_reward = 0, start_node, 0.0, 0.0
+            for _ in range(instr_num):
+                _remain = [i for i in range(instr_num) if not mask & (1 << i)]
+                i = max([i for i in _remain if not prev_bit[i] or mask & prev_bit[i]],
+                        key=lambda x: r[x] * b[x] ** (t + dis[node, x]))
+                t += dis[node, i]
+                best_reward += r[i] * b[i] ** t
+                mask, node = mask | (1 << i), dest[i]
+                best_seq.append(i)
+    else:
+        opt_bound = best_reward
+
+    if stats is not None:
+        stats['eval_num'] = expand_num
+    gap = 1.0 - best_reward / opt_bound if opt_bound > 0.0 else 0.0
+    return [id_list[i] for i in best_seq], best_reward, gap
+
+
+class IncrementalSeq(object):
+    """
+    Instruction sequence repaired incrementally when the instruction buffer changes.
+    The done instructions are dropped and the new ones are put with cheapest insertion, then moved to their best
+    positions again. The whole sequence is re-optimized with get_bnb_seq only when the estimated gap grows by more
+    than gap_threshold since the last re-optimization, so a replanning costs O(new instructions * sequence length).
+    """
+
+    def __init__(self, shortest_path, sim_time_step=2.0, gap_threshold=0.1, time_budget=0.5):
+        """
+        :param shortest_path: shortest path matrix among nodes, or SparseRouteTable
+        :param sim_time_step: seconds of a step
+        :param gap_threshold: re-optimize if the estimated gap grows more than it
+        :param time_budget: seconds for get_bnb_seq
+        """
+        self.shortest_path = shortest_path
+        self.sim_time_step = sim_time_step
+        self.gap_threshold = gap_threshold
+        self.time_budget = time_budget
+
+        self.seq = list()  # instruction ids
+        self.reward = 0.0  # accumulated reward of seq from the start node
+        self.gap = 0.0  # estimated gap of seq
+        self.base_gap = None  # estimated gap after the last re-optimization
+        self.full_count = 0  # number of re-optimizations
+        self.repair_count = 0  # number of repairs
+        self.eval_num = 0  # insertion positions and branch and bound nodes evaluated by the last update
+
+    def _get_step(self, instr):
+        return np.around(instr.duration / self.sim_time_step)
+
+    def _get_bound(self, instr_dict, start_node):
+        # reward as if every instruction were done first, the same bound as the root of get_bnb_seq
+        return sum(instr.r * instr.b ** (self.shortest_path[instr.destination, start_node] + self._get_step(instr))
+                   for instr in instr_dict.itervalues())
+
+    def _get_suffix(self, instr_dict, start_node):
+        """
+        :return: done steps of seq, and the suffix reward grouped by decay factor {b: [sum of r * b ** t from idx]}
+        """
+        t_list = get_seq_reward(self.seq, instr_dict, self.shortest_path, start_node, self.sim_time_step)[1]
+        suffix = dict()
+        for idx in range(len(self.seq) - 1, -1, -1):
+            instr = instr_dict[self.seq[idx]]
+            _b_suffix = suffix.setdefault(instr.b, [0.0] * (len(self.seq) + 1))
+            _b_suffix[idx] = instr.r * instr.b ** t_list[idx]
+        for _b_suffix in suffix.itervalues():
+            for idx in range(len(self.seq) - 1, -1, -1):
+                _b_suffix[idx] += _b_suffix[idx + 1]
+        return t_list, suffix
+
+    def _get_range(self, instr, instr_dict):
+        # the instruction is done after its prev_id and before the instructions waiting for it
+        lo, hi = 0, len(self.seq)
+        for idx, instr_id in enumerate(self.seq):
+            if instr_id == instr.prev_id:
+                lo = idx + 1
+            elif instr_dict[instr_id].prev_id == instr.id:
+                hi = min(hi, idx)
+        return lo, hi
+
+    def _insert(self, instr, instr_dict, start_node):
+        """
+        Cheapest insertion, the suffix after the position is shifted by delta steps, and its reward becomes
+        sum_b (suffix reward of b) * b ** delta.
+        :return: increase of the accumulated reward
+        """
+        t_list, suffix = self._get_suffix(instr_dict, start_node)
+        step = self._get_step(instr)
+        lo, hi = self._get_range(instr, instr_dict)
+
+        best_idx, best_gain = lo, None
+        self.eval_num += hi + 1 - lo
+        for idx in range(lo, hi + 1):
+            prev_node = start_node if idx == 0 else instr_dict[self.seq[idx - 1]].destination
+            prev_t = 0.0 if idx == 0 else t_list[idx - 1]
+            new_t = prev_t + self.shortest_path[instr.destination, prev_node] + step
+            gain = instr.r * instr.b ** new_t
+
+            if idx < len(self.seq):
+                next_instr = instr_dict[self.seq[idx]]
+                delta = new_t + self.shortest_path[next_instr.destination, instr.destination] + \
+                    self._get_step(next_instr) - t_list[idx]
+                gain += sum(_b_suffix[idx] * (b ** delta - 1.0) for b, _b_suffix in suffix.iteritems())
+
+            if best_gain is None or gain > best_gain:
+                best_idx, best_gain = idx, gain
+
+        self.seq.insert(best_idx, instr.id)
+        return best_gain
+
+    def reoptimize(self, instr_dict, start_node):
+        """
+        Re-optimize the whole sequence with get_bnb_seq.
+        :return: sequence of instruction ids
+        """
+        _stats = dict()
+        self.seq = get_bnb_seq(instr_dict, self.shortest_path, start_node, self.sim_time_step, self.time_budget,
+                               _stats)[0]
+        self.eval_num += _stats['eval_num']
+        self.reward = get_seq_reward(self.seq, instr_dict, self.shortest_path, start_node, self.sim_time_step)[0]
+        _bound = self._get_bound(instr_dict, start_node)
+        self.gap = 1.0 - self.reward / _bound if _bound > 0.0 else 0.0
+        self.base_gap = self.gap
+        self.full_count += 1
+        return self.seq
+
+    def update(self, instr_dict, start_node):
+        """
+        Repair the sequence with the current instruction buffer.
+        :param instr_dict: InstructionStore or {id: Instruction}
+        :param start_node: the node where the robot starts
+        :return: sequence of instruction ids
+        """
+        self.eval_num = 0
+        self.seq = [instr_id for instr_id in self.seq if instr_id in instr_dict]
+        _in_seq = set(self.seq)
+        new_id = sorted(instr_id for instr_id in instr_dict.iterkeys() if instr_id not in _in_seq)
+
+        if self.base_gap is None or len(self.seq) == 0:
+            return self.reoptimize(instr_dict, start_node) if len(instr_dict) > 0 else self.seq
+
+        # cheapest insertion, the instructions waiting for others go after them
+        for instr_id in sorted(new_id, key=lambda x: instr_dict[x].prev_id in instr_dict):
+            self._insert(instr_dict[instr_id], instr_dict, start_node)
+        self.reward = get_seq_reward(self.seq, instr_dict, self.shortest_path, start_node, self.sim_time_step)[0]
+
+        # move the new instructions to their best positions again until no move improves the reward
+        is_improved = len(new_id) > 1
+        while is_improved:
+            is_improved = False
+            for instr_id in new_id:
+                _temp_seq = list(self.seq)
+                self.seq.remove(instr_id)
+                self._insert(instr_dict[instr_id], instr_dict, start_node)
+                _temp_reward = get_seq_reward(self.seq, instr_dict, self.shortest_path, start_node,
+                                              self.sim_time_step)[0]
+                if _temp_reward > self.reward + 1e-9:
+                    self.reward = _temp_reward
+                    is_improved = True
+                else:
+                    self.seq = _temp_seq
+
+        _bound = self._get_bound(instr_dict, start_node)
+        self.gap = 1.0 - self.reward / _bound if _bound > 0.0 else 0.0
+        self.repair_count += 1
+        if self.gap - self.base_gap > self.gap_threshold:
+            return self.reoptimize(instr_dict, start_node)
+        return self.seq
+
+
+def get_rule_seq(instr_dict, shortest_path, start_node, rule='fcfs', time_step=1.0):
+    """
+    Order of the instructions done by the rule-based planners when no instruction arrives. Every step picks one of
+    the ready instructions, i.e. the second stage of a two-stage instruction goes after its prev_id.
+    :param rule: 'fcfs' for the smallest id, 'pf' for the largest reward, 'sf' for the shortest duration + distance
+    :param time_step: /thesis/time_step of the SF planner
+    :return: sequence of instruction ids
+    """
+    if rule == 'fcfs':
+        get_key = lambda x, node: x
+    elif rule == 'pf':
+        get_key = lambda x, node: (-instr_dict[x].r, x)
+    elif rule == 'sf':
+        get_key = lambda x, node: (instr_dict[x].duration + shortest_path[instr_dict[x].destination, node] * time_step,
+                                   x)
+    else:
+        raise ValueError('Invalid rule: {0}'.format(rule))
+
+    _dependent = dict()  # {prev_id: ids waiting for it}
+    ready = list()
+    for instr_id in instr_dict.keys():
+        if instr_dict[instr_id].prev_id in instr_dict:
+            _dependent.setdefault(instr_dict[instr_id].prev_id, list()).append(instr_id)
+        else:
+            ready.append(instr_id)
+
+    seq = list()
+    temp_node = start_node
+    while len(ready) > 0:
+        instr_id = min(ready, key=lambda x: get_key(x, temp_node))
+        ready.remove(instr_id)
+        ready.extend(_dependent.pop(instr_id, ()))
+        seq.append(instr_id)
+        temp_node = instr_dict[instr_id].destination
+    return seq
+
+
+def repair_seq(seq, instr_dict):
+    """
+    :param seq: sequence of instruction ids
+    :return: the same order, except the second stages before their prev_id are moved right after it
+    """
+    _in_seq = set(seq)
+    _waiting = dict()  # {prev_id: ids moved after it}
+    _done = set()
+    temp_seq = list()
+
+    def _put(instr_id):
+        temp_seq.append(instr_id)
+        _done.add(instr_id)
+        for dep_id in _waiting.pop(instr_id, ()):
+            _put(dep_id)
+
+    for instr_id in seq:
+        prev_id = instr_dict[instr_id].prev_id
+        if prev_id in _in_seq and prev_id not in _done:
+            _waiting.setdefault(prev_id, list()).append(instr_id)
+        else:
+            _put(instr_id)
+    return temp_seq
+
+
+class SeqEval(object):
+    """
+    Incremental evaluation of sum(r * b ** t) for the moves of a sequence.
+    A move replaces the segment seq[i:j] with another order of the same instructions, the prefix is kept and the
+    suffix seq[j:] is only shifted by delta steps, so its reward is sum_b (suffix reward of b) * b ** delta.
+    A move costs O(j - i + distinct b) instead of O(len(seq)).
+    """
+
+    def __init__(self, seq, instr_dict, shortest_path, start_node, sim_time_step=2.0):
+        """
+        :param seq: initial sequence of instruction ids, repaired if a second stage goes before its prev_id
+        """
+        self.seq = repair_seq(seq, instr_dict)
+        self.shortest_path = shortest_path
+        self.start_node = start_node
+        self.dest = [instr_dict[i].destination for i in self.seq]
+        self.r = [instr_dict[i].r for i in self.seq]
+        self.b = [instr_dict[i].b for i in self.seq]
+        self.step = [np.around(instr_dict[i].duration / sim_time_step) for i in self.seq]
+        _idx = {instr_id: idx for idx, instr_id in enumerate(self.seq)}
+        self.prev_idx = [_idx.get(instr_dict[i].prev_id, -1) for i in self.seq]
+        self.b_val = sorted(set(self.b))
+        self.seq_idx = range(len(self.seq))  # current order, as indices of self.seq
+        self.update()
+
+    def update(self):
+        """
+        Compute the done steps, the prefix rewards and the suffix rewards grouped by b of the current order.
+        """
+        seq_len = len(self.seq)
+        self.t = [0.0] * seq_len
+        self.prefix = [0.0] * (seq_len + 1)
+        temp_node, temp_t = self.start_node, 0.0
+        for k, idx in enumerate(self.seq_idx):
+            temp_t += self.shortest_path[self.dest[idx], temp_node] + self.step[idx]
+            self.t[k] = temp_t
+            self.prefix[k + 1] = self.prefix[k] + self.r[idx] * self.b[idx] ** temp_t
+            temp_node = self.dest[idx]
+
+        self.suffix = {b_k: [0.0] * (seq_len + 1) for b_k in self.b_val}
+        for k in range(seq_len - 1, -1, -1):
+            idx = self.seq_idx[k]
+            for b_k, _b_suffix in self.suffix.iteritems():
+                _b_suffix[k] = _b_suffix[k + 1]
+            self.suffix[self.b[idx]][k] += self.r[idx] * self.b[idx] ** self.t[k]
+        self.reward = self.prefix[seq_len]
+        return
+
+    def evaluate(self, i, j, segment):
+        """
+        :param i: start of the replaced segment
+        :param j: end of the replaced segment, excluded
+        :param segment: new order of seq_idx[i:j]
+        :return: accumulated reward after the move, None if a two-stage instruction goes before its prev_id
+        """
+        _in_segment = set(segment)
+        _done = set()
+        for idx in segment:
+            if self.prev_idx[idx] in _in_segment and self.prev_idx[idx] not in _done:
+                return None
+            _done.add(idx)
+
+        temp_node = self.start_node if i == 0 else self.dest[self.seq_idx[i - 1]]
+        temp_t = 0.0 if i == 0 else self.t[i - 1]
+        temp_r = self.prefix[i]
+        for idx in segment:
+            temp_t += self.shortest_path[self.dest[idx], temp_node] + self.step[idx]
+            temp_r += self.r[idx] * self.b[idx] ** temp_t
+            temp_node = self.dest[idx]
+
+        if j < len(self.seq_idx):
+            next_idx = self.seq_idx[j]
+            delta = temp_t + self.shortest_path[self.dest[next_idx], temp_node] + self.step[next_idx] - self.t[j]
+            if delta == 0.0:
+                temp_r += self.reward - self.prefix[j]
+            else:
+                temp_r += sum(_b_suffix[j] * b_k ** delta for b_k, _b_suffix in self.suffix.iteritems())
+        return temp_r
+
+    def apply(self, i, j, segment):
+        self.seq_idx[i:j] = segment
+        self.update()
+        return
+
+    def get_seq(self):
+        return [self.seq[idx] for idx in self.seq_idx]
+
+
+def local_search_seq(seq, instr_dict, shortest_path, start_node, sim_time_step=2.0, time_budget=None,
+                     max_segment=3, max_span=16, stats=None):
+    """
+    Improve a sequence with swap, 2-opt (reverse a segment) and or-opt (move a segment of up to max_segment
+    instructions) moves, scored by sum(r * b ** t) as TaskMotionPlannerOptSim.plan_task, until no move improves.
+    The moves on shorter segments are tried first, and the first improving move is applied.
+    :param seq: initial sequence of instruction ids, e.g. get_rule_seq
+    :param time_budget: seconds for searching, None for no limit
+    :param max_segment: maximum length of the segment moved by or-opt
+    :param max_span: maximum length of seq[i:j] changed by a move, None for no limit
+    :param stats: dict, the number of the evaluated moves is written to stats['eval_num'] if given
+    :return: sequence of instruction ids, accumulated reward
+    """
+    s_time = time.time()
+    if stats is None:
+        stats = dict()
+    stats['eval_num'] = 0
+    seq_eval = SeqEval(seq, instr_dict, shortest_path, start_node, sim_time_step)
+    seq_len = len(seq_eval.seq)
+
+    max_span = seq_len if max_span is None else min(max_span, seq_len)
+
+    def get_moves():
+        for span in range(2, max_span + 1):
+            for i in range(seq_len - span + 1):
+                j = i + span
+                _idx = seq_eval.seq_idx
+                # swap the first and the last of seq[i:j]
+                yield i, j, [_idx[j - 1]] + _idx[i + 1:j - 1] + [_idx[i]]
+                # 2-opt
+                if j - i > 2:
+                    yield i, j, _idx[i:j][::-1]
+                # or-opt, move the leading or the trailing segment to the other end
+                for seg_len in range(1, min(max_segment, j - i - 1) + 1):
+                    yield i, j, _idx[i + seg_len:j] + _idx[i:i + seg_len]
+                    yield i, j, _idx[j - seg_len:j] + _idx[i:j - seg_len]
+
+    is_improved = True
+    while is_improved:
+        is_improved = False
+        for i, j, segment in get_moves():
+            if time_budget is not None and time.time() - s_time > time_budget:
+                return seq_eval.get_seq(), seq_eval.reward
+
+            temp_r = seq_eval.evaluate(i, j, segment)
+            stats['eval_num'] += 1
+            if temp_r is not None and temp_r > seq_eval.reward + 1e-9:
+                seq_eval.apply(i, j, segment)
+                is_improved = True
+                break
+
+    return seq_eval.get_seq(), seq_eval.reward
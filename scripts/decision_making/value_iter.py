@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Batched reward evaluation of the candidate steps for the value iteration of the DP planners.
+"""
+
+import numpy as np
+
+
+class PowerTable(object):
+    """
+    Lookup table of b ** d for the integer distances, one row per decay factor, extended on demand.
+    """
+
+    def __init__(self, max_dis=64):
+        self.max_dis = int(max_dis)
+        self.table_dict = dict()  # {tuple(b_values): b_values ** arange(max_dis + 1)}
+
+    def get(self, b_values, max_dis=0):
+        """
+        :param b_values: decay factors, shape=(k,)
+        :param max_dis: maximum distance to look up
+        :return: table[i, d] = b_values[i] ** d, shape=(k, >= max_dis + 1)
+        """
+        if max_dis > self.max_dis:
+            self.max_dis = int(max(max_dis, 2 * self.max_dis))
+            self.table_dict = dict()
+
+        _key = tuple(b_values)
+        if _key not in self.table_dict:
+            self.table_dict[_key] = np.asarray(b_values, dtype=float)[:, np.newaxis] ** np.arange(self.max_dis + 1)
+        return self.table_dict[_key]
+
+
+def get_bucket_reward(cand_dis, b_values, sum_r, power_table):
+    """
+    Accumulated reward of every candidate step: sum(r * b ** dis) over the ready instructions, where dis is the
+    shortest distance from the candidate step to the destination, i.e. MotionTable.get_dis of the state after the step.
+    The instructions are aggregated per (destination, b), so the cost only depends on the number of the buckets,
+    see InstructionStore.get_ready_buckets. An unreachable destination adds no reward.
+    :param cand_dis: distance from each candidate to all nodes, shape=(candidates, nodes)
+    :param b_values: distinct decay factors, shape=(k,)
+    :param sum_r: sum of r of the ready instructions per (destination, b), shape=(nodes, k)
+    :param power_table: PowerTable
+    :return: accumulated reward of each candidate, shape=(candidates,)
+    """
+    cand_dis = np.asarray(cand_dis)
+    _dest, _col = np.nonzero(sum_r)  # non-empty buckets
+    if len(_dest) == 0:
+        return np.zeros(cand_dis.shape[0])
+
+    _dis = cand_dis[:, _dest]
+    _reachable = np.isfinite(_dis)  # inf on a disconnected map graph, b ** inf = 0
+    _dis = np.where(_reachable, _dis, 0).astype(int)  # distances on the map graph are integer steps
+    _b_pow = power_table.get(b_values, np.max(_dis))
+    return np.sum(np.where(_reachable, sum_r[_dest, _col] * _b_pow[_col, _dis], 0.0), axis=1)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Online instruction streams for the benchmarks under sustained load, instead of the static batch of
+InstructionConstructor.test_scenario.
+The arrival process is one of
+    poisson: exponential inter-arrival times with the mean 3600 / rate seconds
+    diurnal: Poisson with the rate rate * (1 - amplitude * cos(2 pi t / period)), sampled by thinning
+    bursty:  bursts of geometric size (mean burst_size) arrive as a Poisson process, the instructions of a burst are
+             burst_gap seconds apart on average
+The instructions are drawn from the same task_loc, gamma_dict, b_dict and task_duration as the static scenarios, and a
+two-stage instruction ('check human' then 'report to source', see InstructionConstructor.verbal_cb) arrives with its
+second stage, which waits for the first one with prev_id.
+The streams are stored column by column in a .npz file.
+"""
+
+import numpy as np
+
+from decision_making.sim_engine import create_instr, task_loc, task_duration, gamma_dict, b_dict
+
+arrival_processes = ('poisson', 'diurnal', 'bursty')
+_columns = ['arrival', 'id', 'r', 'b', 'duration', 'destination', 'prev_id', 'function']
+
+
+def get_arrival_time(num, rate=60.0, process='poisson', rng=None, period=86400.0, amplitude=0.8, burst_size=5.0,
+                     burst_gap=5.0):
+    """
+    :param num: number of arrivals
+    :param rate: mean arrivals per hour
+    :param process: one of arrival_processes
+    :param rng: np.random.RandomState
+    :param period: seconds of a day of the diurnal process
+    :param amplitude: relative amplitude of the diurnal rate, in [0, 1]
+    :param burst_size: mean number of instructions of a burst
+    :param burst_gap: mean seconds between the instructions of a burst
+    :return: sorted arrival times in seconds from 0, shape=(num,)
+    """
+    if rng is None:
+        rng = np.random.RandomState()
+    _mean_gap = 3600.0 / rate
+
+    if process == 'poisson':
+        return np.cumsum(rng.exponential(_mean_gap, num))
+
+    if process == 'diurnal':
+        # thinning of a Poisson process with the peak rate
+        _peak_gap = _mean_gap / (1.0 + amplitude)
+        arrival = list()
+        t = 0.0
+        while len(arrival) < num:
+            t += rng.exponential(_peak_gap)
+            if rng.uniform() * (1.0 + amplitude) <= 1.0 - amplitude * np.cos(2.0 * np.pi * t / period):
+                arrival.append(t)
+        return np.array(arrival)
+
+    if process == 'bursty':
+        arrival = list()
+        t = 0.0
+        while len(arrival) < num:
+            t += rng.exponential(_mean_gap * burst_size)
+            _burst_t = t
+            for _ in xrange(rng.geometric(1.0 / burst_size)):
+                arrival.append(_burst_t)
+                _burst_t += rng.exponential(burst_gap)
+        return np.sort(arrival[:num])
+
+    raise ValueError('Invalid arrival process: {0}'.format(process))
+
+
+def generate_workload(num, rate=60.0, process='poisson', seed=1111, two_stage=0.0, start_time=1.0, **kwargs):
+    """
+    :param num: number of instructions, the second stages included
+    :param rate: mean instructions per hour
+    :param process: one of arrival_processes
+    :param seed: random seed
+    :param two_stage: probability that an arrival is a two-stage instruction
+    :param start_time: seconds after /instr_start_time of the first possible arrival
+    :param kwargs: the parameters of the arrival process, see get_arrival_time
+    :return: list of (arrival time in seconds, SimInstruction), sorted by arrival time
+    """
+    rng = np.random.RandomState(seed)
+    # the number of arrivals with the same expected number of instructions
+    arrival = get_arrival_time(num, rate / (1.0 + two_stage), process, rng, **kwargs) + start_time
+
+    priority = sorted(gamma_dict.keys())
+    workload = list()
+    for t in arrival:
+        if len(workload) >= num:
+            break
+        _p = priority[rng.randint(len(priority))]
+        _id = len(workload)
+        if two_stage > 0.0 and len(workload) + 1 < num and rng.uniform() < two_stage:
+            # check human, then report to the source
+            workload.append((t, create_instr(_id, gamma_dict[_p], b_dict[_p], int(rng.choice(task_duration)),
+                                             int(rng.choice(task_loc)), function=4)))
+            workload.append((t, create_instr(_id + 1, gamma_dict[_p], b_dict[_p], int(rng.choice(task_duration)),
+                                             int(rng.choice(task_loc)), prev_id=_id, function=9)))
+        else:
+            workload.append((t, create_instr(_id, gamma_dict[_p], b_dict[_p], int(rng.choice(task_duration)),
+                                             int(rng.choice(task_loc)))))
+    return workload
+
+
+def save_workload(workload, npz_file):
+    """
+    :param workload: list of (arrival time, SimInstruction)
+    :param npz_file: path of the .npz file, one array per column
+    """
+    np.savez_compressed(npz_file,
+                        arrival=np.array([t for t, _ in workload], dtype=float),
+                        id=np.array([instr.id for _, instr in workload], dtype=int),
+                        r=np.array([instr.r for _, instr in workload], dtype=float),
+                        b=np.array([instr.b for _, instr in workload], dtype=float),
+                        duration=np.array([instr.duration for _, instr in workload], dtype=float),
+                        destination=np.array([instr.destination for _, instr in workload], dtype=int),
+                        prev_id=np.array([instr.prev_id for _, instr in workload], dtype=int),
+                        function=np.array([instr.function for _, instr in workload], dtype=int))
+    return
+
+
+def load_workload(npz_file):
+    """
+    :return: list of (arrival time, SimInstruction) saved by save_workload
+    """
+    data = np.load(npz_file)
+    col = [data[c].tolist() for c in _columns]
+    return [(t, create_instr(*instr)) for t, instr in zip(col[0], zip(*col[1:]))]
+
+
+def get_load_summary(sim):
+    """
+    :param sim: DiscreteEventSim after running a workload
+    :return: {'done', 'expired' (number of the done and the evicted instructions), 'throughput' (instructions per
+             hour), 'latency_mean', 'latency_p95', 'latency_p99' (seconds from the arrival to the done time), 'reward'}
+    """
+    _expired = sim.expiry.expired_num if sim.expiry is not None else 0
+    if len(sim.latency_list) == 0:
+        return {'done': 0, 'expired': _expired, 'throughput': 0.0, 'latency_mean': 0.0, 'latency_p95': 0.0,
+                'latency_p99': 0.0, 'reward': sim.accu_r}
+
+    _span = sim.clock - min(sim.arrival_dict.itervalues())
+    latency = np.array(sim.latency_list)
+    return {'done': len(latency),
+            'expired': _expired,
+            'throughput': len(latency) * 3600.0 / max(_span, 1e-9),
+            'latency_mean': float(np.mean(latency)),
+            'latency_p95': float(np.percentile(latency, 95)),
+            'latency_p99': float(np.percentile(latency, 99)),
+            'reward': sim.accu_r}
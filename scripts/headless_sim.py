@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Run the *_sim planners on a virtual clock without ROS.
+Results are saved to sim_exp/instr_<max_num>_<seed> with the same layout as exp2, whose recorded experiments are
+only read, i.e. the instructions of exp2/instr_<max_num>_<seed>/instr.csv are simulated if it exists.
+With --instr_log, the arrivals of a recorded instruction log are replayed instead, and the done sequence and the
+reward are compared with the recorded ones.
+Ex: python headless_sim.py --planner dp,mcts --instr_log ../exp2/instr.log
+"""
+
+import os
+import time
+import argparse
+from decision_making import sim_engine
+from decision_making import instr_log
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Headless discrete-event simulation')
+    parser.add_argument('--planner', type=str, default='all', help='fcfs, pf, sf, rand, dp, opt or all')
+    parser.add_argument('--max_num', type=int, default=10)
+    parser.add_argument('--is_rand', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=1111)
+    parser.add_argument('--load_instr', type=int, default=1, help='load instr.csv if it exists')
+    parser.add_argument('--exp_dir', type=str, default=None, help='output directory, ../sim_exp by default')
+    parser.add_argument('--instr_log', type=str, default=None, help='replay the log of InstructionRecorder')
+    parser.add_argument('--record', type=int, default=0, help='record <planner>_instr.log of every run')
+    args = parser.parse_args()
+
+    if args.planner == 'all':
+        planner_list = sorted(sim_engine.sim_planners.keys())
+    else:
+        planner_list = args.planner.split(',')
+
+    if args.instr_log is not None:
+        event_list = instr_log.load_instr_log(args.instr_log)
+        log_done, log_reward = instr_log.get_done(event_list)
+        print 'Recorded: reward={0}, done={1}'.format(log_reward, log_done)
+
+        for p in planner_list:
+            s_time = time.time()
+            sim = sim_engine.run_stream(p, instr_log.get_arrival(event_list), seed=args.seed)  # at full speed
+            print '{0}: reward={1} ({2:+.4f}), first difference at {3}, done={4}, wall time={5} (s)'.format(
+                p, sim.accu_r, sim.accu_r - log_reward, instr_log.diff_done(log_done, sim.done_instr),
+                sim.done_instr, time.time() - s_time)
+
+    else:
+        _pkg_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        if args.exp_dir is None:
+            args.exp_dir = os.path.join(_pkg_dir, 'sim_exp')
+
+        _scenario = 'instr_' + str(args.max_num) + '_' + str(args.seed)
+        out_dir = os.path.join(args.exp_dir, _scenario)
+        instr_file = os.path.join(out_dir, 'instr.csv')
+        exp_instr_file = os.path.join(_pkg_dir, 'exp2', _scenario, 'instr.csv')  # of the recorded experiment
+
+        if not os.path.exists(out_dir):
+            os.makedirs(out_dir)
+
+        if args.load_instr == 1 and os.path.exists(instr_file):
+            instr_list = sim_engine.load_scenario(instr_file)
+            print 'Load instructions from: {0}'.format(instr_file)
+        elif args.load_instr == 1 and os.path.exists(exp_instr_file):
+            instr_list = sim_engine.load_scenario(exp_instr_file)
+            sim_engine.save_instr(instr_list, instr_file)
+            print 'Load instructions from: {0}'.format(exp_instr_file)
+        else:
+            instr_list = sim_engine.generate_scenario(args.max_num, args.seed, is_random=(args.is_rand == 1))
+            sim_engine.save_instr(instr_list, instr_file)
+
+        for p in planner_list:
+            s_time = time.time()
+            recorder = None
+            if args.record == 1:
+                _log_file = os.path.join(out_dir, sim_engine.sim_planners[p].base_name + '_instr.log')
+                recorder = instr_log.InstructionRecorder(_log_file)
+            sim = sim_engine.run_scenario(p, instr_list, out_dir=out_dir, seed=args.seed, recorder=recorder)
+            if recorder is not None:
+                recorder.close()
+            print '{0}: reward={1}, steps={2}, done={3}, wall time={4} (s)'.format(p, sim.accu_r,
+                                                                                      sim.clock / sim.sim_time_step,
+                                                                                      sim.done_instr,
+                                                                                      time.time() - s_time)
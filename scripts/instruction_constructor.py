@@ -9,13 +9,20 @@ import rospkg
 from jsk_gui_msgs.msg import VoiceMessage
 from thesis.msg import *
 from decision_making.node_viz import create_map_graph
+from decision_making.instr_store import InstructionStore
+from decision_making.instr_delta import InstructionSync
+from decision_making.instr_publisher import CoalescingPublisher
+from decision_making.instr_log import InstructionRecorder
+from decision_making.instr_journal import InstructionJournal
+from decision_making.instr_expiry import InstructionExpiry
 from std_msgs.msg import Int8
 import time
 import random
 import os
 import argparse
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 from perception import human_id
+from perception.phrase_matcher import PhraseMatcher
+from perception.sentiment import SentimentCache
 import copy
 import pandas as pd
 from robot_motions import tts_service
@@ -23,17 +30,46 @@ from robot_motions import tts_service
 
 class InstructionConstructor:
     def __init__(self):
-        self.instr_sub = rospy.Subscriber('/thesis/instruction_buffer', InstructionArray, self.instr_cb, queue_size=10)
+        self.instr_sub = rospy.Subscriber('/thesis/instruction_delta', InstructionDelta, self.instr_cb, queue_size=10)
         self.verbal_sub = rospy.Subscriber('/Tablet/voice', VoiceMessage, self.verbal_cb, queue_size=10)
         self.temp_sub = rospy.Subscriber('/thesis/int_buffer', Int8, self.int_cb, queue_size=10)
         self._pkg_dir = rospkg.RosPack().get_path('thesis')
 
-        self.instr_pub = rospy.Publisher('/thesis/instruction_buffer', InstructionArray, queue_size=1)
         self.map_graph = create_map_graph()
-        self.instr_dict = dict()
-        self.instr_dest_dict = {n: set() for n in self.map_graph.nodes}
+        self.instr_dict = InstructionStore(self.map_graph.nodes)
+        self.instr_dest_dict = self.instr_dict.dest_dict  # maintained by instr_dict
+        self.instr_sync = InstructionSync(self.instr_dict, rospy.get_name(), InstructionDelta)
+
+        # the instructions of an utterance go out together, once the planners subscribed
+        self.instr_pub = CoalescingPublisher('/thesis/instruction_delta', self.instr_sync,
+                                             window=rospy.get_param('/thesis/publish_window', 0.05),
+                                             min_peers=rospy.get_param('/thesis/min_peers', 1))
+        if rospy.has_param('/thesis/instr_log'):  # record the instruction stream for instruction_replayer.py
+            self.instr_sync.recorder = InstructionRecorder(
+                rospy.get_param('/thesis/instr_log'),
+                lambda: time.time() - rospy.get_param('/instr_start_time', time.time()))
+
+        # snapshot of the instruction buffer for the nodes joining late
+        self.snapshot_timer = rospy.Timer(rospy.Duration(rospy.get_param('/thesis/snapshot_period', 5.0)),
+                                          self.snapshot_cb)
         self.last_id = 0  # record the last id in current instruction buffer
 
+        # resume the instructions of the last run after a crash, see instr_journal
+        if rospy.has_param('/thesis/journal_dir'):
+            self.instr_journal = InstructionJournal(rospy.get_param('/thesis/journal_dir'), self.instr_sync,
+                                                    rospy.get_param('/thesis/journal_compact_num', 1000))
+            replay_num = self.instr_journal.recover()
+            self.last_id = max(self.instr_dict.keys() + list(self.instr_sync.done_id) + [self.instr_sync.done_floor]) + 1
+            rospy.loginfo('Recovered {0} instructions, {1} deltas replayed'.format(len(self.instr_dict), replay_num))
+
+        # evict the instructions whose reward drops below /thesis/expiry_epsilon, 0 to keep them all
+        self.sim_time_step = 2.0
+        self.instr_expiry = InstructionExpiry(self.instr_dict, rospy.get_param('/thesis/expiry_epsilon', 0.0),
+                                              self.sim_time_step)
+        if self.instr_expiry.epsilon > 0.0:
+            self.expiry_timer = rospy.Timer(rospy.Duration(rospy.get_param('/thesis/expiry_period', 1.0)),
+                                            self.expiry_cb)
+
         self.loc_symbol = {0: 'office', 1: 'bedroom', 2: 'charge', 3: 'alley1', 4: 'alley2',
                            5: 'livingroom', 6: 'diningroom', 7: 'greet', 8: 'emergency'}
 
@@ -65,14 +101,16 @@ class InstructionConstructor:
                          [10],
                          [5]]
 
-        self.verbal_instr = zip(trigger_words, trigger_instr)
+        self.verbal_instr = PhraseMatcher(zip(trigger_words, trigger_instr))
         del trigger_words
         del trigger_instr
 
-        self.analyser = SentimentIntensityAnalyzer()  # analyze human emotion sentiment
+        # analyze human emotion sentiment, cached since the same phrases come again and again
+        self.analyser = SentimentCache(rospy.get_param('/thesis/sentiment_cache_size', 1024))
 
         # human_dict = {'name':{'Name': Human()}, 'ip':{'192.168.0.xxx':'Name'}}
         self.human_dict = human_id.load_human_info2dict(rospkg.RosPack().get_path('thesis') + '/human_info/')
+        human_id.get_ip_resolver()  # resolve the tablets before the first voice message
 
         # ignore emergency tasks
         self.task_loc = [0, 1, 2, 5, 6, 7]
@@ -87,37 +125,50 @@ class InstructionConstructor:
         self.task_priority = sorted(self.gamma_dict.keys())
         self.dur_dict = {0: 3, 1: 5, 2: 8, 3: 8, 4: 15, 5: 10, 6: 15, 7: 30, 8: 60, 9: 10, 10: 60}  # {function: time(sec)}
 
-    def instr_cb(self, in_instructions):
+    def instr_cb(self, in_delta):
         rospy.logdebug('instruction callback')
-        self.instr_dict = dict()
 
-        # Convert InstructionArray into dictionary
-        if type(in_instructions) == thesis.msg._InstructionArray.InstructionArray:
+        # Apply the done instructions from the planner
+        if self.instr_sync.apply(in_delta):
+            rospy.logdebug('After instruction callback ...')
+            self.show_instr()
+        return
 
-            for instr in in_instructions.data:
-                self.instr_dest_dict[instr.destination].add(instr.id)
-                self.instr_dict[instr.id] = instr
+    def snapshot_cb(self, event):
+        if len(self.instr_dict) > 0:
+            self.instr_pub.snapshot()
+        return
 
-        rospy.logdebug('After instruction callback ...')
-        self.show_instr()
+    def expiry_cb(self, event):
+        """
+        Cancel the expired instructions on /thesis/instruction_delta, so the planners drop them too.
+        """
+        if len(self.instr_dict) > 0:
+            _cur_step = (time.time() - rospy.get_param('/instr_start_time', time.time())) / self.sim_time_step
+            with self.instr_sync.lock:  # instr_cb applies the deltas in another thread
+                expired_id = self.instr_expiry.expire(_cur_step)
+            if len(expired_id) > 0:
+                self.instr_pub.cancel(expired_id)
+                rospy.loginfo('Expired instructions: {0}'.format(expired_id))
+                rospy.set_param('/thesis/expired_num', self.instr_expiry.expired_num)
         return
 
     def int_cb(self, in_int):
-        self.instr_dict[self.last_id] = Instruction(id=self.last_id,
-                                                    type=0,
-                                                    duration=1,
-                                                    source='Charlie',
-                                                    status=0,
-                                                    r=1,
-                                                    b=0.9,
-                                                    function=0,
-                                                    target='Bob',
-                                                    destination=in_int.data,
-                                                    prev_id=-1,
-                                                    start_time=time.time())
+        temp_instr = Instruction(id=self.last_id,
+                                 type=0,
+                                 duration=1,
+                                 source='Charlie',
+                                 status=0,
+                                 r=1,
+                                 b=0.9,
+                                 function=0,
+                                 target='Bob',
+                                 destination=in_int.data,
+                                 prev_id=-1,
+                                 start_time=time.time())
         self.last_id += 1
 
-        self.launch_instr()
+        self.launch_instr([temp_instr])
         return
 
     def show_instr(self):
@@ -168,46 +219,45 @@ class InstructionConstructor:
                     instr_target = instr_source
 
             last_id_buf = copy.copy(self.last_id)
+            new_instr_list = list()
 
             # Check function
-            for w in words:
-                for ver_i in self.verbal_instr:
-                    if w in ver_i[0]:
-                        print ver_i[1]
-
-                        for i in range(len(ver_i[1])):
-                            if ver_i[1][i] == 8:  # physical request
-                                emotion = 3
-
-                            if ver_i[1][i] == 9:  # report to source
-                                temp_des = self.human_dict['name'][instr_source].location
-                            elif ver_i[1][i] == 10:  # welcome guest
-                                temp_des = 7
-                            elif ver_i[1][i] == 5:
-                                temp_des = 2
-                            else:
-                                temp_des = self.human_dict['name'][instr_target].location
-
-                                # if instr_source == 'Alfred':
-                                #     temp_des = 8
-                                # else:
-                                #     temp_des = self.human_dict['name'][instr_target].location
-
-                            temp_instr = Instruction(id=self.last_id,
-                                                     r=self.gamma_dict[emotion+2],
-                                                     b=self.b_dict[emotion+2],
-                                                     type=0,
-                                                     duration=self.dur_dict[ver_i[1][i]],
-                                                     source=instr_source,
-                                                     status=emotion,
-                                                     function=ver_i[1][i],
-                                                     target=instr_target,
-                                                     destination=temp_des,
-                                                     start_time=time.time(),
-                                                     prev_id=self.last_id-1 if i > 0 else -1)
-
-                            self.instr_dict[temp_instr.id] = temp_instr
-                            self.last_id += 1
+            for _, ver_i in self.verbal_instr.match(voice_data.texts[0]):
+                print ver_i
+
+                for i in range(len(ver_i)):
+                    if ver_i[i] == 8:  # physical request
+                        emotion = 3
+
+                    if ver_i[i] == 9:  # report to source
+                        temp_des = self.human_dict['name'][instr_source].location
+                    elif ver_i[i] == 10:  # welcome guest
+                        temp_des = 7
+                    elif ver_i[i] == 5:
+                        temp_des = 2
+                    else:
+                        temp_des = self.human_dict['name'][instr_target].location
+
+                        # if instr_source == 'Alfred':
+                        #     temp_des = 8
+                        # else:
+                        #     temp_des = self.human_dict['name'][instr_target].location
+
+                    temp_instr = Instruction(id=self.last_id,
+                                             r=self.gamma_dict[emotion+2],
+                                             b=self.b_dict[emotion+2],
+                                             type=0,
+                                             duration=self.dur_dict[ver_i[i]],
+                                             source=instr_source,
+                                             status=emotion,
+                                             function=ver_i[i],
+                                             target=instr_target,
+                                             destination=temp_des,
+                                             start_time=time.time(),
+                                             prev_id=self.last_id-1 if i > 0 else -1)
+
+                    new_instr_list.append(temp_instr)
+                    self.last_id += 1
             # if last_id_buf == self.last_id:  # NOP for not detecting key words
             #     temp_instr = Instruction(id=self.last_id,
             #                              r=self.gamma_dict[emotion+2],
@@ -224,23 +274,19 @@ class InstructionConstructor:
             #     self.last_id += 1
             #     self.instr_dict[temp_instr.id] = temp_instr
 
-            if len(self.instr_dict) > 0:
+            if len(new_instr_list) > 0:
                 tts_service.say('Ok, I got it.')
-                self.launch_instr()
+                self.launch_instr(new_instr_list)
         return
 
-    def launch_instr(self):
+    def launch_instr(self, new_instr_list):
+        """
+        Add the new instructions to the buffer and publish them to /thesis/instruction_delta, coalesced with the ones
+        launched within /thesis/publish_window seconds.
+        :param new_instr_list: list of Instruction
+        """
         rospy.loginfo('Launching instructions!')
-        _instr_list = InstructionArray()
-        for key, instr in self.instr_dict.iteritems():
-            _instr_list.data.append(instr)
-
-        # Update maximum instruction id
-        # if len(self.instr_dict.keys()) > 0:
-        #     self.last_id = max(self.instr_dict.keys())
-
-        rospy.sleep(1)
-        self.instr_pub.publish(_instr_list)
+        self.instr_pub.add(new_instr_list)
         return
 
     def save_instr(self):
@@ -325,21 +371,18 @@ class InstructionConstructor:
 
         start_time = time.time()
         rospy.set_param('/instr_start_time', start_time)
-        self.launch_instr()
+        self.launch_instr(self.instr_dict.values())
         rospy.sleep(t)
 
+        # instr_cb removes the instructions completed by the planner
         while not rospy.is_shutdown():
-            try:
-                temp_instr = rospy.wait_for_message('/thesis/instruction_buffer', InstructionArray, timeout=0.5)
-                if len(temp_instr.data) == 0:
-                    end_time = time.time()
-                    rospy.loginfo('Task duration: {0} (s)'.format(sum(d_list)))
-                    rospy.loginfo('Total process time: {0} (s)'.format(end_time - start_time - t))
-                    rospy.loginfo('Navigation process time: {0} (s)'.format(end_time - start_time - t - sum(d_list)))
-                    break
-
-            except rospy.ROSException:  # timeout
-                pass
+            if len(self.instr_dict) == 0:
+                end_time = time.time()
+                rospy.loginfo('Task duration: {0} (s)'.format(sum(d_list)))
+                rospy.loginfo('Total process time: {0} (s)'.format(end_time - start_time - t))
+                rospy.loginfo('Navigation process time: {0} (s)'.format(end_time - start_time - t - sum(d_list)))
+                break
+            rospy.sleep(0.5)
 
         return
 
@@ -358,7 +401,7 @@ class InstructionConstructor:
 
         start_time = time.time()
         rospy.set_param('/instr_start_time', start_time)
-        self.launch_instr()
+        self.launch_instr([temp_init])
         rospy.sleep(t)
 
         while not rospy.is_shutdown():
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Replay the instruction log of InstructionRecorder on /thesis/instruction_delta, in place of instruction_constructor.py.
+The arrivals keep their recorded times after /instr_start_time, divided by ~time_scale, and the cancellations are
+replayed as well. The completions are left to the planner under test, whose own log (~instr_log of the planner) can be
+compared with the recorded one, see headless_sim.py --instr_log for the replay without ROS.
+Ex: rosrun thesis instruction_replayer.py _instr_log:=/path/to/instr.log _time_scale:=2.0
+"""
+
+import os
+import time
+import rospy
+from thesis.msg import *
+from decision_making.node_viz import create_map_graph
+from decision_making.instr_store import InstructionStore
+from decision_making.instr_delta import InstructionSync, CANCEL
+from decision_making.instr_log import load_instr_log, get_arrival
+
+
+class InstructionReplayer:
+    def __init__(self):
+        self.instr_pub = rospy.Publisher('/thesis/instruction_delta', InstructionDelta, queue_size=10)
+        self.instr_sub = rospy.Subscriber('/thesis/instruction_delta', InstructionDelta, self.instr_cb, queue_size=10)
+        self.map_graph = create_map_graph()
+        self.instr_dict = InstructionStore(self.map_graph.nodes)
+        self.instr_sync = InstructionSync(self.instr_dict, rospy.get_name(), InstructionDelta)
+
+        self.event_list = load_instr_log(rospy.get_param('~instr_log'))
+        self.time_scale = float(rospy.get_param('~time_scale', 1.0))  # 2.0 for twice as fast
+
+        rospy.loginfo('Instruction replayer initialized with {0} events!'.format(len(self.event_list)))
+
+    def instr_cb(self, in_delta):
+        # the instructions done by the planner
+        self.instr_sync.apply(in_delta)
+        return
+
+    def get_schedule(self):
+        """
+        :return: list of (seconds after /instr_start_time, op, list of Instruction or ids), sorted by time
+        """
+        schedule = dict()  # {time: list of Instruction}
+        for arrival_time, instr in get_arrival(self.event_list):
+            schedule.setdefault(arrival_time, list()).append(
+                Instruction(id=instr.id, type=0, duration=int(instr.duration), source='', status=0, r=instr.r,
+                            b=instr.b, function=instr.function, target='', destination=instr.destination,
+                            prev_id=instr.prev_id, start_time=0.0))
+
+        _schedule = [(t, 0, instr_list) for t, instr_list in schedule.iteritems()]
+        _schedule += [(t, 1, id_list) for t, op, id_list in self.event_list if op == CANCEL]
+        return sorted(_schedule)
+
+    def run(self):
+        schedule = self.get_schedule()
+
+        t = 1
+        rospy.loginfo('Sleep for {0} seconds'.format(str(t)))
+        rospy.sleep(t)
+
+        start_time = time.time()
+        rospy.set_param('/instr_start_time', start_time)
+
+        for event_time, is_cancel, data in schedule:
+            _wait = start_time + event_time / self.time_scale - time.time()
+            if _wait > 0.0:
+                rospy.sleep(_wait)
+            if rospy.is_shutdown():
+                break
+
+            if is_cancel:
+                _cancel_id = [instr_id for instr_id in data if instr_id in self.instr_dict]
+                if len(_cancel_id) > 0:
+                    self.instr_pub.publish(self.instr_sync.cancel(_cancel_id))
+            else:
+                for instr in data:
+                    instr.start_time = time.time()
+                self.instr_pub.publish(self.instr_sync.add(data))
+            rospy.loginfo('Replay at {0:.2f} s: {1}'.format(event_time,
+                                                            data if is_cancel else [instr.id for instr in data]))
+
+        # wait until the planner completes all the instructions
+        while not rospy.is_shutdown() and len(self.instr_dict) > 0:
+            rospy.sleep(0.5)
+        rospy.loginfo('Replay done in {0} (s)'.format(time.time() - start_time))
+        return
+
+
+if __name__ == '__main__':
+    rospy.init_node(os.path.basename(__file__).split('.')[0], log_level=rospy.INFO)
+    replayer = InstructionReplayer()
+    replayer.run()
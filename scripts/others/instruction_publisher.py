@@ -4,6 +4,7 @@
 Construct instructions based on human request and robot perception.
 """
 
+import time
 import rospy
 from thesis.msg import *
 
@@ -17,7 +18,7 @@ def get_instr_dest(in_instruction):
 
 if __name__ == '__main__':
     rospy.init_node('instruction_publisher', anonymous=True, log_level=rospy.INFO)
-    instr_pub = rospy.Publisher('/thesis/instruction_buffer', InstructionArray, queue_size=1)
+    instr_pub = rospy.Publisher('/thesis/instruction_delta', InstructionDelta, queue_size=10)
     rospy.loginfo('instruction_constructor start!')
 
     loc_symbol = {0: 'office',
@@ -53,15 +54,16 @@ if __name__ == '__main__':
     instruction_node_set = list(instruction_node_set)
     print 'instruction_node_set = ', instruction_node_set
 
-    rospy.sleep(1)
-    instr_pub.publish(i_list)
+    rospy.sleep(1)  # wait for the subscribers to connect
+    instr_pub.publish(source=rospy.get_name(), epoch=time.time(), seq=1, op=InstructionDelta.ADD, data=i_list,
+                      id=[])
     # instr_dest_pub.publish(instruction_node_set)
 
     rospy.loginfo('Publish instructions first.')
     # rospy.sleep(20)
     #
     # rospy.loginfo('Wait for undo instructions ...')
-    # i_list = rospy.wait_for_message('/thesis/instruction_buffer', InstructionArray, timeout=10)
+    # i_list = rospy.wait_for_message('/thesis/instruction_delta', InstructionDelta, timeout=10)
     # for i in range(max_num, len(des)):
     #     temp_i = Instruction(id=last_id, type=0, duration=1, source='Charlie', status=0, r=r_list[i], b=b_list[i],
     #                          function=0, target='Bob', destination=des[i])
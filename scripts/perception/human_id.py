@@ -16,6 +16,7 @@ from rospy_message_converter import message_converter
 
 import sys
 import os
+import socket
 import qi
 
 import cv2
@@ -51,11 +52,73 @@ asr_service = session.service("ALAnimatedSpeech")
 # end for demo
 
 
+class CallerIpResolver(object):
+    def __init__(self, topic=None, period=5.0):
+        """
+        Cache of callerid -> ip, so the voice callbacks do not wait for the ROS master. The cache is rebuilt from the
+        master every period on a rospy.Timer, which drops the nodes that left and follows the nodes registered again
+        with another uri.
+        :param topic: only resolve the publishers of the topic, e.g. '/Tablet/voice', all the publishers if None
+        :param period: seconds between the refreshes
+        """
+        self.topic = topic
+        self._master = rosgraph.Master(rospy.get_name())
+        self._ip_dict = dict()  # {callerid: ip}, replaced as a whole by refresh
+        self.refresh()
+        self._timer = rospy.Timer(rospy.Duration(period), self.refresh)
+
+    @staticmethod
+    def uri2ip(uri):
+        return uri.split(':')[1][2:]  # 'http://192.168.0.xxx:port/' -> '192.168.0.xxx'
+
+    def refresh(self, event=None):
+        try:
+            pub_list, _, _ = self._master.getSystemState()
+        except (socket.error, rosgraph.MasterException) as e:
+            rospy.logwarn('Failed to get the system state: {0}'.format(e))
+            return
+
+        callerid_set = set()
+        for topic, node_list in pub_list:
+            if self.topic is None or topic == self.topic:
+                callerid_set.update(node_list)
+
+        ip_dict = dict()
+        for callerid in callerid_set:
+            try:
+                ip_dict[callerid] = self.uri2ip(self._master.lookupNode(callerid))
+            except (socket.error, rosgraph.MasterException):
+                continue  # unregistered since getSystemState
+        self._ip_dict = ip_dict
+        return
+
+    def get_ip(self, callerid):
+        """
+        :return: ip of the node, looked up on the master only if it joined after the last refresh
+        """
+        ip_num = self._ip_dict.get(callerid)
+        if ip_num is None:
+            ip_num = self.uri2ip(self._master.lookupNode(callerid))
+            self._ip_dict[callerid] = ip_num
+        return ip_num
+
+
+_ip_resolver = None
+
+
+def get_ip_resolver():
+    """
+    :return: the CallerIpResolver of /Tablet/voice, created on the first call
+    """
+    global _ip_resolver
+    if _ip_resolver is None:
+        _ip_resolver = CallerIpResolver('/Tablet/voice', rospy.get_param('/thesis/ip_refresh_period', 5.0))
+    return _ip_resolver
+
+
 def get_ip(data):
     callerid = data._connection_header['callerid']  # type: 'str'
-    master = rosgraph.Master('listener')
-    ip = master.lookupNode(callerid)
-    ip_num = ip.split(':')[1][2:]  # type: 'str'
+    ip_num = get_ip_resolver().get_ip(callerid)  # type: 'str'
 
     print 'ip_num = ', ip_num
     print 'data = ', data
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Keyword spotting of the verbal requests. The trigger phrases are compiled once into a token trie, so an utterance is
+matched in one pass over its words, and the multi-word phrases like 'sore throat' or 'cell phone' are matched as well.
+"""
+
+
+class PhraseMatcher(object):
+    def __init__(self, trigger_list):
+        """
+        :param trigger_list: list of (set of trigger phrases, value), e.g. ({'chat', 'talk'}, [1])
+        """
+        self._trie = dict()  # {token: ({next token: ...}, list of the values ending at the token)}
+        self.max_len = 0
+        for phrase_set, value in trigger_list:
+            for phrase in phrase_set:
+                tokens = self.tokenize(phrase)
+                if len(tokens) == 0:
+                    continue
+                node = self._trie
+                for token in tokens[:-1]:
+                    node = node.setdefault(token, (dict(), list()))[0]
+                _values = node.setdefault(tokens[-1], (dict(), list()))[1]
+                if value not in _values:  # duplicated phrases of the same trigger
+                    _values.append(value)
+                self.max_len = max(self.max_len, len(tokens))
+
+    @staticmethod
+    def tokenize(text):
+        return text.lower().split()
+
+    def match(self, text):
+        """
+        :param text: utterance
+        :return: list of (word index, value) of the triggered phrases, in the order of the utterance
+        """
+        tokens = self.tokenize(text)
+        matched = list()
+        for idx in xrange(len(tokens)):
+            node = self._trie
+            for token in tokens[idx:idx + self.max_len]:
+                if token not in node:
+                    break
+                node, values = node[token]
+                matched.extend((idx, value) for value in values)
+        return matched
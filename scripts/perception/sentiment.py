@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+VADER sentiment of the verbal requests with an LRU cache, since the tablet sends the same phrases again and again.
+The text is normalized by collapsing the white spaces only, which VADER ignores as well, so the cached scores are the
+same as the ones of SentimentIntensityAnalyzer. The lexicon is loaded on the first miss instead of the node startup.
+"""
+
+from collections import OrderedDict
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+
+
+class SentimentCache(object):
+    def __init__(self, max_size=1024):
+        """
+        :param max_size: maximum number of the cached texts
+        """
+        self.max_size = max_size
+        self._analyser = None
+        self._cache = OrderedDict()  # {normalized text: scores}, the least recently used first
+        self.hit_num = 0
+        self.miss_num = 0
+
+    @property
+    def analyser(self):
+        if self._analyser is None:
+            self._analyser = SentimentIntensityAnalyzer()
+        return self._analyser
+
+    @staticmethod
+    def normalize(text):
+        return ' '.join(text.split())
+
+    def polarity_scores(self, text):
+        """
+        :param text: utterance
+        :return: {'neg', 'neu', 'pos', 'compound'} of SentimentIntensityAnalyzer.polarity_scores
+        """
+        key = self.normalize(text)
+        scores = self._cache.pop(key, None)
+        if scores is None:
+            self.miss_num += 1
+            scores = self.analyser.polarity_scores(key)
+            if len(self._cache) >= self.max_size:
+                self._cache.popitem(last=False)
+        else:
+            self.hit_num += 1
+        self._cache[key] = scores  # the most recently used
+        return dict(scores)  # a copy, the cached one stays unchanged
+
+    def polarity_scores_batch(self, text_list):
+        """
+        :param text_list: utterances, e.g. the transcripts of a replayed session
+        :return: list of the scores, each distinct text is scored once
+        """
+        scores_dict = dict()  # {normalized text: scores} of the batch, even if evicted from the cache meanwhile
+        scores_list = list()
+        for text in text_list:
+            key = self.normalize(text)
+            if key not in scores_dict:
+                scores_dict[key] = self.polarity_scores(key)
+            scores_list.append(dict(scores_dict[key]))
+        return scores_list
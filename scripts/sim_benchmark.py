@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Benchmark the planners on planners x max_num x seeds with the headless simulation, in parallel.
+The results are saved to sim_exp/instr_<max_num>_<seed> with the same layout as exp2, plus *_plan_stats.csv /
+*_plan_hist.csv with the plan time, the instructions and the evaluations of every decision, so the draw_* scripts in
+others/ work as they are.
+With --arrival poisson, diurnal or bursty, the instructions arrive online as a stream of decision_making.workload
+(stream_<arrival>_<max_num>_<seed>/workload.npz), and the throughput and the latency under the load are reported too.
+Ex: python sim_benchmark.py --planner fcfs pf sf dp --max_num 10 20 --seed 1000 1010
+Ex: python sim_benchmark.py --planner sf dp --max_num 500 --arrival poisson --rate 120 --two_stage 0.2 --epsilon 1e-3
+"""
+
+import os
+import time
+import argparse
+import multiprocessing
+import pandas as pd
+
+from decision_making import sim_engine
+from decision_making import workload
+
+
+def prepare_scenario(out_dir, max_num, seed, is_rand=True):
+    """
+    Load instr.csv of the scenario, or generate and save it as InstructionConstructor.save_instr.
+    :return: directory of the scenario, list of SimInstruction
+    """
+    dir_name = os.path.join(out_dir, 'instr_' + str(max_num) + '_' + str(seed))
+    csv_file = os.path.join(dir_name, 'instr.csv')
+
+    if os.path.exists(csv_file):
+        return dir_name, sim_engine.load_scenario(csv_file)
+
+    if not os.path.exists(dir_name):
+        os.makedirs(dir_name)
+
+    # the scenario of the recorded experiment, which is only read
+    exp_csv_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'exp2',
+                                'instr_' + str(max_num) + '_' + str(seed), 'instr.csv')
+    if os.path.exists(exp_csv_file):
+        instr_list = sim_engine.load_scenario(exp_csv_file)
+        sim_engine.save_instr(instr_list, csv_file)
+        return dir_name, instr_list
+
+    instr_list = sim_engine.generate_scenario(max_num, seed, is_rand)
+    sim_engine.save_instr(instr_list, csv_file)
+    return dir_name, instr_list
+
+
+def prepare_workload(out_dir, max_num, seed, arrival, rate, two_stage):
+    """
+    Load workload.npz of the stream, or generate and save it.
+    :return: directory of the stream, list of (arrival time, SimInstruction)
+    """
+    dir_name = os.path.join(out_dir, 'stream_' + arrival + '_' + str(max_num) + '_' + str(seed))
+    npz_file = os.path.join(dir_name, 'workload.npz')
+
+    if os.path.exists(npz_file):
+        return dir_name, workload.load_workload(npz_file)
+
+    if not os.path.exists(dir_name):
+        os.makedirs(dir_name)
+    arrival_list = workload.generate_workload(max_num, rate, arrival, seed, two_stage)
+    workload.save_workload(arrival_list, npz_file)
+    return dir_name, arrival_list
+
+
+def run_job(job):
+    """
+    Worker of the process pool.
+    :param job: (planner name, max_num, seed, directory of the scenario, list of SimInstruction, is_stream, epsilon),
+                the list is of (arrival time, SimInstruction) if is_stream
+    :return: summary of the run
+    """
+    planner_name, max_num, seed, dir_name, instr_list, is_stream, epsilon = job
+    s_time = time.time()
+    if is_stream:
+        sim = sim_engine.run_stream(planner_name, instr_list, out_dir=dir_name, seed=seed, epsilon=epsilon)
+    else:
+        sim = sim_engine.run_scenario(planner_name, instr_list, out_dir=dir_name, seed=seed, epsilon=epsilon)
+    _summary = sim.plan_stats.summary()
+    _load = workload.get_load_summary(sim)
+    return {'planner': planner_name,
+            'max_num': max_num,
+            'seed': seed,
+            'reward': sim.accu_r,
+            'time': sim.clock / sim.sim_time_step,
+            'plan_time': sim.plan_time,
+            'decision': sim.plan_stats.count,
+            'plan_p95': _summary['p95'],
+            'plan_p99': _summary['p99'],
+            'eval_mean': _summary['eval_mean'],
+            'done': _load['done'],
+            'expired': _load['expired'],
+            'throughput': _load['throughput'],
+            'latency_mean': _load['latency_mean'],
+            'latency_p95': _load['latency_p95'],
+            'latency_p99': _load['latency_p99'],
+            'wall_time': time.time() - s_time}
+
+
+def run_benchmark(planner_list, max_num_list, seed_list, out_dir, proc_num=None, is_rand=True, arrival='batch',
+                  rate=60.0, two_stage=0.0, epsilon=None):
+    """
+    :param planner_list: keys of sim_engine.sim_planners
+    :param max_num_list: numbers of instructions
+    :param seed_list: random seeds of the scenarios
+    :param out_dir: directory of instr_<max_num>_<seed>
+    :param proc_num: number of processes, all the cores if None
+    :param is_rand: False for the fixed test instructions
+    :param arrival: 'batch' for the static scenarios, or one of workload.arrival_processes
+    :param rate: mean instructions per hour of the stream
+    :param two_stage: probability of the two-stage instructions of the stream
+    :param epsilon: evict the instructions whose reward drops below epsilon, never if None
+    :return: pd.DataFrame of the summaries
+    """
+    for planner_name in planner_list:
+        if planner_name not in sim_engine.sim_planners:
+            raise ValueError('Invalid planner: {0}'.format(planner_name))
+
+    # the scenarios are prepared first, so the workers never write the same instr.csv
+    job_list = list()
+    for max_num in max_num_list:
+        for seed in seed_list:
+            if arrival == 'batch':
+                dir_name, instr_list = prepare_scenario(out_dir, max_num, seed, is_rand)
+            else:
+                dir_name, instr_list = prepare_workload(out_dir, max_num, seed, arrival, rate, two_stage)
+            for planner_name in planner_list:
+                job_list.append((planner_name, max_num, seed, dir_name, instr_list, arrival != 'batch', epsilon))
+
+    pool = multiprocessing.Pool(proc_num)
+    try:
+        result_list = list()
+        for result in pool.imap_unordered(run_job, job_list):
+            print '{planner:>5} instr_{max_num}_{seed}: reward {reward:.4f}, plan time {plan_time:.4f} s'.format(**result)
+            result_list.append(result)
+    finally:
+        pool.close()
+        pool.join()
+
+    result_df = pd.DataFrame(result_list, columns=['planner', 'max_num', 'seed', 'reward', 'time', 'plan_time',
+                                                   'decision', 'plan_p95', 'plan_p99', 'eval_mean', 'done',
+                                                   'expired', 'throughput', 'latency_mean', 'latency_p95',
+                                                   'latency_p99', 'wall_time'])
+    return result_df.sort_values(['max_num', 'seed', 'planner']).reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the planners with the headless simulation')
+    parser.add_argument('--planner', type=str, nargs='+', default=['fcfs', 'pf', 'sf', 'rand', 'dp', 'opt'])
+    parser.add_argument('--max_num', type=int, nargs='+', default=[10])
+    parser.add_argument('--seed', type=int, nargs=2, default=[1000, 1010], help='range of seeds, [start, end)')
+    parser.add_argument('--is_rand', type=int, default=1)
+    parser.add_argument('--arrival', type=str, default='batch',
+                        choices=('batch',) + workload.arrival_processes, help='batch at t=0, or an online stream')
+    parser.add_argument('--rate', type=float, default=60.0, help='instructions per hour of the stream')
+    parser.add_argument('--two_stage', type=float, default=0.0, help='probability of two-stage instructions')
+    parser.add_argument('--epsilon', type=float, default=None, help='evict the instructions below this reward')
+    parser.add_argument('--proc', type=int, default=None, help='number of processes, all the cores by default')
+    parser.add_argument('--out_dir', type=str,
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sim_exp'),
+                        help='output directory, kept apart from the recorded experiments of exp2')
+    args = parser.parse_args()
+
+    s_time = time.time()
+    out_df = run_benchmark(args.planner, args.max_num, range(args.seed[0], args.seed[1]), args.out_dir, args.proc,
+                           bool(args.is_rand), args.arrival, args.rate, args.two_stage,
+                           args.epsilon)
+    out_df.to_csv(os.path.join(args.out_dir, 'benchmark.csv' if args.arrival == 'batch' else
+                               'benchmark_' + args.arrival + '.csv'), index=False)
+
+    if args.arrival == 'batch':
+        _columns = ['reward', 'plan_time', 'decision', 'plan_p95', 'eval_mean']
+    else:
+        _columns = ['done', 'expired', 'throughput', 'latency_mean', 'latency_p95', 'latency_p99', 'reward']
+    print out_df.groupby(['max_num', 'planner'])[_columns].mean()
+    print 'Done in {0:.2f} s'.format(time.time() - s_time)
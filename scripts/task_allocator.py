@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Allocate the instructions on /thesis/instruction_delta across several robots on the same map graph.
+Every robot runs one of the task_motion_planner_* nodes in its own namespace, e.g. /robot_1, and only receives its
+share of the instructions on /<robot>/thesis/instruction_delta. The done instructions of the robots are forwarded to
+/thesis/instruction_delta, and the instructions are allocated again when new ones arrive or a robot finishes one.
+The stages of a two-stage instruction go to the same robot, whose planner waits for the first one as usual.
+The instruction a robot heads to or does, from /<robot>/thesis/target_id, stays with the robot and is never cancelled.
+Ex: rosparam set /thesis/robots "[robot_1, robot_2]"; rosrun thesis task_allocator.py
+"""
+
+import os
+import time
+import rospy
+from std_msgs.msg import String, Int32
+from thesis.msg import *
+from decision_making.map_graph import create_map_graph, MotionTable
+from decision_making.sparse_graph import load_map_graph, load_route_table, get_csr_adjacency
+from decision_making.instr_store import InstructionStore
+from decision_making.instr_delta import InstructionSync, COMPLETE
+from decision_making.multi_robot import FleetAllocator
+
+
+class TaskAllocator:
+    def __init__(self):
+        self.robot_names = rospy.get_param('/thesis/robots', ['robot_1', 'robot_2'])
+
+        # the same map graph as the planners
+        self.map_graph = create_map_graph()
+        if rospy.has_param('/thesis/map_file'):
+            self.map_graph = load_map_graph(rospy.get_param('/thesis/map_file'),
+                                            rospy.get_param('/thesis/map_node_file', None))
+        self.csr_adjacency = get_csr_adjacency(self.map_graph)
+        self.route_table = load_route_table(self.map_graph)
+        self.shortest_path = self.route_table.shortest_path
+        self.motion_table = MotionTable(self.csr_adjacency, self.shortest_path)
+        self.sim_time_step = 2.0
+        self.allocator = FleetAllocator(self.motion_table, self.shortest_path, self.sim_time_step)
+        self.label_state = {self.motion_table.get_label(s): s for s in range(self.motion_table.state_num)}
+
+        # all the undone instructions
+        self.instr_dict = InstructionStore(self.map_graph.nodes)
+        self.instr_sync = InstructionSync(self.instr_dict, rospy.get_name(), InstructionDelta)
+
+        # the share of each robot, and its position from /<robot>/thesis/robot_node
+        self.robot_dict = dict()  # {robot name: InstructionStore}
+        self.robot_sync = dict()  # {robot name: InstructionSync}
+        self.robot_pub = dict()
+        self.robot_state = dict()
+        self.robot_seq = {name: list() for name in self.robot_names}
+        self.robot_target = {name: -1 for name in self.robot_names}  # from /<robot>/thesis/target_id
+        for name in self.robot_names:
+            self.robot_dict[name] = InstructionStore(self.map_graph.nodes)
+            self.robot_sync[name] = InstructionSync(self.robot_dict[name], rospy.get_name(), InstructionDelta)
+            self.robot_pub[name] = rospy.Publisher('/' + name + '/thesis/instruction_delta', InstructionDelta,
+                                                   queue_size=10)
+            self.robot_state[name] = self.motion_table.get_state(
+                rospy.get_param('/' + name + '/thesis/pepper_location', 2))
+
+        self.delta_pub = rospy.Publisher('/thesis/instruction_delta', InstructionDelta, queue_size=10)
+        self.delta_sub = rospy.Subscriber('/thesis/instruction_delta', InstructionDelta, self.delta_cb, queue_size=10)
+        for name in self.robot_names:
+            rospy.Subscriber('/' + name + '/thesis/instruction_delta', InstructionDelta, self.robot_delta_cb,
+                             callback_args=name, queue_size=10)
+            rospy.Subscriber('/' + name + '/thesis/robot_node', String, self.robot_node_cb, callback_args=name,
+                             queue_size=2)
+            rospy.Subscriber('/' + name + '/thesis/target_id', Int32, self.robot_target_cb, callback_args=name,
+                             queue_size=2)
+
+        # for experiment evaluations
+        self.plan_time = 0.0
+
+        rospy.loginfo('Task allocator for {0} initialized!'.format(self.robot_names))
+
+    def delta_cb(self, in_delta):
+        """
+        New, completed or cancelled instructions on /thesis/instruction_delta.
+        """
+        if self.instr_sync.apply(in_delta):
+            self.allocate()
+        return
+
+    def robot_delta_cb(self, in_delta, name):
+        """
+        The instructions done by the robot are forwarded to /thesis/instruction_delta.
+        """
+        if self.robot_sync[name].apply(in_delta) and in_delta.op == COMPLETE:
+            _done_id = [instr_id for instr_id in in_delta.id if instr_id in self.instr_dict]
+            rospy.loginfo('{0} done: {1}'.format(name, _done_id))
+            if len(_done_id) > 0:
+                self.delta_pub.publish(self.instr_sync.complete(_done_id))
+            self.allocate()
+        return
+
+    def robot_node_cb(self, in_node, name):
+        """
+        :param in_node: label of the robot on create_node_graph, see MotionTable.get_label
+        """
+        if in_node.data in self.label_state:
+            self.robot_state[name] = self.label_state[in_node.data]
+        return
+
+    def robot_target_cb(self, in_target, name):
+        """
+        :param in_target: id of the instruction the robot heads to or does, -1 for none
+        """
+        self.robot_target[name] = in_target.data
+        return
+
+    def allocate(self):
+        s_time = time.time()
+
+        # the instruction each robot is working on stays with it, the first of its last sequence if unknown
+        commit_dict = {name: seq[0] for name, seq in self.robot_seq.iteritems() if len(seq) > 0}
+        hold_dict = dict()
+        for name, instr_id in self.robot_target.iteritems():
+            if instr_id in self.robot_dict[name]:
+                commit_dict[name] = instr_id
+                hold_dict[instr_id] = name
+        _cur_step = (time.time() - rospy.get_param('/instr_start_time', time.time())) / self.sim_time_step
+        robot_dict = {name: (self.robot_state[name], _cur_step) for name in self.robot_names}
+        self.robot_seq = self.allocator.allocate(self.instr_dict, robot_dict, commit_dict, hold_dict)
+
+        # the work in progress is not given to the others even if the commitment failed
+        for name, seq in self.robot_seq.iteritems():
+            self.robot_seq[name] = [instr_id for instr_id in seq if hold_dict.get(instr_id, name) == name]
+
+        # publish the changes of the share of every robot
+        for name, seq in self.robot_seq.iteritems():
+            _seq_id = set(seq)
+            _cancel_id = [instr_id for instr_id in self.robot_dict[name].keys()
+                          if instr_id not in _seq_id and hold_dict.get(instr_id) != name]
+            _add_id = [instr_id for instr_id in seq if instr_id not in self.robot_dict[name]]
+            if len(_cancel_id) > 0:
+                self.robot_pub[name].publish(self.robot_sync[name].cancel(_cancel_id))
+            if len(_add_id) > 0:
+                self.robot_pub[name].publish(self.robot_sync[name].add([self.instr_dict[i] for i in _add_id]))
+            rospy.loginfo('{0}: {1}'.format(name, seq))
+
+        self.plan_time += time.time() - s_time
+        rospy.set_param('/thesis/allocate_time', self.plan_time)
+        return
+
+
+if __name__ == '__main__':
+    rospy.init_node(os.path.basename(__file__).split('.')[0], log_level=rospy.INFO)
+    allocator = TaskAllocator()
+    rospy.spin()
@@ -6,6 +6,8 @@ Solve task planning with dynamic programming (value iteration)
 from task_motion_planner_fcfs import *
 import operator
 from robot_motions import *
+from decision_making.task_sequence import get_bnb_seq
+from decision_making.value_iter import PowerTable, get_bucket_reward
 # from std_msgs.msg import Int32
 
 
@@ -16,7 +18,9 @@ class TaskMotionPlannerDP(TaskMotionPlannerFCFS):
         """
         TaskMotionPlannerFCFS.__init__(self)
         self.base_name = os.path.basename(__file__).split('.')[0]
-        self.shortest_path = nx.floyd_warshall_numpy(self.map_graph)
+        self.bnb_time_budget = rospy.get_param('/thesis/bnb_time_budget', 0.0)  # sec, 0 for value iteration
+        self.power_table = PowerTable()  # b ** d of the candidate steps
+        self.eval_num = 1  # candidate evaluations of the last plan_task
 
         # for real world motion
         set_initial_pose(loc[self.cur_node][0], loc[self.cur_node][1], loc[self.cur_node][2], self.cur_node)
@@ -39,39 +43,26 @@ class TaskMotionPlannerDP(TaskMotionPlannerFCFS):
     def value_iter(self, in_node=None):
         # Check in_node exists or not
         if in_node is None:
-            _in_neighbor = list(self.cur_neighbor)  # copy the list, not changing self.cur_neighbor
             in_node = self.cur_node
+            _in_state = self.motion_table.get_state(in_node, self.cur_neighbor)
         else:
-            _in_neighbor = list(self.adjacency_matrix[in_node].astype(int).tolist())
+            _in_state = self.motion_table.get_state(in_node)
 
         rospy.loginfo('value_iter, in_node: {0}'.format(in_node))
 
         # Compare the accumulated reward of neighbor, move to the maximum one.
-        neighbor_node = np.where(np.array(_in_neighbor) > 0)[0].tolist()
-        candidate_steps = dict()  # {neighbor_node: {'reward': float, 'neighbor': np.array}}
+        neighbor_node = self.motion_table.neighbor_nodes[_in_state]
+        # assuming moving toward each neighbor node n, distance from the candidate steps to all nodes.
+        cand_dis = self.motion_table.get_dis(self.motion_table.get_next_state(_in_state, neighbor_node))
 
-        for n in neighbor_node:
-            temp_neighbor = self.move_adjacency_node(dest_neighbor_node=n, in_node=in_node)  # assuming moving toward the neighbor node n.
-            temp_neighbor_node = np.where(np.array(temp_neighbor) > 0)[0].tolist()
-            rospy.logdebug('temp_neighbor_node = {0}'.format(temp_neighbor_node))
-
-            # Calculate accumulated reward of a candidate step from all instructions
-            total_reward = 0.0
-            for _, instr in self.instr_dict.iteritems():
-                if instr.prev_id not in self.instr_dict.keys():
-                    # Possible distances from instr to candidate steps
-                    temp_dis = np.zeros(len(temp_neighbor_node)).astype(float)
-                    for j, temp_n in enumerate(temp_neighbor_node):
-                        temp_dis[j] = self.shortest_path[instr.destination, temp_n] + temp_neighbor[temp_n]
-
-                    total_reward += instr.r * pow(instr.b, np.min(temp_dis))
-
-            rospy.loginfo('total reward in candidate node {0}: {1}'.format(n, total_reward))
-
-            candidate_steps[n] = {'reward': total_reward, 'neighbor': temp_neighbor}
+        # Calculate accumulated reward of all candidate steps from all instructions
+        b_values, sum_r = self.instr_dict.get_ready_buckets()
+        cand_reward = get_bucket_reward(cand_dis, b_values, sum_r, self.power_table)
+        self.eval_num += len(neighbor_node) * len(b_values)
+        rospy.loginfo('total reward in candidate nodes {0}: {1}'.format(neighbor_node, cand_reward))
 
         # Pick the node with maximum accumulated reward
-        _temp_next_node = max(candidate_steps, key=lambda x: candidate_steps[x]['reward'])
+        _temp_next_node = neighbor_node[int(np.argmax(cand_reward))]
 
         if _temp_next_node == 3 or _temp_next_node == 4:
             self.value_iter(in_node=_temp_next_node)
@@ -81,33 +72,47 @@ class TaskMotionPlannerDP(TaskMotionPlannerFCFS):
 
         return
 
+    def plan_seq(self):
+        """
+        Move toward the first instruction of the branch-and-bound sequence.
+        """
+        _stats = dict()
+        seq, seq_reward, gap = get_bnb_seq(self.instr_dict, self.shortest_path, self.cur_node, self.sim_time_step,
+                                           time_budget=self.bnb_time_budget, stats=_stats)
+        self.eval_num += _stats['eval_num']
+        rospy.loginfo('seq: {0}, reward: {1}, gap: {2}'.format(seq, seq_reward, gap))
+
+        # next neighbor node for motion planner
+        self.set_target(seq[0])
+        self.next_node = self.next_hop(self.instr_dict[seq[0]].destination)
+        return
+
+    def plan_next_node(self):
+        if self.bnb_time_budget > 0.0:
+            self.plan_seq()
+        else:
+            self.value_iter()
+        return
+
     def plan_task(self, in_instructions):
         rospy.loginfo('Start task planning!')
         self.move_lock = True
-        # Convert InstructionArray into dictionary
-        if type(in_instructions) == thesis.msg._InstructionArray.InstructionArray:
+        s_time = time.time()
+        self.eval_num = 0
+        # New instructions from /thesis/instruction_delta, applied in delta_cb
+        if type(in_instructions) == thesis.msg._InstructionDelta.InstructionDelta:
 
             self.save_csv_flag = True
 
-            for instr in in_instructions.data:
-                self.instr_dest_dict[instr.destination].add(instr.id)
-                self.instr_dict[instr.id] = instr
-
             # print 'self.instr_dict: ', self.instr_dict
 
-        rospy.logdebug('len(self.instr_dict.keys()): {0}'.format(len(self.instr_dict.keys())))
+        rospy.logdebug('len(self.instr_dict): {0}'.format(len(self.instr_dict)))
 
-        if len(self.instr_dict.keys()) > 0:  # if there exists instructions
+        if len(self.instr_dict) > 0:  # if there exists instructions
             if len(self.instr_dest_dict[self.cur_node]) > 0:
-                # for two-stage instruction, count the instructions that still have previous instr
-                temp_count = 0
-                for instr_id in self.instr_dest_dict[self.cur_node]:
-                    if self.instr_dict[instr_id].prev_id in self.instr_dict.keys():
-                        temp_count += 1
-
-                # all the instructions in cur_node are sequential
-                if temp_count == len(self.instr_dest_dict[self.cur_node]):
-                    self.value_iter()  # update self.next_node
+                # all the instructions in cur_node are sequential (two-stage instructions with previous instr)
+                if len(self.instr_dict.ready_dest_dict[self.cur_node]) == 0:
+                    self.plan_next_node()  # update self.next_node
 
                 # there are instructions exist in cur_node
                 else:
@@ -117,11 +122,14 @@ class TaskMotionPlannerDP(TaskMotionPlannerFCFS):
                 # self.next_node = self.cur_node
 
             else:
-                self.value_iter()  # update self.next_node
+                self.plan_next_node()  # update self.next_node
 
             rospy.loginfo('plan_task result: {0}'.format(self.next_node))
             # self.motion_pub.publish(self.next_node)
 
+            # evaluate planning time, the value iteration was not timed before
+            self.record_plan_time(s_time, max(self.eval_num, 1))
+
             if rospy.get_param('/thesis/next_node', -1) != self.next_node:  # change the decision
                 shutdown()
                 # relaunch_move_base()
@@ -137,29 +145,22 @@ class TaskMotionPlannerDP(TaskMotionPlannerFCFS):
             if len(self.instr_dest_dict[self.cur_node]) > 0:
                 # Create reward_dict = {'id (int)': 'reward (float)'}
                 reward_dict = dict()
-                for idx in self.instr_dest_dict[self.cur_node]:
-                    # Check two-stage instruction
-                    if self.instr_dict[idx].prev_id not in self.instr_dict.keys():
-                        reward_dict[self.instr_dict[idx].id] = self.instr_dict[idx].r
+                for idx in self.instr_dict.ready_dest_dict[self.cur_node]:  # two-stage instructions are excluded
+                    reward_dict[idx] = self.instr_dict[idx].r
 
                 # Sort the instructions with the max reward
                 for r in sorted(reward_dict.items(), key=operator.itemgetter(1), reverse=True):
                     do_instr = self.instr_dict[r[0]]
                     rospy.loginfo('Do instr {0}: {1}'.format(do_instr.id, do_instr.function))
+                    self.set_target(do_instr.id)
                     rospy.sleep(do_instr.duration)
-                    del self.instr_dict[r[0]]
+                    self.complete_instr(r[0])
                     self.show_instr()
 
-                # Reset the set when all the tasks in the instructions are done.
-                self.instr_dest_dict[self.cur_node].clear()
                 rospy.logdebug('self.instr_dest_dict: {0}'.format(self.instr_dest_dict))
 
-                # Convert undo_tasks to a list() and publish to /thesis/instruction_buffer
-                undo_instr_list = list()
-                for key, value in self.instr_dict.iteritems():
-                    undo_instr_list.append(value)
-
-                self.task_pub.publish(undo_instr_list)
+                # The done instructions are published to /thesis/instruction_delta, plan the undo instructions
+                self.plan_task(self.instr_dict)
 
             else:
                 rospy.loginfo('No instructions on task {0}'.format(self.cur_node))
@@ -197,7 +198,7 @@ class TaskMotionPlannerDP(TaskMotionPlannerFCFS):
                 elif rospy.get_param('/thesis/reach', False):
                     # tts_service.say('I reach the goal.')
                     self.cur_node = self.next_node
-                    self.cur_neighbor = self.adjacency_matrix[self.cur_node].astype(int)
+                    self.cur_neighbor = self.motion_table.get_neighbor(self.cur_node)
                     rospy.set_param('/thesis/pepper_location', self.cur_node)
                     rospy.loginfo('Change cur_node to: {0}'.format(self.cur_node))
 
@@ -217,10 +218,8 @@ class TaskMotionPlannerDP(TaskMotionPlannerFCFS):
 
                     # Create reward_dict = {'id (int)': 'reward (float)'}
                     reward_dict = dict()
-                    for idx in self.instr_dest_dict[self.cur_node]:
-                        # Check two-stage instruction
-                        if self.instr_dict[idx].prev_id not in self.instr_dict.keys():
-                            reward_dict[self.instr_dict[idx].id] = self.instr_dict[idx].r
+                    for idx in self.instr_dict.ready_dest_dict[self.cur_node]:  # two-stage instructions are excluded
+                        reward_dict[idx] = self.instr_dict[idx].r
 
                     # Stop the move_base at first
                     shutdown()
@@ -239,20 +238,15 @@ class TaskMotionPlannerDP(TaskMotionPlannerFCFS):
                         self.done_instr.append(do_instr.id)
                         # end
 
-                        del self.instr_dict[r[0]]
+                        self.complete_instr(r[0])
                         self.show_instr()
 
                     rospy.set_param('/thesis/face_track', False)  # stop face tracking
 
-                    # Reset the set when all the tasks in the instructions are done.
-                    self.instr_dest_dict[self.cur_node].clear()
                     # rospy.logdebug('self.instr_dest_dict: {0}'.format(self.instr_dest_dict))
 
-                    # Convert undo_tasks to a list() and publish to /thesis/instruction_buffer
-                    undo_instr_list = list()
-                    for key, value in self.instr_dict.iteritems():
-                        undo_instr_list.append(value)
-                    self.task_pub.publish(undo_instr_list)
+                    # The done instructions are published to /thesis/instruction_delta, plan the undo instructions
+                    self.plan_task(self.instr_dict)
 
                     # Relaunch move_base
                     # relaunch_move_base()
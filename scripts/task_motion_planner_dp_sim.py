@@ -4,7 +4,8 @@
 Solve task planning with dynamic programming (value iteration)
 """
 from task_motion_planner_fcfs_sim import *
-import operator
+from decision_making.value_iter import PowerTable
+from decision_making.planner_policy import value_iter_step, value_iter_pick
 
 
 class TaskMotionPlannerDPSim(TaskMotionPlannerFCFSSim):
@@ -14,7 +15,8 @@ class TaskMotionPlannerDPSim(TaskMotionPlannerFCFSSim):
         """
         TaskMotionPlannerFCFSSim.__init__(self)
         self.base_name = os.path.basename(__file__).split('.')[0]
-        self.shortest_path = nx.floyd_warshall_numpy(self.map_graph)
+        self.power_table = PowerTable()  # b ** d of the candidate steps
+        self.eval_num = 1  # candidate evaluations of the last plan_task
 
         print '----------------------------------------'
         print self.shortest_path
@@ -25,80 +27,35 @@ class TaskMotionPlannerDPSim(TaskMotionPlannerFCFSSim):
     def value_iter(self):
         rospy.loginfo('value_iter, cur_node: {0}, next_node: {1}'.format(self.cur_node, self.next_node))
 
-        # Compare the accumulated reward of neighbor, move to the maximum one.
-        neighbor_node = np.where(np.array(self.cur_neighbor) > 0)[0].tolist()
-        candidate_steps = dict()  # {neighbor_node: {'reward': float, 'neighbor': np.array}}
-
-        for n in neighbor_node:
-            temp_neighbor = self.move_adjacency_node(n)  # assuming moving toward the neighbor node n.
-            temp_neighbor_node = np.where(np.array(temp_neighbor) > 0)[0].tolist()
-            rospy.logdebug('temp_neighbor_node = {0}'.format(temp_neighbor_node))
-
-            # Calculate accumulated reward of a candidate step from all instructions
-            total_reward = 0.0
-            for _, instr in self.instr_dict.iteritems():
-                if instr.prev_id not in self.instr_dict.keys():
-                    # Possible distances from instr to candidate steps
-                    temp_dis = np.zeros(len(temp_neighbor_node)).astype(float)
-                    for j, temp_n in enumerate(temp_neighbor_node):
-                        temp_dis[j] = self.shortest_path[instr.destination, temp_n] + temp_neighbor[temp_n]
-
-                    total_reward += instr.r * pow(instr.b, np.min(temp_dis))
-
-            rospy.logdebug('total reward in candidate node {0}: {1}'.format(n, total_reward))
-
-            candidate_steps[n] = {'reward': total_reward, 'neighbor': temp_neighbor}
-
-        # Pick the node with maximum accumulated reward
-        self.next_node = max(candidate_steps, key=lambda x: candidate_steps[x]['reward'])
+        # Stay for the ready instructions on cur_node, or move to the neighbor with the maximum accumulated reward
+        _cur_state = self.motion_table.get_state(self.cur_node, self.cur_neighbor)
+        self.next_node, self.eval_num = value_iter_step(self.instr_dict, self.motion_table, _cur_state,
+                                                        self.power_table)
         return
 
     def plan_task(self, in_instructions):
         rospy.loginfo('Start task planning!')
 
         s_time = time.time()
+        self.eval_num = 1
 
-        # Convert InstructionArray into dictionary
-        if type(in_instructions) == thesis.msg._InstructionArray.InstructionArray:
+        # New instructions from /thesis/instruction_delta, applied in delta_cb
+        if type(in_instructions) == thesis.msg._InstructionDelta.InstructionDelta:
 
             self.save_csv_flag = True
 
-            for instr in in_instructions.data:
-                self.instr_dest_dict[instr.destination].add(instr.id)
-                self.instr_dict[instr.id] = instr
-
             # print 'self.instr_dict: ', self.instr_dict
 
-        rospy.logdebug('len(self.instr_dict.keys()): {0}'.format(len(self.instr_dict.keys())))
+        rospy.logdebug('len(self.instr_dict): {0}'.format(len(self.instr_dict)))
 
-        if len(self.instr_dict.keys()) > 0:  # if there exists instructions
-            if len(self.instr_dest_dict[self.cur_node]) > 0:
-                # for two-stage instruction, count the instructions that still have previous instr
-                temp_count = 0
-                for instr_id in self.instr_dest_dict[self.cur_node]:
-                    if self.instr_dict[instr_id].prev_id in self.instr_dict.keys():
-                        temp_count += 1
-
-                # all the instructions in cur_node are sequential
-                if temp_count == len(self.instr_dest_dict[self.cur_node]):
-                    self.value_iter()  # update self.next_node
-
-                # there are instructions exist in cur_node
-                else:
-                    self.next_node = self.cur_node
-
-                # for single stage instruction
-                # self.next_node = self.cur_node
-
-            else:
-                self.value_iter()  # update self.next_node
+        if len(self.instr_dict) > 0:  # if there exists instructions
+            # the two-stage instructions in cur_node wait for their previous instr, see value_iter_step
+            self.value_iter()  # update self.next_node
 
             rospy.loginfo('plan_task result: {0}'.format(self.next_node))
             # self.motion_pub.publish(self.next_node)
 
-            self.plan_time += time.time() - s_time
-            rospy.set_param('/thesis/plan_time', self.plan_time)
-            rospy.loginfo('plan_time: {0}'.format(self.plan_time))
+            self.record_plan_time(s_time, self.eval_num)
 
         return
 
@@ -107,17 +64,11 @@ class TaskMotionPlannerDPSim(TaskMotionPlannerFCFSSim):
             rospy.loginfo('Motion: Reach node {0}.'.format(self.next_node))
 
             if len(self.instr_dest_dict[self.cur_node]) > 0:
-                # Create reward_dict = {'id (int)': 'reward (float)'}
-                reward_dict = dict()
-                for idx in self.instr_dest_dict[self.cur_node]:
-                    # Check two-stage instruction
-                    if self.instr_dict[idx].prev_id not in self.instr_dict.keys():
-                        reward_dict[self.instr_dict[idx].id] = self.instr_dict[idx].r
-
-                # Sort the instructions with the max reward
-                for r in sorted(reward_dict.items(), key=operator.itemgetter(1), reverse=True):
-                    do_instr = self.instr_dict[r[0]]
+                # Do the ready instructions with the max reward first, two-stage instructions are excluded
+                for instr_id in value_iter_pick(self.instr_dict, self.cur_node):
+                    do_instr = self.instr_dict[instr_id]
                     rospy.loginfo('Do instr {0}: {1}'.format(do_instr.id, do_instr.function))
+                    self.set_target(do_instr.id)
                     rospy.sleep(do_instr.duration)
 
                     # for experiment evaluation
@@ -125,19 +76,13 @@ class TaskMotionPlannerDPSim(TaskMotionPlannerFCFSSim):
                     self.done_instr.append(do_instr.id)
                     # end
 
-                    del self.instr_dict[r[0]]
+                    self.complete_instr(instr_id)
                     self.show_instr()
 
-                # Reset the set when all the tasks in the instructions are done.
-                self.instr_dest_dict[self.cur_node].clear()
                 rospy.logdebug('self.instr_dest_dict: {0}'.format(self.instr_dest_dict))
 
-                # Convert undo_tasks to a list() and publish to /thesis/instruction_buffer
-                undo_instr_list = list()
-                for key, value in self.instr_dict.iteritems():
-                    undo_instr_list.append(value)
-
-                self.task_pub.publish(undo_instr_list)
+                # The done instructions are published to /thesis/instruction_delta, plan the undo instructions
+                self.plan_task(self.instr_dict)
 
             else:
                 rospy.loginfo('No instructions on task {0}'.format(self.cur_node))
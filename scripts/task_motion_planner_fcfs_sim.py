@@ -8,8 +8,16 @@ import os
 from perception import human_id
 from thesis.msg import *
 import rospkg
-from std_msgs.msg import String
+from std_msgs.msg import String, Int32
 from decision_making.node_viz import create_map_graph
+from decision_making.map_graph import MotionTable
+from decision_making.sparse_graph import load_map_graph, load_route_table, get_csr_adjacency
+from decision_making.instr_store import InstructionStore
+from decision_making.instr_delta import InstructionSync
+from decision_making.plan_stats import DecisionStats
+from decision_making.planner_policy import select_fcfs
+from decision_making.instr_log import InstructionRecorder
+from decision_making.instr_journal import InstructionJournal
 import numpy as np
 import networkx as nx
 import time
@@ -18,8 +26,9 @@ import pandas as pd
 
 class TaskMotionPlannerFCFSSim:
     def __init__(self):
-        self.sub = rospy.Subscriber('/thesis/instruction_buffer', InstructionArray, self.plan_task, queue_size=5)
-        self.task_pub = rospy.Publisher('/thesis/instruction_buffer', InstructionArray, queue_size=1)
+        # relative names, /thesis/... for a single robot, or /<robot>/thesis/... in a namespace with task_allocator.py
+        self.sub = rospy.Subscriber('thesis/instruction_delta', InstructionDelta, self.delta_cb, queue_size=10)
+        self.task_pub = rospy.Publisher('thesis/instruction_delta', InstructionDelta, queue_size=10)
 
         # for two-stage instruction ('check status' from caregiver)
         # human_dict = {'name':{'Name': Human()}, 'ip':{'192.168.0.xxx':'Name'}}
@@ -27,21 +36,42 @@ class TaskMotionPlannerFCFSSim:
 
         # for TAMP
         self.map_graph = create_map_graph()
-        self.adjacency_matrix = nx.convert_matrix.to_numpy_array(self.map_graph)
-        self.cur_node = rospy.get_param('/thesis/pepper_location', 2)  # initial at charge, type=int
-        self.next_node = rospy.get_param('/thesis/pepper_location', 2)  # initial at charge, type=int
+        if rospy.has_param('/thesis/map_file'):  # waypoint graph of a large map, see sparse_graph.load_map_graph
+            self.map_graph = load_map_graph(rospy.get_param('/thesis/map_file'),
+                                            rospy.get_param('/thesis/map_node_file', None))
+        self.csr_adjacency = get_csr_adjacency(self.map_graph)
+        self.cur_node = rospy.get_param('thesis/pepper_location', 2)  # initial at charge, type=int
+        self.next_node = rospy.get_param('thesis/pepper_location', 2)  # initial at charge, type=int
         self.time_step = rospy.get_param('/thesis/time_step', 1.0)
         self.sim_time_step = 2.0
-        self.instr_dict = dict()
-        self.instr_dest_dict = {n: set() for n in self.map_graph.nodes}
+        self.instr_dict = InstructionStore(self.map_graph.nodes)
+        self.instr_dest_dict = self.instr_dict.dest_dict  # maintained by instr_dict
+        self.instr_sync = InstructionSync(self.instr_dict, rospy.get_name(), InstructionDelta)
+        if rospy.has_param('~instr_log'):  # record the instruction stream seen by the planner
+            self.instr_sync.recorder = InstructionRecorder(
+                rospy.get_param('~instr_log'), lambda: time.time() - rospy.get_param('/instr_start_time', time.time()))
+        if rospy.has_param('/thesis/journal_dir'):  # resume the instructions of the last run after a crash
+            self.instr_journal = InstructionJournal(rospy.get_param('/thesis/journal_dir'), self.instr_sync,
+                                                    rospy.get_param('/thesis/journal_compact_num', 1000))
+            self.instr_journal.recover()
+            rospy.loginfo('Recovered {0} instructions'.format(len(self.instr_dict)))
 
         # for visualization, including nodes and edges
-        self.viz_node_pub = rospy.Publisher('/thesis/robot_node', String, queue_size=2)
+        self.viz_node_pub = rospy.Publisher('thesis/robot_node', String, queue_size=2)
         self._pkg_dir = rospkg.RosPack().get_path('thesis')
-        self.cur_neighbor = self.adjacency_matrix[self.cur_node].astype(int).tolist()
+        # the instruction the robot heads to or does, kept with the robot by task_allocator.py
+        self.target_pub = rospy.Publisher('thesis/target_id', Int32, queue_size=2, latch=True)
+        self.target_id = -1
+        self.route_table = load_route_table(self.map_graph)
+        self.shortest_path = self.route_table.shortest_path
+        self.motion_table = MotionTable(self.csr_adjacency, self.shortest_path)
+        self.cur_neighbor = self.motion_table.get_neighbor(self.cur_node)
 
         # for experiment evaluations
         self.plan_time = 0.0
+        self.plan_stats = DecisionStats()  # per-decision plan time, published on thesis/plan_stats
+        self.plan_stats_pub = rospy.Publisher('thesis/plan_stats', PlanStats, queue_size=2)
+        rospy.Timer(rospy.Duration(rospy.get_param('/thesis/plan_stats_period', 10.0)), self.publish_plan_stats)
         self.accu_r = 0.0  # accumulate reward
         self.accu_r_list = [0.0]
         self.time_r_list = [0.0]
@@ -77,42 +107,89 @@ class TaskMotionPlannerFCFSSim:
         print 'pkg path', self._pkg_dir
         return
 
+    def delta_cb(self, in_delta):
+        """
+        Apply the change of the instruction buffer from /thesis/instruction_delta, then plan again.
+        """
+        if self.instr_sync.apply(in_delta):
+            self.plan_task(in_delta)
+        return
+
+    def record_plan_time(self, s_time, eval_num=1, store_time=0.0):
+        """
+        Accumulate the planning time of a decision and record it in self.plan_stats.
+        :param s_time: time.time() at the start of the decision
+        :param eval_num: number of the candidate evaluations of the decision
+        :param store_time: seconds not counted, e.g. storing the theoretical rewards
+        """
+        _plan_time = time.time() - s_time - store_time
+        _step = (time.time() - rospy.get_param('/instr_start_time', time.time())) / self.sim_time_step
+        self.plan_stats.record(_plan_time, len(self.instr_dict), eval_num, _step)
+
+        self.plan_time += _plan_time
+        rospy.set_param('/thesis/plan_time', self.plan_time)
+        rospy.loginfo('plan_time: {0}'.format(self.plan_time))
+        return
+
+    def publish_plan_stats(self, event=None):
+        _summary = self.plan_stats.summary()
+        if _summary['count'] > 0:
+            self.plan_stats_pub.publish(PlanStats(source=rospy.get_name(), **_summary))
+        return
+
+    def complete_instr(self, instr_id):
+        """
+        Remove the done instruction and publish it to /thesis/instruction_delta.
+        """
+        self.task_pub.publish(self.instr_sync.complete([instr_id]))
+        self.set_target(-1)
+        return
+
+    def set_target(self, instr_id):
+        """
+        Publish the instruction the robot heads to or does on thesis/target_id.
+        :param instr_id: id of the instruction, -1 for none
+        """
+        if instr_id != self.target_id:
+            self.target_id = instr_id
+            self.target_pub.publish(Int32(data=instr_id))
+        return
+
     def plan_task(self, in_instructions):
         rospy.loginfo('Planning task ...')
         s_time = time.time()  # for task planning time
         # self.cur_instr.data = list(instr_list.data)
 
-        # Convert InstructionArray into dictionary
-        if type(in_instructions) == thesis.msg._InstructionArray.InstructionArray:
+        # New instructions from /thesis/instruction_delta, applied in delta_cb
+        if type(in_instructions) == thesis.msg._InstructionDelta.InstructionDelta:
 
             self.save_csv_flag = True
 
-            for instr in in_instructions.data:
-                self.instr_dest_dict[instr.destination].add(instr.id)
-                self.instr_dict[instr.id] = instr
-
         self.show_instr()
 
         # Fetch the destination from the task
-        if len(self.instr_dict.keys()) > 0:
-            dest_node = self.instr_dict[min(self.instr_dict.keys())].destination  # destination node
+        if len(self.instr_dict) > 0:
+            _first_id = select_fcfs(self.instr_dict)  # the first one whose prev_id is done
+            self.set_target(_first_id)
+            dest_node = self.instr_dict[_first_id].destination  # destination node
             rospy.loginfo('destination node: {0}'.format(dest_node))
-            temp_path = nx.shortest_path(self.map_graph, self.cur_node, dest_node, weight='weight')
-            rospy.loginfo('temp_path = {0}'.format(temp_path))
-
-            if len(temp_path) > 1:
-                self.next_node = temp_path[1]  # next neighbor node for motion planner
-            else:
-                self.next_node = self.cur_node
+            rospy.loginfo('temp_path = {0}'.format(self.route_table.route(self.cur_node, dest_node)))
+            self.next_node = self.next_hop(dest_node)  # next neighbor for motion planner
             rospy.loginfo('plan_task result: {0}'.format(self.next_node))
 
             # evaluate planning time
-            self.plan_time += time.time() - s_time
-            rospy.set_param('/thesis/plan_time', self.plan_time)
-            rospy.loginfo('plan_time: {0}'.format(self.plan_time))
+            self.record_plan_time(s_time)
 
         return
 
+    def next_hop(self, dest_node):
+        """
+        :param dest_node: destination node
+        :return: next neighbor node for motion planner, the node ahead if the robot is on an edge
+        """
+        _state = self.motion_table.get_state(self.cur_node, self.cur_neighbor)
+        return self.motion_table.next_hop(_state, dest_node, self.route_table)
+
     def move_adjacency_node(self, dest_neighbor_node, sim=True, render=False):
         """
         Get the neighbor of next node after moving.
@@ -125,7 +202,8 @@ class TaskMotionPlannerFCFSSim:
         rospy.logdebug('move_adjacency_node!!!!')
         # rospy.loginfo('cur_neighbor = {0}'.format(self.cur_neighbor))
 
-        _neighbor_nodes = np.where(np.array(self.cur_neighbor) > 0)[0].tolist()
+        _state = self.motion_table.get_state(self.cur_node, self.cur_neighbor)
+        _neighbor_nodes = self.motion_table.neighbor_nodes[_state]
 
         rospy.logdebug('dest_neighbor_node = {0}'.format(dest_neighbor_node))
         rospy.logdebug('_neighbor_nodes = {0}'.format(_neighbor_nodes))
@@ -138,24 +216,9 @@ class TaskMotionPlannerFCFSSim:
             rospy.logerr('Invalid destination for planning.')
             exit(1)
 
-        _temp_neighbor = list(self.cur_neighbor)  # copy the list, not changing self.cur_neighbor
-
-        # update neighbor after moving
-        for n in _neighbor_nodes:
-            if n == dest_neighbor_node:  # moving toward desire neighbor node
-                _temp_neighbor[n] -= 1
-
-                if _temp_neighbor[n] == 0:  # robot reaches the desire neighbor node
-                    _temp_neighbor = np.copy(self.adjacency_matrix[n]).astype(int).tolist()
-                    break
-
-                _temp_neighbor[self.cur_node] += 1
-
-            elif n == self.cur_node:  # robot is currently on the edge.
-                continue
-
-            else:
-                _temp_neighbor[n] = 0
+        # update neighbor after moving, not changing self.cur_neighbor
+        _next_state = self.motion_table.move(_state, dest_neighbor_node)[0]
+        _temp_neighbor = self.motion_table.get_neighbor(_next_state)
 
         if not sim:  # if real move, not checking the candidate steps.
             self.cur_neighbor = list(_temp_neighbor)
@@ -163,21 +226,11 @@ class TaskMotionPlannerFCFSSim:
 
             if render:
                 # robot reach destination neighbor node
-                if self.cur_neighbor == self.adjacency_matrix[dest_neighbor_node].astype(int).tolist():
+                if self.motion_table.is_node[_next_state]:
                     self.cur_node = dest_neighbor_node
-                    _robot_node = str(self.cur_node)
-
-                # robot is on edge
-                else:
-                    _nodes_on_edge = sorted([self.cur_node, dest_neighbor_node])
-                    _temp_step = self.cur_neighbor[_nodes_on_edge[0]]
-                    _nodes_on_edge = map(str, _nodes_on_edge)
-                    _robot_node = ''
-                    for e in _nodes_on_edge:
-                        _robot_node += e
-                    _robot_node += '_'
-                    _robot_node += str(_temp_step)
 
+                # robot node in create_node_graph, either on node or on edge
+                _robot_node = self.motion_table.get_label(_next_state)
                 # rospy.loginfo('robot_node = {0}'.format(_robot_node))
 
                 # Publish the robot node in str type
@@ -194,28 +247,22 @@ class TaskMotionPlannerFCFSSim:
             # if self.cur_node in self.instr_dest_dict.keys():
             if len(self.instr_dest_dict[self.cur_node]) > 0:
                 # This is for FCFS!!!
-                for idx in self.instr_dest_dict[self.cur_node]:
-                    if idx == min(self.instr_dict.keys()):
-                        do_instr = self.instr_dict[idx]
-                        rospy.loginfo('Do instr {0}: {1}'.format(idx, do_instr.function))
-                        rospy.sleep(do_instr.duration)
-
-                        # for experiment evaluation# for experiment evaluation
-                        self.cal_accu_reward(do_instr)
-                        self.done_instr.append(do_instr.id)
-                        # end
-
-                        del self.instr_dict[do_instr.id]
-                        self.instr_dest_dict[self.cur_node].remove(do_instr.id)
+                _first_id = select_fcfs(self.instr_dict)
+                if _first_id in self.instr_dest_dict[self.cur_node]:
+                    do_instr = self.instr_dict[_first_id]
+                    rospy.loginfo('Do instr {0}: {1}'.format(_first_id, do_instr.function))
+                    self.set_target(do_instr.id)
+                    rospy.sleep(do_instr.duration)
 
-                        break
+                    # for experiment evaluation# for experiment evaluation
+                    self.cal_accu_reward(do_instr)
+                    self.done_instr.append(do_instr.id)
+                    # end
 
-                # Convert undo_tasks to a list() and publish to /thesis/instruction_buffer
-                undo_instr_list = list()
-                for key, value in self.instr_dict.iteritems():
-                    undo_instr_list.append(value)
+                    self.complete_instr(do_instr.id)
 
-                self.task_pub.publish(undo_instr_list)
+                # The done instructions are published to /thesis/instruction_delta, plan the undo instructions
+                self.plan_task(self.instr_dict)
 
             else:
                 rospy.loginfo('No instructions on task {0}'.format(self.cur_node))
@@ -258,6 +305,9 @@ class TaskMotionPlannerFCFSSim:
         csv_file = self._pkg_dir + '/exp2/instr_' + str(self.max_num) + '_' + str(self.seed) + '/' + csv_name
         output_df = pd.DataFrame({'time': time_list, 'reward': r_list})
         output_df.to_csv(csv_file, index=False, columns=['time', 'reward'])
+        if csv_name == self.base_name+'_reward.csv':
+            self.plan_stats.save_csv(csv_file.replace('_reward.csv', '_plan_stats.csv'),
+                                     csv_file.replace('_reward.csv', '_plan_hist.csv'))
 
         rospy.sleep(1)
         rospy.loginfo('Save to: {0}'.format(csv_file))
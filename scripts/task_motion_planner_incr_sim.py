@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Solve task planning with incremental replanning: the sequence is repaired with cheapest insertion when new
+instructions arrive, and re-optimized with branch and bound only when the estimated gap grows.
+"""
+from task_motion_planner_opt_sim import *
+from decision_making.task_sequence import IncrementalSeq
+
+
+class TaskMotionPlannerIncrSim(TaskMotionPlannerOptSim):
+    def __init__(self):
+        """
+        self.cur_node: the node where robot starts to move, initial at charge (2), type: int
+        """
+        TaskMotionPlannerOptSim.__init__(self)
+        self.base_name = os.path.basename(__file__).split('.')[0]
+        self.incr_seq = IncrementalSeq(self.shortest_path, self.sim_time_step,
+                                       gap_threshold=rospy.get_param('/thesis/gap_threshold', 0.1),
+                                       time_budget=rospy.get_param('/thesis/bnb_time_budget', 0.5))
+
+        rospy.loginfo('TAMP_Incr Initialized!')
+
+    def plan_task(self, in_instructions):
+        rospy.loginfo('Start task planning!')
+        s_time = time.time()
+
+        self.opt_seq = self.incr_seq.update(self.instr_dict, self.cur_node)
+        self.instr_counter = len(self.opt_seq)
+        rospy.loginfo('seq: {0}, reward: {1}, gap: {2}'.format(self.opt_seq, self.incr_seq.reward, self.incr_seq.gap))
+
+        if len(self.opt_seq) > 0:
+            self.set_target(self.opt_seq[0])
+            dest_node = self.instr_dict[self.opt_seq[0]].destination  # destination node
+            rospy.loginfo('destination node from task planner: {0}'.format(dest_node))
+            self.next_node = self.next_hop(dest_node)  # next neighbor for motion planner
+            rospy.loginfo('plan_task result: {0}'.format(self.next_node))
+
+        # evaluate planning time
+        self.record_plan_time(s_time, self.incr_seq.eval_num)
+
+        return
+
+
+if __name__ == '__main__':
+    rospy.init_node(os.path.basename(__file__).split('.')[0], log_level=rospy.DEBUG)
+    tamp = TaskMotionPlannerIncrSim()
+    tamp.run_plan_viz()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Solve task planning with local search (swap, 2-opt and or-opt) from the order of a rule-based planner.
+"""
+from task_motion_planner_opt_sim import *
+from decision_making.task_sequence import local_search_seq
+from decision_making.planner_policy import get_ls_start_seq
+
+
+class TaskMotionPlannerLSSim(TaskMotionPlannerOptSim):
+    def __init__(self):
+        """
+        self.cur_node: the node where robot starts to move, initial at charge (2), type: int
+        """
+        TaskMotionPlannerOptSim.__init__(self)
+        self.base_name = os.path.basename(__file__).split('.')[0]
+        self.rule = rospy.get_param('/thesis/ls_rule', 'sf')  # 'fcfs', 'pf' or 'sf'
+        self.ls_time_budget = rospy.get_param('/thesis/ls_time_budget', 0.5)  # sec, shorter than sim_time_step
+
+        rospy.loginfo('TAMP_LS Initialized!')
+
+    def plan_task(self, in_instructions):
+        rospy.loginfo('Start task planning!')
+        s_time = time.time()
+
+        # start from the last sequence, the new instructions are appended in the order of the rule
+        _seq = get_ls_start_seq(self.opt_seq, self.instr_dict, self.shortest_path, self.cur_node, self.rule,
+                                self.time_step)
+
+        _stats = dict()
+        self.opt_seq, reward_val = local_search_seq(_seq, self.instr_dict, self.shortest_path, self.cur_node,
+                                                    self.sim_time_step, self.ls_time_budget, stats=_stats)
+        self.instr_counter = len(self.opt_seq)
+        rospy.loginfo('seq: {0}, reward: {1}'.format(self.opt_seq, reward_val))
+
+        if len(self.opt_seq) > 0:
+            self.set_target(self.opt_seq[0])
+            dest_node = self.instr_dict[self.opt_seq[0]].destination  # destination node
+            rospy.loginfo('destination node from task planner: {0}'.format(dest_node))
+            self.next_node = self.next_hop(dest_node)  # next neighbor for motion planner
+            rospy.loginfo('plan_task result: {0}'.format(self.next_node))
+
+        # evaluate planning time
+        self.record_plan_time(s_time, _stats['eval_num'])
+
+        return
+
+
+if __name__ == '__main__':
+    rospy.init_node(os.path.basename(__file__).split('.')[0], log_level=rospy.DEBUG)
+    tamp = TaskMotionPlannerLSSim()
+    tamp.run_plan_viz()
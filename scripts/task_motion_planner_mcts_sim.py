@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Solve task planning with Monte Carlo tree search over the node and edge-step states, with a hard time budget for
+every decision. The tree is reused between the ticks until new instructions arrive.
+"""
+from task_motion_planner_fcfs_sim import *
+from decision_making.mcts import MCTSSearch, DO
+
+
+class TaskMotionPlannerMCTSSim(TaskMotionPlannerFCFSSim):
+    def __init__(self):
+        """
+        self.cur_node: the node where robot starts to move, initial at charge (2), type: int
+        """
+        TaskMotionPlannerFCFSSim.__init__(self)
+        self.base_name = os.path.basename(__file__).split('.')[0]
+        self.mcts = MCTSSearch(self.motion_table, self.shortest_path, self.sim_time_step,
+                               time_budget=rospy.get_param('/thesis/mcts_time_budget', 0.5),
+                               rollout=rospy.get_param('/thesis/mcts_rollout', 'greedy'),
+                               exploration=rospy.get_param('/thesis/mcts_exploration', 1.0))
+        self.action = None
+
+        rospy.loginfo('TAMP_MCTS Initialized!')
+
+    def plan_task(self, in_instructions):
+        rospy.loginfo('Start task planning!')
+        s_time = time.time()
+
+        # New instructions from /thesis/instruction_delta, applied in delta_cb
+        if type(in_instructions) == thesis.msg._InstructionDelta.InstructionDelta:
+
+            self.save_csv_flag = True
+
+        if len(self.instr_dict) > 0:
+            _cur_state = self.motion_table.get_state(self.cur_node, self.cur_neighbor)
+            _cur_step = (time.time() - rospy.get_param('/instr_start_time', time.time())) / self.sim_time_step
+            self.action = self.mcts.search(self.instr_dict, _cur_state, _cur_step)
+            rospy.loginfo('mcts action: {0}, iterations: {1}, reused: {2}'.format(self.action, self.mcts.iter_num,
+                                                                                 self.mcts.is_reused))
+
+            self.next_node = self.cur_node if self.action[0] == DO else self.action[1]
+            rospy.loginfo('plan_task result: {0}'.format(self.next_node))
+
+            # evaluate planning time
+            self.record_plan_time(s_time, self.mcts.iter_num)
+
+        return
+
+    def plan_motion_viz(self):
+        if self.cur_node == self.next_node:
+            rospy.loginfo('Motion: Reach node {0}.'.format(self.next_node))
+
+            if len(self.instr_dest_dict[self.cur_node]) > 0:
+                # decide on the node whether to do an instruction here or to leave
+                self.plan_task(self.instr_dict)
+
+                if self.action[0] == DO:
+                    do_instr = self.instr_dict[self.action[1]]
+                    rospy.loginfo('Do instr {0}: {1}'.format(do_instr.id, do_instr.function))
+                    self.set_target(do_instr.id)
+                    rospy.sleep(do_instr.duration)
+
+                    # for experiment evaluation
+                    self.cal_accu_reward(do_instr)
+                    self.done_instr.append(do_instr.id)
+                    # end
+
+                    self.complete_instr(do_instr.id)
+                    self.show_instr()
+
+                    # The done instructions are published to /thesis/instruction_delta, plan the undo instructions
+                    self.plan_task(self.instr_dict)
+
+            else:
+                rospy.loginfo('No instructions on task {0}'.format(self.cur_node))
+                if len(self.instr_dict) > 0:
+                    self.plan_task(self.instr_dict)
+
+                # save the accumulative reward, all
+                elif self.save_csv_flag:
+                    self.save_done_instr_id()
+                    self.save_accu_reward()
+                    self.save_csv_flag = False
+
+        else:
+            rospy.loginfo('Motion: from {0} to {1}'.format(self.cur_node, self.next_node))
+            self.move_adjacency_node(self.next_node, sim=False, render=True)
+
+        return
+
+
+if __name__ == '__main__':
+    rospy.init_node(os.path.basename(__file__).split('.')[0], log_level=rospy.DEBUG)
+    tamp = TaskMotionPlannerMCTSSim()
+    tamp.run_plan_viz()
@@ -4,7 +4,7 @@
 Solve task planning with dynamic programming (value iteration)
 """
 from task_motion_planner_fcfs_sim import *
-import itertools
+from decision_making.task_sequence import get_subset_dp_seq
 
 
 class TaskMotionPlannerOptSim(TaskMotionPlannerFCFSSim):
@@ -14,7 +14,6 @@ class TaskMotionPlannerOptSim(TaskMotionPlannerFCFSSim):
         """
         TaskMotionPlannerFCFSSim.__init__(self)
         self.base_name = os.path.basename(__file__).split('.')[0]
-        self.shortest_path = nx.floyd_warshall_numpy(self.map_graph)
         self.reward_list = list()
         self.opt_seq = list()
         self.opt_accu_reward_list = list()
@@ -31,50 +30,31 @@ class TaskMotionPlannerOptSim(TaskMotionPlannerFCFSSim):
 
         s_time = time.time()
         _store_time = 0.0
-
-        # Convert InstructionArray into dictionary
-        if type(in_instructions) == thesis.msg._InstructionArray.InstructionArray:
-            for instr in in_instructions.data:
-                self.instr_dest_dict[instr.destination].add(instr.id)
-                self.instr_dict[instr.id] = instr
+        _stats = {'eval_num': 1}
 
         # rospy.loginfo('self.instr_dict.keys(): {0}'.format(self.instr_dict.keys()))
 
+        # the instructions cancelled on /thesis/instruction_delta, e.g. expired
+        self.opt_seq = [instr_id for instr_id in self.opt_seq if instr_id in self.instr_dict]
         if len(self.opt_seq) > 0:
 
+            self.set_target(self.opt_seq[0])
             dest_node = self.instr_dict[self.opt_seq[0]].destination  # destination node
             rospy.loginfo('destination node from task planner: {0}'.format(dest_node))
 
             # Calculate the shortest path nodes from current node to the goal node
-            temp_path = nx.shortest_path(self.map_graph, self.cur_node, dest_node, weight='weight')
-            rospy.logdebug('temp_path = {0}'.format(temp_path))
-            if len(temp_path) > 1:
-                self.next_node = temp_path[1]  # next neighbor node for motion planner
-            else:
-                self.next_node = self.cur_node
+            rospy.logdebug('temp_path = {0}'.format(self.route_table.route(self.cur_node, dest_node)))
+            self.next_node = self.next_hop(dest_node)  # next neighbor for motion planner
 
             rospy.loginfo('plan_task result: {0}'.format(self.next_node))
 
         else:
             rospy.logwarn('self.opt_seq is empty.')
-            self.instr_counter = len(self.instr_dict.keys())
-            node_seq = list(itertools.permutations(self.instr_dict.keys()))
-            rospy.logdebug('len node_seq: {0}'.format(len(node_seq)))
-
-            reward_seq = np.zeros(len(node_seq))
-            for s_id, seq in enumerate(node_seq):
-                path_len = 0
-                temp_node = self.cur_node
-                for instr_id in seq:
-                    temp_duration = self.shortest_path[self.instr_dict[instr_id].destination, temp_node] + \
-                                    np.around(self.instr_dict[instr_id].duration / self.sim_time_step)
-                    path_len += temp_duration
-
-                    reward_seq[s_id] += self.instr_dict[instr_id].r * (self.instr_dict[instr_id].b ** path_len)
-                    temp_node = self.instr_dict[instr_id].destination
-
-            rospy.loginfo('reward_seq: {0}'.format(reward_seq))
-            self.opt_seq = list(node_seq[np.argmax(reward_seq)])  # list of instr_id
+            self.instr_counter = len(self.instr_dict)
+            self.opt_seq, reward_val = get_subset_dp_seq(self.instr_dict, self.shortest_path, self.cur_node,
+                                                         self.sim_time_step, _stats)
+            rospy.loginfo('optimal reward: {0}'.format(reward_val))
+            rospy.loginfo('opt_seq: {0}'.format(self.opt_seq))  # list of instr_id
 
             if self.save_opt_flag:
                 # store theoretical optimal rewards once!
@@ -107,9 +87,7 @@ class TaskMotionPlannerOptSim(TaskMotionPlannerFCFSSim):
                 _store_time = time.time() - _ss_time
 
         # evaluate planning time
-        self.plan_time += time.time() - s_time - _store_time
-        rospy.loginfo('plan time: {0}'.format(self.plan_time))
-        rospy.set_param('/thesis/plan_time', self.plan_time)
+        self.record_plan_time(s_time, _stats['eval_num'], _store_time)
 
         return
 
@@ -125,6 +103,7 @@ class TaskMotionPlannerOptSim(TaskMotionPlannerFCFSSim):
                         if idx == self.opt_seq[0]:
                             do_instr = self.instr_dict[idx]
                             rospy.loginfo('Do instr {0}: {1}'.format(idx, do_instr.function))
+                            self.set_target(do_instr.id)
                             rospy.sleep(do_instr.duration)
 
                             # calculate obtained reward
@@ -132,19 +111,14 @@ class TaskMotionPlannerOptSim(TaskMotionPlannerFCFSSim):
                             self.cal_accu_reward(do_instr)  # calculate the accumulative reward
                             self.done_instr.append(do_instr.id)
 
-                            del self.instr_dict[do_instr.id]
+                            self.complete_instr(do_instr.id)
                             self.opt_seq.pop(0)
-                            self.instr_dest_dict[self.cur_node].remove(do_instr.id)
                             self.instr_counter -= 1
 
                             break
 
-                    # Convert undo_tasks to a list() and publish to /thesis/instruction_buffer
-                    undo_instr_list = list()
-                    for key, value in self.instr_dict.iteritems():
-                        undo_instr_list.append(value)
-
-                    self.task_pub.publish(undo_instr_list)
+                    # The done instructions are published to /thesis/instruction_delta, plan the undo instructions
+                    self.plan_task(self.instr_dict)
 
                 else:
                     rospy.loginfo('No instructions on task {0}'.format(self.cur_node))
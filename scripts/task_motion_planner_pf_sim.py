@@ -3,9 +3,12 @@
 """
 Solve task planning with priority first.
 self.property_dict: reward in this case
+The instruction is selected from the priority index of InstructionStore, updated on every insert and complete.
 """
 
 from task_motion_planner_fcfs_sim import *
+from decision_making.planner_policy import select_pf
+import logging
 
 
 class TaskMotionPlannerPFSim(TaskMotionPlannerFCFSSim):
@@ -20,49 +23,42 @@ class TaskMotionPlannerPFSim(TaskMotionPlannerFCFSSim):
             rospy.logdebug('id: {0}, reward: {1}'.format(key, instr_id))
         return
 
+    def get_property(self, instr):
+        return instr.r
+
+    def select_instr(self):
+        return select_pf(self.instr_dict)
+
     def plan_task(self, in_instructions):
         rospy.loginfo('Planning task ...')
         s_time = time.time()  # for task planning time
 
-        # Convert InstructionArray into dictionary
-        if type(in_instructions) == thesis.msg._InstructionArray.InstructionArray:
+        # New instructions from /thesis/instruction_delta, applied in delta_cb
+        if type(in_instructions) == thesis.msg._InstructionDelta.InstructionDelta:
 
             self.save_csv_flag = True
 
-            for instr in in_instructions.data:
-                self.instr_dest_dict[instr.destination].add(instr.id)
-                self.instr_dict[instr.id] = instr
-
         self.show_instr()
 
         # Fetch the destination from the task
-        if len(self.instr_dict.keys()) > 0:
-            # Create reward dictionary = {'id': 'r'}
-            _property_dict = dict()
-            self.property_key = -1
-
-            for _, instr in self.instr_dict.iteritems():
-                _property_dict[instr.id] = instr.r
-            self.show_property(_property_dict)
-
-            # Get the key(id) with the max value(r) in self.property_dict
-            self.property_key = max(_property_dict.iterkeys(), key=(lambda key: _property_dict[key]))
+        if len(self.instr_dict) > 0:
+            # Create reward dictionary = {'id': 'r'}, only for the debug output
+            if logging.getLogger('rosout').isEnabledFor(logging.DEBUG):
+                self.show_property({instr.id: self.get_property(instr) for instr in self.instr_dict.itervalues()})
+
+            # Get the key(id) with the max value(r) from the index
+            self.property_key = self.select_instr()
+            self.set_target(self.property_key)
             dest_node = self.instr_dict[self.property_key].destination  # destination node
             rospy.loginfo('destination node: {0}'.format(dest_node))
 
             # Calculate the shortest path nodes from current node to the goal node
-            temp_path = nx.shortest_path(self.map_graph, self.cur_node, dest_node, weight='weight')
-            rospy.logdebug('temp_path = {0}'.format(temp_path))
-            if len(temp_path) > 1:
-                self.next_node = temp_path[1]  # next neighbor node for motion planner
-            else:
-                self.next_node = self.cur_node
+            rospy.logdebug('temp_path = {0}'.format(self.route_table.route(self.cur_node, dest_node)))
+            self.next_node = self.next_hop(dest_node)  # next neighbor for motion planner
             rospy.loginfo('plan_task result: {0}'.format(self.next_node))
 
             # evaluate planning time
-            self.plan_time += time.time() - s_time
-            rospy.set_param('/thesis/plan_time', self.plan_time)
-            rospy.loginfo('plan_time: {0}'.format(self.plan_time))
+            self.record_plan_time(s_time)
 
         return
 
@@ -77,6 +73,7 @@ class TaskMotionPlannerPFSim(TaskMotionPlannerFCFSSim):
                     if idx == self.property_key:
                         do_instr = self.instr_dict[idx]
                         rospy.loginfo('Do instr {0}: {1}'.format(idx, do_instr.function))
+                        self.set_target(do_instr.id)
                         rospy.sleep(do_instr.duration)
 
                         # for experiment evaluation# for experiment evaluation
@@ -84,18 +81,13 @@ class TaskMotionPlannerPFSim(TaskMotionPlannerFCFSSim):
                         self.done_instr.append(do_instr.id)
                         # end
 
-                        del self.instr_dict[do_instr.id]
+                        self.complete_instr(do_instr.id)
                         self.property_key = -1
-                        self.instr_dest_dict[self.cur_node].remove(do_instr.id)
 
                         break
 
-                # Convert undo_tasks to a list() and publish to /thesis/instruction_buffer
-                undo_instr_list = list()
-                for key, value in self.instr_dict.iteritems():
-                    undo_instr_list.append(value)
-
-                self.task_pub.publish(undo_instr_list)
+                # The done instructions are published to /thesis/instruction_delta, plan the undo instructions
+                self.plan_task(self.instr_dict)
 
             else:
                 rospy.loginfo('No instructions on task {0}'.format(self.cur_node))
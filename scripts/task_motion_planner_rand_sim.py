@@ -6,6 +6,7 @@ self.property_dict: reward in this case
 """
 
 from task_motion_planner_fcfs_sim import *
+from decision_making.planner_policy import select_rand
 import random
 
 
@@ -25,39 +26,29 @@ class TaskMotionPlannerPF(TaskMotionPlannerFCFSSim):
         rospy.loginfo('Planning task ...')
         s_time = time.time()  # for task planning time
 
-        # Convert InstructionArray into dictionary
-        if type(in_instructions) == thesis.msg._InstructionArray.InstructionArray:
+        # New instructions from /thesis/instruction_delta, applied in delta_cb
+        if type(in_instructions) == thesis.msg._InstructionDelta.InstructionDelta:
 
             self.save_csv_flag = True
 
-            for instr in in_instructions.data:
-                self.instr_dest_dict[instr.destination].add(instr.id)
-                self.instr_dict[instr.id] = instr
-
         self.show_instr()
 
         # Fetch the destination from the task
-        if len(self.instr_dict.keys()) > 0:
-            # Random pick an instruction to complete
-            if self.property_key not in self.instr_dict.keys():
-                self.property_key = random.choice(self.instr_dict.keys())
+        if len(self.instr_dict) > 0:
+            # Random pick an instruction to complete, among the ones whose previous instruction is done
+            self.property_key = select_rand(self.instr_dict, random, self.property_key)
 
+            self.set_target(self.property_key)
             dest_node = self.instr_dict[self.property_key].destination  # destination node
             rospy.loginfo('destination node: {0}'.format(dest_node))
 
             # Calculate the shortest path nodes from current node to the goal node
-            temp_path = nx.shortest_path(self.map_graph, self.cur_node, dest_node, weight='weight')
-            rospy.logdebug('temp_path = {0}'.format(temp_path))
-            if len(temp_path) > 1:
-                self.next_node = temp_path[1]  # next neighbor node for motion planner
-            else:
-                self.next_node = self.cur_node
+            rospy.logdebug('temp_path = {0}'.format(self.route_table.route(self.cur_node, dest_node)))
+            self.next_node = self.next_hop(dest_node)  # next neighbor for motion planner
             rospy.loginfo('plan_task result: {0}'.format(self.next_node))
 
             # evaluate planning time
-            self.plan_time += time.time() - s_time
-            rospy.set_param('/thesis/plan_time', self.plan_time)
-            rospy.loginfo('plan_time: {0}'.format(self.plan_time))
+            self.record_plan_time(s_time)
 
         return
 
@@ -71,6 +62,7 @@ class TaskMotionPlannerPF(TaskMotionPlannerFCFSSim):
                     if idx == self.property_key:
                         do_instr = self.instr_dict[idx]
                         rospy.loginfo('Do instr {0}: {1}'.format(idx, do_instr.function))
+                        self.set_target(do_instr.id)
                         rospy.sleep(do_instr.duration)
 
                         # for experiment evaluation# for experiment evaluation
@@ -78,18 +70,13 @@ class TaskMotionPlannerPF(TaskMotionPlannerFCFSSim):
                         self.done_instr.append(do_instr.id)
                         # end
 
-                        del self.instr_dict[do_instr.id]
+                        self.complete_instr(do_instr.id)
                         self.property_key = -1
-                        self.instr_dest_dict[self.cur_node].remove(do_instr.id)
 
                         break
 
-                # Convert undo_tasks to a list() and publish to /thesis/instruction_buffer
-                undo_instr_list = list()
-                for key, value in self.instr_dict.iteritems():
-                    undo_instr_list.append(value)
-
-                self.task_pub.publish(undo_instr_list)
+                # The done instructions are published to /thesis/instruction_delta, plan the undo instructions
+                self.plan_task(self.instr_dict)
 
             else:
                 rospy.loginfo('No instructions on task {0}'.format(self.cur_node))